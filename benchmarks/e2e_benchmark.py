@@ -0,0 +1,186 @@
+"""
+End-to-end download benchmark on the local mock server
+
+Starts benchmarks/mock_server.py in this process and runs the real downloader
+classes against it, one child process per (platform, scenario), so the
+per-process sessions, rate limiters and controllers start fresh every time.
+Reports tokens/sec, MB/sec, p50/p99 per-token latency (token listed by the
+provider -> media fully served) and request counts for each configuration.
+
+    python benchmarks/e2e_benchmark.py [--platforms Alchemy,NFTScan] [--scenarios baseline,slow_gateway]
+                                       [--scenario-file scenarios.json] [--tokens 1000] [--output results.json]
+
+
+"""
+
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks.mock_server import Mock_Server
+
+
+PLATFORMS = ["Alchemy", "NFTScan", "NFTGo", "OpenSea", "Aggregator"]
+
+# 场景名称 -> 模拟服务器配置，与 mock_server.DEFAULT_CONFIG 合并
+SCENARIOS = {
+    "baseline": {},
+    "slow_gateway": {"hosts": {"gateway": {"latency": 0.5, "bandwidth": 256 * 1024}}},
+    "lossy_origin": {"hosts": {"origin": {"error_rate": 0.1}}},
+    "gateway_429_bursts": {"hosts": {"gateway": {"burst_period": 5, "burst_length": 1}}},
+    "large_responses": {"media_size": 512 * 1024, "metadata_size": 8192},
+}
+
+CONTRACT_ADDRESS = "0x0000000000000000000000000000000000000bec"
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run_child(spec_path: str) -> None:
+    """在子进程中运行真实的下载器，环境变量已经指向模拟服务器的配置"""
+    with open(spec_path, 'r', encoding='UTF-8') as file:
+        spec = json.load(file)
+    import utils.downloading_toolbox as dtb
+    from source.CONST_ENV import CONST_ENV as ENV
+    ENV.ensure_dirs()
+
+    if spec["platform"] == "Aggregator":
+        downloader_class = dtb.NFT_Downloader_for_Whole_Collection_Aggregator
+    else:
+        downloader_class = dtb.PLATFORM_DOWNLOADERS[spec["platform"]]
+    downloader = downloader_class(chain_type = "ethereum",
+                                NFT_name = "mock",
+                                contract_address = CONTRACT_ADDRESS,
+                                candidate_format = ".png",
+                                save_path = spec["save_path"],
+                                process_num = spec["process_num"],
+                                thread_num = spec["thread_num"],
+                                total_supply = spec["token_count"],
+                                start_index = spec["start_index"])
+    begin = time.perf_counter()
+    success = downloader.download_media_and_metadata()
+    elapsed = time.perf_counter() - begin
+    with open(spec["result_path"], 'w', encoding='UTF-8') as file:
+        json.dump({"success": success is not False, "elapsed": elapsed}, file)
+
+
+def run_config(platform: str, scenario: str, config: dict, args) -> dict:
+    """启动一组模拟主机，在子进程中下载整个模拟项目，汇总客户端和服务器两侧的统计"""
+    config = dict(config, token_count = args.tokens)
+    mock_server = Mock_Server(config).start()
+    try:
+        with tempfile.TemporaryDirectory() as work_path:
+            work_path = Path(work_path)
+            env = dict(os.environ, **mock_server.write_client_config(work_path / "client"))
+            spec = {"platform": platform,
+                    "save_path": str(work_path / "DataSet"),
+                    "token_count": args.tokens,
+                    "start_index": mock_server.state.config["start_index"],
+                    "process_num": args.process_num,
+                    "thread_num": args.thread_num,
+                    "result_path": str(work_path / "result.json")}
+            with open(work_path / "spec.json", 'w', encoding='UTF-8') as file:
+                json.dump(spec, file)
+
+            # 下载器逐个文件打印日志，输出写入文件，失败时再显示末尾部分
+            log_path = work_path / "child.log"
+            with open(log_path, 'w', encoding='UTF-8') as log_file:
+                try:
+                    subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(work_path / "spec.json")],
+                                    env = env, stdout = log_file, stderr = subprocess.STDOUT, timeout = args.timeout)
+                except subprocess.TimeoutExpired:
+                    print(f"{platform}/{scenario} timed out after {args.timeout}s")
+
+            result_path = work_path / "result.json"
+            if result_path.exists():
+                with open(result_path, 'r', encoding='UTF-8') as file:
+                    child_result = json.load(file)
+            else:
+                child_result = {"success": False, "elapsed": float(args.timeout)}
+                print(log_path.read_text(encoding='UTF-8')[-2000:])
+
+            media_files = [path for path in work_path.joinpath("DataSet").rglob("*.png")]
+            metadata_files = list(work_path.joinpath("DataSet").rglob("*.json"))
+            media_bytes = sum(path.stat().st_size for path in media_files)
+    finally:
+        mock_server.stop()
+
+    elapsed = max(child_result["elapsed"], 1e-6)
+    latencies = mock_server.state.token_latencies()
+    snapshot = mock_server.state.snapshot()
+    requests_by_role = {}
+    for (role, route, status), count in mock_server.state.requests.items():
+        requests_by_role[role] = requests_by_role.get(role, 0) + count
+    status_counts = {}
+    for (role, route, status), count in mock_server.state.requests.items():
+        status_counts[status] = status_counts.get(status, 0) + count
+    return {"platform": platform,
+            "scenario": scenario,
+            "success": child_result["success"],
+            "elapsed": elapsed,
+            "media": len(media_files),
+            "metadata": len(metadata_files),
+            "tokens_per_second": len(media_files) / elapsed,
+            "mb_per_second": media_bytes / 1e6 / elapsed,
+            "p50_latency": percentile(latencies, 50),
+            "p99_latency": percentile(latencies, 99),
+            "requests": requests_by_role,
+            "status": status_counts,
+            "detail": snapshot["requests"]}
+
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "End-to-end downloader benchmark on the local mock server")
+    parser.add_argument("--platforms", default = ",".join(PLATFORMS), help = "comma separated, Aggregator uses the batch endpoints")
+    parser.add_argument("--scenarios", default = ",".join(SCENARIOS), help = "comma separated scenario names")
+    parser.add_argument("--scenario-file", help = "json object of extra scenarios: {name: mock server config}")
+    parser.add_argument("--tokens", type = int, default = 1000, help = "tokens in the mock collection")
+    parser.add_argument("--process-num", type = int, default = 2)
+    parser.add_argument("--thread-num", type = int, default = 8)
+    parser.add_argument("--timeout", type = int, default = 600, help = "seconds per configuration")
+    parser.add_argument("--output", help = "write the full results as json")
+    parser.add_argument("--child", help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        sys.exit(0)
+
+    scenarios = dict(SCENARIOS)
+    if args.scenario_file:
+        with open(args.scenario_file, 'r', encoding='UTF-8') as file:
+            scenarios.update(json.load(file))
+        if args.scenarios == ",".join(SCENARIOS):
+            args.scenarios = ",".join(scenarios)
+
+    results = []
+    print(f"{'platform':<12}{'scenario':<20}{'media':>7}{'tokens/s':>10}{'MB/s':>8}{'p50 s':>8}{'p99 s':>8}"
+        f"{'api':>7}{'gateway':>9}{'origin':>8}{'429':>6}{'5xx':>6}")
+    for platform in args.platforms.split(","):
+        for scenario in args.scenarios.split(","):
+            result = run_config(platform, scenario, scenarios[scenario], args)
+            results.append(result)
+            requests_by_role, status = result["requests"], result["status"]
+            print(f"{platform:<12}{scenario:<20}{result['media']:>7}{result['tokens_per_second']:>10.1f}{result['mb_per_second']:>8.2f}"
+                f"{result['p50_latency']:>8.2f}{result['p99_latency']:>8.2f}"
+                f"{requests_by_role.get('api', 0):>7}{requests_by_role.get('gateway', 0):>9}{requests_by_role.get('origin', 0):>8}"
+                f"{status.get(429, 0):>6}{sum(count for code, count in status.items() if code >= 500):>6}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as file:
+            json.dump(results, file, indent=4)
@@ -0,0 +1,629 @@
+"""
+Local mock of the NFT data providers, IPFS gateways and origin hosts
+
+Emulates the pagination and batch endpoints of Alchemy, NFTScan, NFTGo and
+OpenSea, a JSON-RPC node (eth_call for tokenURI/uri and Multicall3 aggregate3,
+eth_blockNumber, eth_getLogs), an IPFS gateway and a plain origin host. Every host runs on its own
+port, so the per-host concurrency controller sees them as different hosts.
+Latency, bandwidth, error rates, 429 bursts and response sizes are set per host
+in the scenario config (see DEFAULT_CONFIG).
+
+    python benchmarks/mock_server.py [--config scenario.json] [--client-dir mock_client]
+
+The client dir receives api_keys.json and platform_info.json pointing at the
+mock. Export the printed environment variables to run any downloader against it.
+
+
+"""
+
+
+import argparse
+import base64
+import copy
+import json
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+
+# 一个合法的 CIDv0，IPFS 资源链接为 {网关}/ipfs/{CID}/{tokenId}.png
+MOCK_CID = "QmeSjSinHpPnmXmspMjwiXyN6zS4E9zccariGR3jxcaWtq"
+
+# 模拟节点支持的函数选择器
+TOKEN_URI_SELECTOR = "0xc87b56dd"     # tokenURI(uint256)
+URI_SELECTOR = "0x0e89341c"           # uri(uint256)
+AGGREGATE3_SELECTOR = "0x82ad56cb"    # aggregate3((address,bool,bytes)[])
+MULTICALL3_ADDRESS = "0xca11bde05977b3631167028862be2a173976ca11"
+
+# 每个主机的默认行为
+DEFAULT_HOST = {
+    "latency": 0.0,        # 每个请求的平均延迟（秒），实际延迟在 0.5 到 1.5 倍之间随机
+    "bandwidth": 0,        # 每个连接的带宽（字节/秒），0 表示不限速
+    "error_rate": 0.0,     # 返回 503 的比例
+    "burst_period": 0,     # 每隔 burst_period 秒出现一次 429 突发，0 表示没有突发
+    "burst_length": 0,     # 每次 429 突发持续的秒数
+}
+
+DEFAULT_CONFIG = {
+    "token_count": 1000,
+    "start_index": 0,
+    "max_page_size": 200,      # 分页接口每页最多返回的token数量
+    "media_size": 32768,       # 每张图片的字节数
+    "metadata_size": 512,      # 每个 metadata 中填充的描述长度，用来调节分页响应的大小
+    "ipfs_ratio": 0.5,         # 使用 IPFS 链接的token比例，其余使用源站链接
+    "block_number": 1000,      # eth_blockNumber 返回的区块高度
+    "logs": [],                # eth_getLogs 的全部日志，按 blockNumber 和 topics 过滤后返回
+    "rpc_failing_ids": [],     # 读取这些token的 tokenURI 时节点返回限流错误，而不是 revert
+    "hosts": {
+        "api": dict(DEFAULT_HOST, latency=0.05),
+        "gateway": dict(DEFAULT_HOST, latency=0.05),
+        "origin": dict(DEFAULT_HOST, latency=0.02),
+    },
+}
+
+
+def merge_config(config = None) -> dict:
+    """把场景配置合并到默认配置上，hosts 按主机逐项合并"""
+    merged = copy.deepcopy(DEFAULT_CONFIG)
+    for key, value in (config or {}).items():
+        if key == "hosts":
+            for role, host in value.items():
+                merged["hosts"][role] = dict(merged["hosts"].get(role, DEFAULT_HOST), **host)
+        else:
+            merged[key] = value
+    return merged
+
+
+def make_png(size: int) -> bytes:
+    """
+    生成一张结构完整的灰度 PNG，像素为随机数据，用 tEXt 数据块补齐到 size 字节，
+    下载器在下载后检查文件结构，只有文件头的随机数据会被当成损坏的文件
+    """
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+    width = 256
+    # 不压缩的 zlib 数据流每 65535 字节有 5 字节的块头，再留出 PNG 数据块头部和填充数据块的空间
+    rows = max(1, (size - 128 - size // 65535 * 5) // (width + 1))
+    pixels = b"".join(b"\x00" + os.urandom(width) for _ in range(rows))
+    png = (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, rows, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(pixels, 0)))
+    padding = size - len(png) - 24
+    if padding >= len(b"Comment\x00"):
+        png += chunk(b"tEXt", b"Comment\x00" + b"x" * (padding - len(b"Comment\x00")))
+    return png + chunk(b"IEND", b"")
+
+
+def abi_word(value: int) -> bytes:
+    return int(value).to_bytes(32, "big")
+
+
+def abi_bytes(data: bytes) -> bytes:
+    """ABI 编码的 bytes / string 内容：长度加上补齐到 32 字节的数据，不含偏移量"""
+    return abi_word(len(data)) + data + b"\x00" * ((32 - len(data) % 32) % 32)
+
+
+def abi_string(text: str) -> bytes:
+    """eth_call 返回一个 string 时的返回数据"""
+    return abi_word(32) + abi_bytes(text.encode("utf-8"))
+
+
+def decode_aggregate3_calls(data: bytes) -> list:
+    """解析 aggregate3 的参数（不含函数选择器），返回 [(target, callData), ...]"""
+    word = lambda position: int.from_bytes(data[position:position + 32], "big")
+    array_start = word(0)
+    base = array_start + 32
+    calls = []
+    for i in range(word(array_start)):
+        element_start = base + word(base + 32 * i)
+        target = "0x" + data[element_start + 12:element_start + 32].hex()
+        bytes_start = element_start + word(element_start + 64)
+        calls.append((target, data[bytes_start + 32:bytes_start + 32 + word(bytes_start)]))
+    return calls
+
+
+def encode_aggregate3_results(results: list) -> bytes:
+    """编码 aggregate3 的返回值 (bool success, bytes returnData)[]"""
+    elements = [abi_word(1 if success else 0) + abi_word(64) + abi_bytes(return_data) for success, return_data in results]
+    offsets, position = [], 32 * len(elements)
+    for element in elements:
+        offsets.append(abi_word(position))
+        position += len(element)
+    return abi_word(32) + abi_word(len(elements)) + b"".join(offsets) + b"".join(elements)
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.b64encode(f"offset:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor) -> int:
+    if not cursor:
+        return 0
+    return int(base64.b64decode(cursor).decode().split(":", 1)[1])
+
+
+class Mock_State(object):
+    """
+    所有主机共享的模拟数据和统计信息
+    """
+
+    def __init__(self, config = None):
+        self.config = merge_config(config)
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.base_urls = {}
+        self.requests = Counter()          # (主机, 接口, 状态码) -> 请求数
+        self.bytes_sent = Counter()        # 主机 -> 发送的字节数
+        self.listed_time = {}              # tokenId -> 第一次出现在分页或批量响应中的时间
+        self.media_time = {}               # tokenId -> 最近一次完整发送图片的时间
+        self.media_body = make_png(self.config["media_size"])
+        self.description = "x" * self.config["metadata_size"]
+
+    @property
+    def token_ids(self) -> range:
+        start = self.config["start_index"]
+        return range(start, start + self.config["token_count"])
+
+    def is_ipfs(self, token_id: int) -> bool:
+        # 按tokenId确定，所有平台对同一个token返回相同的链接
+        return (token_id * 2654435761 % 1000) < self.config["ipfs_ratio"] * 1000
+
+    def media_url(self, token_id: int) -> str:
+        if self.is_ipfs(token_id):
+            return f"{self.base_urls['gateway']}/ipfs/{MOCK_CID}/{token_id}.png"
+        return f"{self.base_urls['origin']}/origin/{token_id}.png"
+
+    def metadata_url(self, token_id: int) -> str:
+        return f"{self.base_urls['origin']}/metadata/{token_id}.json"
+
+    def metadata(self, token_id: int) -> dict:
+        return {"name": f"Mock #{token_id}",
+                "description": self.description,
+                "image": self.media_url(token_id),
+                "attributes": [{"trait_type": "Index", "value": str(token_id % 10)}]}
+
+    def mark_listed(self, token_ids) -> None:
+        now = time.monotonic()
+        with self.lock:
+            for token_id in token_ids:
+                self.listed_time.setdefault(token_id, now)
+
+    def mark_media(self, token_id: int) -> None:
+        with self.lock:
+            self.media_time[token_id] = time.monotonic()
+
+    def record(self, role: str, route: str, status: int, nbytes: int) -> None:
+        with self.lock:
+            self.requests[(role, route, status)] += 1
+            self.bytes_sent[role] += nbytes
+
+    def in_burst(self, host: dict) -> bool:
+        if not host["burst_period"]:
+            return False
+        return (time.monotonic() - self.start_time) % host["burst_period"] < host["burst_length"]
+
+    def token_latencies(self) -> list:
+        """每个token从出现在列表中到图片发送完成的时间（秒）"""
+        with self.lock:
+            return [self.media_time[token_id] - listed for token_id, listed in self.listed_time.items()
+                    if token_id in self.media_time]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"requests": {f"{role} {route} {status}": count for (role, route, status), count in sorted(self.requests.items())},
+                    "bytes_sent": dict(self.bytes_sent),
+                    "listed": len(self.listed_time),
+                    "media_done": len(self.media_time)}
+
+    # ---------------- JSON-RPC 节点 ----------------
+
+    def rpc_call(self, item: dict) -> dict:
+        """处理 batch 中的一个 JSON-RPC 调用"""
+        response = {"jsonrpc": "2.0", "id": item.get("id")}
+        method, params = item.get("method"), item.get("params") or []
+        if method == "eth_blockNumber":
+            response["result"] = hex(self.config["block_number"])
+        elif method == "eth_getLogs":
+            response["result"] = self.get_logs(params[0])
+        elif method == "eth_call":
+            to, data = params[0]["to"].lower(), bytes.fromhex(params[0]["data"][2:])
+            if to == MULTICALL3_ADDRESS and data[:4].hex() == AGGREGATE3_SELECTOR[2:]:
+                calls = decode_aggregate3_calls(data[4:])
+                outcomes = [self.token_call(call_data) for _, call_data in calls]
+                # 限流是整个请求的错误，不是单个调用的 revert
+                error = next((outcome for outcome in outcomes if isinstance(outcome, dict)), None)
+                if error is not None:
+                    response["error"] = error
+                else:
+                    response["result"] = "0x" + encode_aggregate3_results(outcomes).hex()
+            else:
+                outcome = self.token_call(data)
+                if isinstance(outcome, dict):
+                    response["error"] = outcome
+                elif outcome[0]:
+                    response["result"] = "0x" + outcome[1].hex()
+                else:
+                    response["error"] = {"code": 3, "message": "execution reverted", "data": "0x"}
+        else:
+            response["error"] = {"code": -32601, "message": f"the method {method} does not exist"}
+        return response
+
+    def token_call(self, data: bytes):
+        """
+        执行一个 tokenURI / uri 调用
+
+        Returns:
+            tuple | dict: (是否成功, 返回数据)，token不存在时 revert；节点错误时返回 JSON-RPC 的 error
+        """
+        if data[:4].hex() not in (TOKEN_URI_SELECTOR[2:], URI_SELECTOR[2:]) or len(data) != 36:
+            return False, b""
+        token_id = int.from_bytes(data[4:36], "big")
+        if token_id in self.config["rpc_failing_ids"]:
+            return {"code": -32005, "message": "rate limit exceeded"}
+        if token_id not in self.token_ids:
+            return False, b""
+        self.mark_listed([token_id])
+        return True, abi_string(self.metadata_url(token_id))
+
+    def get_logs(self, log_filter: dict) -> list:
+        """按区块范围和 topics 过滤日志，topics 的每一位可以是单个值、列表或者 None"""
+        from_block, to_block = int(log_filter["fromBlock"], 16), int(log_filter["toBlock"], 16)
+        logs = []
+        for log in self.config["logs"]:
+            if not from_block <= int(log["blockNumber"], 16) <= to_block:
+                continue
+            matched = True
+            for position, expected in enumerate(log_filter.get("topics") or []):
+                if expected is None:
+                    continue
+                expected = expected if isinstance(expected, list) else [expected]
+                if position >= len(log["topics"]) or log["topics"][position] not in expected:
+                    matched = False
+                    break
+            if matched:
+                logs.append(log)
+        return logs
+
+    # ---------------- 各平台的数据格式 ----------------
+
+    def alchemy_item(self, token_id: int) -> dict:
+        return {"tokenId": str(token_id),
+                "tokenUri": self.metadata_url(token_id),
+                "image": {"cachedUrl": self.media_url(token_id), "originalUrl": self.media_url(token_id), "contentType": "image/png"},
+                "raw": {"metadata": self.metadata(token_id)}}
+
+    def nftscan_item(self, token_id: int) -> dict:
+        return {"token_id": str(token_id),
+                "token_uri": self.metadata_url(token_id),
+                "content_uri": self.media_url(token_id),
+                "content_type": "image/png",
+                "metadata_json": json.dumps(self.metadata(token_id))}
+
+    def nftgo_item(self, token_id: int) -> dict:
+        # NFTGo 只返回 traits，metadata 从 metadata_url 下载
+        return {"token_id": str(token_id),
+                "image": self.media_url(token_id),
+                "metadata_url": self.metadata_url(token_id),
+                "traits": None}
+
+    def opensea_item(self, token_id: int) -> dict:
+        return {"identifier": str(token_id),
+                "image_url": self.media_url(token_id),
+                "display_image_url": None,
+                "metadata_url": self.metadata_url(token_id)}
+
+    def page(self, offset: int, limit: int) -> tuple:
+        """返回从第 offset 个token开始的一页tokenId和下一页的偏移，没有下一页时为 None"""
+        limit = max(1, min(limit, self.config["max_page_size"]))
+        token_ids = list(self.token_ids[offset:offset + limit])
+        next_offset = offset + limit if offset + limit < len(self.token_ids) else None
+        return token_ids, next_offset
+
+
+class Mock_Handler(BaseHTTPRequestHandler):
+    """
+    所有主机共用的请求处理类，server.role 决定可以访问的接口
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> Mock_State:
+        return self.server.state
+
+    @property
+    def host(self) -> dict:
+        return self.state.config["hosts"][self.server.role]
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, route: str, status: int, body: bytes, content_type = "application/json") -> bool:
+        """按主机带宽分块发送响应体，返回是否完整发送"""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        bandwidth = self.host["bandwidth"]
+        chunk_size = 16384 if bandwidth <= 0 else max(1024, min(16384, int(bandwidth / 20)))
+        sent = 0
+        try:
+            for offset in range(0, len(body), chunk_size):
+                chunk = body[offset:offset + chunk_size]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if bandwidth > 0:
+                    time.sleep(len(chunk) / bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        finally:
+            self.state.record(self.server.role, route, status, sent)
+        return True
+
+    def send_json(self, route: str, body) -> bool:
+        return self.send_body(route, 200, json.dumps(body).encode())
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def inject_fault(self, route: str) -> bool:
+        """模拟延迟、429 突发和随机错误，已经返回错误响应时返回 True"""
+        latency = self.host["latency"]
+        if latency > 0:
+            time.sleep(latency * random.uniform(0.5, 1.5))
+        if self.state.in_burst(self.host):
+            self.send_body(route, 429, b'{"message": "Too Many Requests"}')
+            return True
+        if random.random() < self.host["error_rate"]:
+            self.send_body(route, 503, b'{"message": "Service Unavailable"}')
+            return True
+        return False
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method: str):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        route = self.route_name(method, parts)
+        if route is None:
+            self.send_body("unknown", 404, b'{"message": "Not Found"}')
+            return
+        if self.inject_fault(route):
+            return
+        try:
+            getattr(self, f"handle_{route}")(parts, query)
+        except (ValueError, KeyError, IndexError) as e:
+            self.send_body(route, 400, json.dumps({"message": str(e)}).encode())
+
+    def route_name(self, method: str, parts: list):
+        role = self.server.role
+        if role == "gateway":
+            return "ipfs" if method == "GET" and parts[:1] == ["ipfs"] else None
+        if role == "origin":
+            if method == "GET" and parts[:1] == ["origin"]:
+                return "origin"
+            if method == "GET" and parts[:1] == ["metadata"]:
+                return "metadata"
+            return None
+        # api 主机：/{平台}/... 与 platform_info.json 中的接口模板对应
+        platform = parts[0] if parts else None
+        last = parts[-1] if parts else None
+        if platform == "alchemy":
+            return {"getNFTsForContract": "alchemy_page", "getNFTMetadataBatch": "alchemy_batch"}.get(last)
+        if platform == "nftscan":
+            return "nftscan_batch" if method == "POST" else "nftscan_page"
+        if platform == "nftgo":
+            return "nftgo_batch" if method == "POST" else "nftgo_page"
+        if platform == "opensea":
+            return "opensea_page" if last == "nfts" else "opensea_batch"
+        if platform == "rpc":
+            return "rpc" if method == "POST" else None
+        return None
+
+    # ---------------- 媒体和 metadata ----------------
+
+    def handle_media(self, route: str, token_id: int):
+        if token_id not in self.state.token_ids:
+            self.send_body(route, 404, b'{"message": "Not Found"}')
+            return
+        if self.send_body(route, 200, self.state.media_body, content_type = "image/png"):
+            self.state.mark_media(token_id)
+
+    def handle_ipfs(self, parts, query):
+        self.handle_media("ipfs", int(parts[-1].split(".")[0]))
+
+    def handle_origin(self, parts, query):
+        self.handle_media("origin", int(parts[-1].split(".")[0]))
+
+    def handle_metadata(self, parts, query):
+        self.send_json("metadata", self.state.metadata(int(parts[-1].split(".")[0])))
+
+    # ---------------- 平台接口 ----------------
+
+    def handle_rpc(self, parts, query):
+        body = self.read_json()
+        if isinstance(body, list):
+            self.send_json("rpc", [self.state.rpc_call(item) for item in body])
+        else:
+            self.send_json("rpc", self.state.rpc_call(body))
+
+    def handle_alchemy_page(self, parts, query):
+        start = int(query.get("startToken", str(self.state.config["start_index"])), 0)
+        token_ids, next_offset = self.state.page(max(0, start - self.state.config["start_index"]), int(query.get("limit", 100)))
+        self.state.mark_listed(token_ids)
+        page_key = hex(self.state.token_ids[next_offset]) if next_offset is not None else None
+        self.send_json("alchemy_page", {"nfts": [self.state.alchemy_item(token_id) for token_id in token_ids], "pageKey": page_key})
+
+    def handle_alchemy_batch(self, parts, query):
+        token_ids = [int(item["tokenId"]) for item in self.read_json()["tokens"]]
+        token_ids = [token_id for token_id in token_ids if token_id in self.state.token_ids]
+        self.state.mark_listed(token_ids)
+        self.send_json("alchemy_batch", {"nfts": [self.state.alchemy_item(token_id) for token_id in token_ids]})
+
+    def handle_nftscan_page(self, parts, query):
+        token_ids, next_offset = self.state.page(decode_cursor(query.get("cursor")), int(query.get("limit", 100)))
+        self.state.mark_listed(token_ids)
+        next_cursor = encode_cursor(next_offset) if next_offset is not None else None
+        self.send_json("nftscan_page", {"code": 200, "data": {"content": [self.state.nftscan_item(token_id) for token_id in token_ids],
+                                                             "next": next_cursor}})
+
+    def handle_nftscan_batch(self, parts, query):
+        token_ids = [int(item["token_id"]) for item in self.read_json()["contract_address_with_token_id_list"]]
+        token_ids = [token_id for token_id in token_ids if token_id in self.state.token_ids]
+        self.state.mark_listed(token_ids)
+        self.send_json("nftscan_batch", {"code": 200, "data": [self.state.nftscan_item(token_id) for token_id in token_ids]})
+
+    def handle_nftgo_page(self, parts, query):
+        token_ids, next_offset = self.state.page(decode_cursor(query.get("cursor")), int(query.get("limit", 50)))
+        self.state.mark_listed(token_ids)
+        next_cursor = encode_cursor(next_offset) if next_offset is not None else None
+        self.send_json("nftgo_page", {"nfts": [self.state.nftgo_item(token_id) for token_id in token_ids], "next_cursor": next_cursor})
+
+    def handle_nftgo_batch(self, parts, query):
+        token_ids = [int(item["token_id"]) for item in self.read_json()["params"]]
+        token_ids = [token_id for token_id in token_ids if token_id in self.state.token_ids]
+        self.state.mark_listed(token_ids)
+        self.send_json("nftgo_batch", [self.state.nftgo_item(token_id) for token_id in token_ids])
+
+    def handle_opensea_page(self, parts, query):
+        token_ids, next_offset = self.state.page(decode_cursor(query.get("next")), int(query.get("limit", 200)))
+        self.state.mark_listed(token_ids)
+        next_cursor = encode_cursor(next_offset) if next_offset is not None else None
+        self.send_json("opensea_page", {"nfts": [self.state.opensea_item(token_id) for token_id in token_ids], "next": next_cursor})
+
+    def handle_opensea_batch(self, parts, query):
+        token_id = int(parts[-1])
+        if token_id not in self.state.token_ids:
+            self.send_body("opensea_batch", 404, b'{"message": "Not Found"}')
+            return
+        self.state.mark_listed([token_id])
+        self.send_json("opensea_batch", {"nft": self.state.opensea_item(token_id)})
+
+
+class Mock_Server(object):
+    """
+    一组本地模拟主机：api（所有平台接口）、gateway（IPFS 网关）、origin（图片源站和 metadata）
+    """
+
+    ROLES = ("api", "gateway", "origin")
+
+    def __init__(self, config = None, host = "127.0.0.1"):
+        self.state = Mock_State(config)
+        self.servers = {}
+        self.threads = []
+        for role in self.ROLES:
+            server = ThreadingHTTPServer((host, 0), Mock_Handler)
+            server.daemon_threads = True
+            server.request_queue_size = 256
+            server.role = role
+            server.state = self.state
+            self.servers[role] = server
+            self.state.base_urls[role] = f"http://{host}:{server.server_address[1]}"
+
+    def start(self) -> "Mock_Server":
+        for server in self.servers.values():
+            thread = threading.Thread(target = server.serve_forever, daemon = True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def platform_info(self, platform_info_path = None) -> dict:
+        """
+        生成指向模拟服务器的 platform_info.json，保留真实配置中的链、分页大小和请求速率
+
+        Args:
+            platform_info_path (Path): 真实的 platform_info.json
+        """
+        platform_info_path = Path(platform_info_path or Path(__file__).resolve().parent.parent / "data" / "info" / "platform_info.json")
+        with open(platform_info_path, 'r', encoding='UTF-8') as file:
+            platform_info = json.load(file)
+        api = self.state.base_urls["api"]
+        endpoints = {
+            "Alchemy": {"page": f"{api}/alchemy/{{api}}/getNFTsForContract",
+                        "batch": f"{api}/alchemy/{{api}}/getNFTMetadataBatch"},
+            "NFTScan": {"page": f"{api}/nftscan/api/v2/assets/{{contract_address}}",
+                        "batch": f"{api}/nftscan/api/v2/assets/batch"},
+            "NFTGo": {"page": f"{api}/nftgo/{{chain_type}}/v1/collection/{{contract_address}}/nfts",
+                      "batch": f"{api}/nftgo/{{chain_type}}/v1/nft/infos"},
+            "OpenSea": {"page": f"{api}/opensea/api/v2/chain/{{chain_type}}/contract/{{contract_address}}/nfts",
+                        "batch": f"{api}/opensea/api/v2/chain/{{chain_type}}/contract/{{contract_address}}/nfts/{{token_id}}"},
+        }
+        for platform, templates in endpoints.items():
+            if platform in platform_info:
+                platform_info[platform]["endpoints"] = {"default": templates}
+        return platform_info
+
+    def api_keys(self) -> dict:
+        return {"Alchemy": ["mock"],
+                "NFTScan": "mock",
+                "NFTGo": "mock",
+                "OpenSea": "mock",
+                "IPFS_gateways": [f"{self.state.base_urls['gateway']}/ipfs/"],
+                "RPC": {"ethereum": self.rpc_url}}
+
+    @property
+    def rpc_url(self) -> str:
+        return f"{self.state.base_urls['api']}/rpc"
+
+    def write_client_config(self, directory, platform_info_path = None) -> dict:
+        """
+        写入指向模拟服务器的 api_keys.json 和 platform_info.json
+
+        Returns:
+            dict: 下载器进程需要设置的环境变量
+        """
+        directory = Path(directory)
+        directory.mkdir(parents = True, exist_ok = True)
+        api_keys_path = directory / "api_keys.json"
+        platform_info_path_mock = directory / "platform_info.json"
+        with open(api_keys_path, 'w', encoding='UTF-8') as file:
+            json.dump(self.api_keys(), file, indent=4)
+        with open(platform_info_path_mock, 'w', encoding='UTF-8') as file:
+            json.dump(self.platform_info(platform_info_path), file, indent=4)
+        return {"NFT_DL_API_KEYS_PATH": str(api_keys_path), "NFT_DL_PLATFORM_INFO_PATH": str(platform_info_path_mock)}
+
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Local mock of NFT providers, IPFS gateways and origin hosts")
+    parser.add_argument("--config", help = "scenario json merged over DEFAULT_CONFIG")
+    parser.add_argument("--client-dir", default = "mock_client", help = "where to write api_keys.json and platform_info.json")
+    args = parser.parse_args()
+
+    config = None
+    if args.config:
+        with open(args.config, 'r', encoding='UTF-8') as file:
+            config = json.load(file)
+    mock_server = Mock_Server(config).start()
+    env = mock_server.write_client_config(args.client_dir)
+    for role, base_url in mock_server.state.base_urls.items():
+        print(f"{role:<8}{base_url}")
+    for key, value in env.items():
+        print(f"export {key}={os.path.abspath(value)}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(mock_server.state.snapshot()))
+    except KeyboardInterrupt:
+        mock_server.stop()
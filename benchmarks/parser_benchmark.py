@@ -0,0 +1,152 @@
+"""
+Parser microbenchmarks
+
+Replays the recorded provider pages in benchmarks/fixtures through each
+downloader's parse_response, and times parse_file_format / is_ipfs_cid.
+Reports tokens (or calls) per second and peak memory, so parser regressions
+show up before they reach production.
+
+    python benchmarks/parser_benchmark.py [--pages 200] [--page-size 100]
+
+
+"""
+
+
+import argparse
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.downloading_toolbox as dtb
+
+
+FIXTURE_PATH = Path(__file__).resolve().parent / "fixtures"
+
+# 平台 -> (下载器类, 录制的分页响应, NFT列表的位置, tokenId 字段, 游标的位置)
+PROVIDERS = {
+    "Alchemy": (dtb.NFT_Downloader_for_Whole_Collection_Alchemy, "alchemy_page.json", ["nfts"], "tokenId", ["pageKey"]),
+    "NFTScan": (dtb.NFT_Downloader_for_Whole_Collection_NFTScan, "nftscan_page.json", ["data", "content"], "token_id", ["data", "next"]),
+    "NFTGo": (dtb.NFT_Downloader_for_Whole_Collection_NFTGo, "nftgo_page.json", ["nfts"], "token_id", ["next_cursor"]),
+    "OpenSea": (dtb.NFT_Downloader_for_Whole_Collection_OpenSea, "opensea_page.json", ["nfts"], "identifier", ["next"]),
+}
+
+
+class Fixture_Response(object):
+    """模拟 requests 的响应，每次调用 json() 都会重新解码，与真实响应一致"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.status_code = 200
+        self.url = "fixture"
+        self.decode_count = 0
+
+    def json(self):
+        self.decode_count += 1
+        return json.loads(self.text)
+
+
+def dig(body, path):
+    for key in path:
+        body = body[key]
+    return body
+
+
+def build_pages(fixture: str, list_path: list, id_field: str, page_num: int, page_size: int) -> list:
+    """把录制的响应中的NFT复制到 page_size 个，并分配连续的tokenId，返回每一页的响应文本"""
+    with open(FIXTURE_PATH / fixture, 'r', encoding='UTF-8') as file:
+        template = json.load(file)
+    samples = dig(template, list_path)
+    pages = []
+    for page_index in range(page_num):
+        body = copy.deepcopy(template)
+        NFT_list = dig(body, list_path)
+        NFT_list.clear()
+        for i in range(page_size):
+            NFT_item = copy.deepcopy(samples[i % len(samples)])
+            NFT_item[id_field] = str(page_index * page_size + i)
+            NFT_list.append(NFT_item)
+        pages.append(json.dumps(body))
+    return pages
+
+
+def benchmark_provider(platform: str, page_num: int, page_size: int, save_path) -> dict:
+    downloader_class, fixture, list_path, id_field, cursor_path = PROVIDERS[platform]
+    downloader = downloader_class(chain_type = "ethereum",
+                                NFT_name = "benchmark",
+                                contract_address = "0xbc4ca0eda7647a8ab7c2061c2e118a18a936f13d",
+                                candidate_format = ".png",
+                                save_path = save_path)
+    pages = build_pages(fixture, list_path, id_field, page_num, page_size)
+
+    def parse_pages():
+        # 与分页循环相同：解析一页，再读取游标
+        records = []
+        decode_count = 0
+        for text in pages:
+            raw_response = Fixture_Response(text)
+            response = dtb.Parsed_Response(raw_response)
+            records.extend(downloader.parse_response(response))
+            dig(response.json(), cursor_path)
+            decode_count += raw_response.decode_count
+        return records, decode_count
+
+    # tracemalloc 会显著拖慢速度，计时和内存分两次测量
+    begin = time.perf_counter()
+    records, decode_count = parse_pages()
+    elapsed = time.perf_counter() - begin
+    del records
+    tracemalloc.start()
+    records, _ = parse_pages()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"tokens": len(records),
+            "tokens_per_second": len(records) / elapsed,
+            "peak_mb": peak / 1e6,
+            "decodes_per_page": decode_count / page_num}
+
+
+def benchmark_function(func, args_list: list, repeat: int) -> dict:
+    func_calls = len(args_list) * repeat
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        for args in args_list:
+            func(*args)
+    elapsed = time.perf_counter() - begin
+    tracemalloc.start()
+    for args in args_list:
+        func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"calls": func_calls, "calls_per_second": func_calls / elapsed, "peak_mb": peak / 1e6}
+
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Parser microbenchmarks on recorded provider fixtures")
+    parser.add_argument("--pages", type = int, default = 200, help = "pages per provider")
+    parser.add_argument("--page-size", type = int, default = 100, help = "tokens per page")
+    parser.add_argument("--repeat", type = int, default = 20000, help = "repetitions of the helper benchmarks")
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<20}{'items':>10}{'items/s':>14}{'peak MB':>10}{'decodes/page':>14}")
+    with tempfile.TemporaryDirectory() as save_path:
+        for platform in PROVIDERS:
+            result = benchmark_provider(platform, args.pages, args.page_size, save_path)
+            print(f"{'parse_' + platform:<20}{result['tokens']:>10}{result['tokens_per_second']:>14.0f}"
+                f"{result['peak_mb']:>10.2f}{result['decodes_per_page']:>14.1f}")
+
+    with open(FIXTURE_PATH / "uris.json", 'r', encoding='UTF-8') as file:
+        fixture = json.load(file)
+    for name, func, args_list in [("parse_file_format", dtb.parse_file_format, [(content_type, ".png") for content_type in fixture["content_types"]]),
+                                ("is_ipfs_cid", dtb.is_ipfs_cid, [(uri,) for uri in fixture["uris"]])]:
+        result = benchmark_function(func, args_list, args.repeat)
+        print(f"{name:<20}{result['calls']:>10}{result['calls_per_second']:>14.0f}{result['peak_mb']:>10.2f}{'-':>14}")
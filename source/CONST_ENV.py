@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # 检查路径是否存在，不存在就创建一个文件夹
@@ -8,15 +9,31 @@ class CONST_ENV():
     BASE_PATH = Path(__file__).resolve().parent.parent
     INFO_PATH = BASE_PATH / "data" / "info"
     DATASET_PATH = BASE_PATH / "DataSet"
-    API_KEYS_PATH = BASE_PATH / "data" / "api_keys.json"
+    # API密钥和平台配置可以通过环境变量替换，例如在本地模拟服务器上运行基准测试
+    API_KEYS_PATH = Path(os.environ.get("NFT_DL_API_KEYS_PATH", BASE_PATH / "data" / "api_keys.json"))
+    PLATFORM_INFO_PATH = Path(os.environ.get("NFT_DL_PLATFORM_INFO_PATH", INFO_PATH / "platform_info.json"))
     LOGGING_PATH = BASE_PATH / "data" / "log"
     RE_DOWNLOAD_FILES_INFO_PATH = INFO_PATH / "re_download_files_info"
+    SYNC_STATE_PATH = INFO_PATH / "sync_state"
+    # 每个项目探测出的完整tokenId布局，项目信息文件中只保存摘要
+    TOKEN_SPACE_PATH = INFO_PATH / "token_space"
+    JOB_STATE_PATH = INFO_PATH / "jobs"
+    BANDWIDTH_CONFIG_PATH = INFO_PATH / "bandwidth.json"
     CHECKING_LOGGING_PATH = LOGGING_PATH / "checking_log"
     DOWNLOAD_LOGGING_PATH = LOGGING_PATH / "download_log"
+    CONCURRENCY_LOGGING_PATH = LOGGING_PATH / "concurrency"
+    BANDWIDTH_LOGGING_PATH = LOGGING_PATH / "bandwidth"
+    METRICS_LOGGING_PATH = LOGGING_PATH / "metrics"
+    TRACE_LOGGING_PATH = LOGGING_PATH / "trace"
+    PROFILE_LOGGING_PATH = LOGGING_PATH / "profile"
+    # 平台接口响应的缓存，可以通过环境变量放到更大的磁盘上
+    CACHE_PATH = Path(os.environ.get("NFT_DL_CACHE_PATH", BASE_PATH / "data" / "cache"))
 
-    check_dir(INFO_PATH)
-    check_dir(DATASET_PATH)
-    check_dir(LOGGING_PATH)
-    check_dir(CHECKING_LOGGING_PATH)
-    check_dir(DOWNLOAD_LOGGING_PATH)
-    check_dir(RE_DOWNLOAD_FILES_INFO_PATH)
+    @classmethod
+    def ensure_dirs(cls):
+        """创建运行时需要的文件夹，由入口脚本在启动时调用一次，导入模块时不再有创建文件夹的副作用"""
+        for dir_path in (cls.INFO_PATH, cls.DATASET_PATH, cls.LOGGING_PATH, cls.CHECKING_LOGGING_PATH,
+                        cls.DOWNLOAD_LOGGING_PATH, cls.CONCURRENCY_LOGGING_PATH, cls.BANDWIDTH_LOGGING_PATH,
+                        cls.METRICS_LOGGING_PATH, cls.TRACE_LOGGING_PATH, cls.PROFILE_LOGGING_PATH,
+                        cls.RE_DOWNLOAD_FILES_INFO_PATH, cls.SYNC_STATE_PATH, cls.JOB_STATE_PATH, cls.TOKEN_SPACE_PATH):
+            check_dir(dir_path)
@@ -0,0 +1,50 @@
+"""
+Download many NFT collections in one run, sharing connections,
+rate limiters and worker slots between all of them
+
+
+"""
+
+
+import os
+
+
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.batch_toolbox as btb
+import utils.metrics_toolbox as mtb
+import utils.profile_toolbox as ptb
+import utils.trace_toolbox as ttb
+from CONST_ENV import CONST_ENV as ENV
+
+
+
+
+if __name__ == "__main__":
+
+    ENV.ensure_dirs()
+
+    # 加上 --profile 时分析每个进程的耗时，结束后输出按子系统分组的热点函数
+    args = [arg for arg in sys.argv[1:] if arg != "--profile"]
+    if "--profile" in sys.argv:
+        ptb.enable_profiling(sampling = True)
+
+    # 任务文件每行一个项目：chain_type, contract_address, platform（可省略）
+    job_file = args[0] if args else ENV.INFO_PATH / "batch_jobs.txt"
+    job_list = btb.load_job_list(job_file)
+
+    # 设置环境变量 NFT_DL_METRICS_PORT 时启动 Prometheus 指标接口，所有项目和进程汇总在一起
+    if port := mtb.get_metrics_port():
+        mtb.start_metrics_server(port = port)
+
+    runner = btb.Batch_Runner(job_list, save_path = ENV.DATASET_PATH, worker_num = 8, thread_num = 4)
+    result = runner.run()
+    mtb.print_stage_summary()
+    # 设置环境变量 NFT_DL_TRACE=1 时输出每个token的追踪文件和慢token、慢主机报告
+    if ttb.is_enabled():
+        ttb.print_report()
+    if ptb.is_enabled():
+        ptb.print_report()
+
+    for contract_address, success in result.items():
+        print(f"{contract_address}: {'downloaded' if success else 'failed'}")
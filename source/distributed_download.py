@@ -0,0 +1,40 @@
+"""
+Download one NFT collection (or a batch of collections) on several
+machines at once, coordinated by lease files on shared storage
+
+
+"""
+
+
+import os
+
+
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.batch_toolbox as btb
+import utils.shard_toolbox as sdt
+from CONST_ENV import CONST_ENV as ENV
+
+
+
+
+if __name__ == "__main__":
+
+    ENV.ensure_dirs()
+
+    # 每个节点运行相同的脚本，ENV.DATASET_PATH 需要指向所有节点共享的目录
+    chain_type = "ethereum"
+    contract_address = "0xbc4ca0eda7647a8ab7c2061c2e118a18a936f13d"
+
+    # 大项目按tokenId区间切分，每个分片 1000 个token
+    collection_info = btb.load_collection_info(contract_address, chain_type)
+    shard_list = sdt.create_range_shards(collection_info, platform = "Alchemy", shard_size = 1000)
+    manager = sdt.Lease_Manager(f"{chain_type}_{contract_address}")
+
+    # # 批量任务按项目切分
+    # job_list = btb.load_job_list(ENV.INFO_PATH / "batch_jobs.txt")
+    # shard_list = sdt.create_collection_shards(job_list)
+    # manager = sdt.Lease_Manager("batch_jobs")
+
+    node = sdt.Shard_Node(manager, save_path = ENV.DATASET_PATH, process_num = 4, thread_num = 4)
+    node.run(shard_list)
@@ -14,10 +14,12 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import utils.file_io as fio
 import utils.spider_toolbox as stb
 import utils.downloading_toolbox as dtb
+import utils.metrics_toolbox as mtb
+import utils.profile_toolbox as ptb
+import utils.trace_toolbox as ttb
 from CONST_ENV import CONST_ENV as ENV
 
 from pathlib import Path
-from internetdownloadmanager import Downloader
 
 
 def remove_special_char(string):
@@ -47,6 +49,8 @@ def filter_valid_keys(data):
 
 if __name__ == "__main__":
 
+    ENV.ensure_dirs()
+
     chain_type = "ethereum"
     # contract_address = "0xbc4ca0eda7647a8ab7c2061c2e118a18a936f13d"
     # contract_address = "0xb47e3cd837ddf8e4c57f05d70ab865de6e193bbb"
@@ -83,6 +87,35 @@ if __name__ == "__main__":
     # NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_NFTGo(**arg_dict, save_path=ENV.DATASET_PATH)
     # NFT_downloader.download_media_and_metadata()
 
+    # # 差异同步测试：揭示之后只重新下载图片发生变化的token
+    # NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_NFTScan(**arg_dict, save_path=ENV.DATASET_PATH)
+    # NFT_downloader.enable_diff_mode()
+    # NFT_downloader.download_media_and_metadata()
+
+    # # 多平台聚合测试：所有配置了API密钥的平台一起下载
+    # NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_Aggregator(**arg_dict, save_path=ENV.DATASET_PATH)
+    # NFT_downloader.download_media_and_metadata()
+
+    # # 按探测出的tokenId布局下载，跳过不存在的token
+    # NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_Alchemy(**arg_dict, save_path=ENV.DATASET_PATH)
+    # if token_space := dst.load_token_space(collection_info):
+    #     NFT_downloader.load_task_plan(token_space)
+    # NFT_downloader.download_media_and_metadata()
+
+    # 加上 --profile 时分析每个进程的耗时，结束后输出按子系统分组的热点函数
+    if "--profile" in sys.argv:
+        ptb.enable_profiling(sampling = True)
+
+    # 设置环境变量 NFT_DL_METRICS_PORT=9108 时，下载过程中可以通过 http://127.0.0.1:9108/metrics 查看各阶段的指标
+    if port := mtb.get_metrics_port():
+        mtb.start_metrics_server(port = port)
+
     # OpenSea 测试
     NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_NFTScan(**arg_dict, save_path=ENV.DATASET_PATH)
     NFT_downloader.download_media_and_metadata()
+    mtb.print_stage_summary()
+    # 设置环境变量 NFT_DL_TRACE=1 时输出每个token的追踪文件和慢token、慢主机报告
+    if ttb.is_enabled():
+        ttb.print_report()
+    if ptb.is_enabled():
+        ptb.print_report()
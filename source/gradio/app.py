@@ -1,98 +1,111 @@
 import gradio as gr
 import os
 import sys
+import time
 from pathlib import Path
 
 # 添加项目根目录到 Python 的模块搜索路径
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from source.CONST_ENV import CONST_ENV as ENV
-from utils import file_io as fio
 from utils import spider_toolbox as stb
-from utils import downloading_toolbox as dtb
-
-# 从 JSON 文件加载区块链信息
-platform_info = fio.load_json(ENV.INFO_PATH / "platform_info.json")
+from utils import bandwidth_toolbox as bwt
+from utils import concurrency_toolbox as cct
+from utils import dashboard_toolbox as dbt
+from utils import job_toolbox as jtb
+
+ENV.ensure_dirs()
+# 从 JSON 文件加载各个平台的能力配置
+platform_info = stb.get_platform_info()
 # 获取初始平台的初始选项
 initial_platform = "Alchemy"
-initial_chain_options = platform_info.get(initial_platform, [])
-# 用于跟踪下载状态的全局变量
-is_downloading = False  # 初始状态为未下载
+initial_chain_options = stb.get_platform_chains(initial_platform)
+# 下载在后台任务中进行，所有任务共用页面工作线程和连接池
+job_manager = jtb.get_job_manager(worker_num=8)
+dashboard = dbt.get_dashboard(job_manager)
+
+# 同时使用所有已配置API密钥的平台下载
+AGGREGATED_PLATFORM = "All Platforms"
 
 def update_options(platform):
     """设置回调函数，当第一个下拉列表变化时，更新第二个下拉列表的选项"""
-    return gr.update(choices=platform_info.get(platform, []))
-
-def toggle_download_button():
-    """切换按钮状态"""
-    global is_downloading  # 使用 global 声明来修改全局变量
-    if is_downloading:
-        # 当前正在下载，点击后应停止下载
-        is_downloading = False
-        return gr.update(value="Download", variant="primary")  # 恢复为蓝色
-    else:
-        # 当前未下载，点击后应开始下载
-        is_downloading = True
-        return gr.update(value="Stop", variant="stop")  # 变为红色，表示停止
-
-def download_nft_collection(contract_address, platform, chain_type, process_num, thread_num, save_path):
-    """下载整个 NFT 集合"""
-    if contract_address is None or contract_address == "":
-        raise ValueError("Contract address cannot be empty!")
-    
-    # 去掉contract_address最后可能存在的空格
-    contract_address = contract_address.strip()
-
-    # 将chain_type转换为小写
-    chain_type = chain_type.lower()
-
-    # 获取 NFT 集合信息
-    target_collection_path = ENV.INFO_PATH / f"{chain_type}_target_collection_info.json"
-    target_collection_info = fio.load_json(target_collection_path)
-    if target_collection_info is None:
-        # 创建文件并保存
-        collection_info = stb.get_target_collection_info(chain_type= chain_type, contract_address= contract_address)
-        collection_info_json = {contract_address: collection_info}
-        fio.save_json(target_collection_path, collection_info_json)
-
-    elif target_collection_info.get(contract_address) is None:
-        # 更新文件并保存
-        collection_info = stb.get_target_collection_info(chain_type= chain_type, contract_address= contract_address)
-        target_collection_info[contract_address] = collection_info
-        fio.save_json(target_collection_path, target_collection_info)
-    else:
-        collection_info = target_collection_info[contract_address]
-
-    # 构建下载器的参数列表
-    args_dict = {
-        "NFT_name": collection_info["NFT_name"],
-        "chain_type": collection_info["chain_type"],
-        "contract_address": collection_info["contract_address"],
-        "total_supply": collection_info["total_supply"],
-        "candidate_format": collection_info["candidate_format"],
-        "start_index": collection_info["start_index"],
-        "process_num": process_num,
-        "thread_num": thread_num,
-        "save_path": Path(save_path)
-    }
-
-    if platform == "Alchemy":
-        # 构建 Alchemy 下载器
-        NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_Alchemy(**args_dict)
-    elif platform == "NFTScan":
-        # 构建 NFTScan 下载器
-        NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_NFTScan(**args_dict)
-    elif platform == "NFTGo":
-        # 构建 NFTGo 下载器
-        NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_NFTGo(**args_dict)
-    elif platform == "OpenSea":
-        # 构建 OpenSea 下载器
-        NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_OpenSea(**args_dict)
-    else:
-        raise ValueError("Platform not supported!")
-    
-    # 开始下载
-    NFT_downloader.download_media_and_metadata()
+    if platform == AGGREGATED_PLATFORM:
+        return gr.update(choices=sorted({chain for name in platform_info for chain in stb.get_platform_chains(name)}))
+    return gr.update(choices=stb.get_platform_chains(platform))
+
+def format_job(progress):
+    """把任务进度格式化成一行状态文本"""
+    text = f"[{progress['status']}] #{progress['job_id']} {progress['name']}: {progress['tokens']}/{progress['total']} tokens, {progress['pages']} pages"
+    if progress["tokens_per_second"]:
+        text += f", {progress['tokens_per_second']:.1f} tokens/s"
+    if progress["eta"] is not None:
+        text += f", ETA {time.strftime('%H:%M:%S', time.gmtime(progress['eta']))}"
+    if progress["error"]:
+        text += f", error: {progress['error']}"
+    return text
+
+def list_jobs():
+    """所有任务的进度表"""
+    return [[item["job_id"], item["name"], item["platform"], item["status"], f"{item['tokens']}/{item['total']}",
+            round(item["tokens_per_second"], 1)] for item in job_manager.list_jobs()]
+
+def download_nft_collection(contract_address, platform, chain_type, thread_num, save_path):
+    """提交下载任务，并持续输出进度直到任务结束，页面在下载过程中保持可用"""
+    if contract_address is None or contract_address.strip() == "":
+        raise gr.Error("Contract address cannot be empty!")
+
+    # 聚合下载使用 Aggregator 下载器，其他平台使用对应的下载器
+    platform = "Aggregator" if platform == AGGREGATED_PLATFORM else platform
+    if platform != "Aggregator" and platform not in platform_info:
+        raise gr.Error("Platform not supported!")
+
+    job = job_manager.submit(chain_type=chain_type.lower(),
+                            contract_address=contract_address,
+                            platform=platform,
+                            save_path=Path(save_path),
+                            thread_num=int(thread_num))
+    while True:
+        progress = job.progress()
+        yield job.job_id, format_job(progress), list_jobs()
+        if progress["status"] in jtb.TERMINAL_STATES:
+            break
+        time.sleep(1)
+
+def stop_download(job_id):
+    """取消当前页面提交的任务，正在下载的页完成并保存检查点后停止"""
+    if job_id is None or not job_manager.cancel(job_id):
+        return "No running job to stop.", list_jobs()
+    return format_job(job_manager.get(job_id).progress()), list_jobs()
+
+def refresh_dashboard():
+    """采样一次面板数据，返回任务、主机和平台三张表"""
+    data = dashboard.collect()
+    job_rows = [[item["job_id"], item["name"], item["status"], f"{item['tokens']}/{item['total']}",
+                round(item["tokens_per_second"], 1), round(item["mb_per_second"], 2), item["in_flight"],
+                item["max_workers"] or "auto", round(item["bandwidth_limit"] / 1e6, 2) or "none",
+                time.strftime("%H:%M:%S", time.gmtime(item["eta"])) if item["eta"] is not None else "--"]
+                for item in data["jobs"]]
+    host_rows = [[item["host"], item["limit"], item["in_flight"], round(item["requests_per_second"], 1),
+                f"{item['error_rate']:.1%}", item["errors"]] for item in data["hosts"]]
+    provider_rows = [[item["provider"], round(item["requests_per_second"], 2), item["limit"],
+                    f"{item['headroom']:.0%}" if item["headroom"] is not None else "--", item["throttled"]]
+                    for item in data["providers"]]
+    return job_rows, host_rows, provider_rows
+
+def apply_job_limits(job_id, max_workers, bandwidth_mb):
+    """修改正在运行的任务的下载线程数和带宽上限，0 表示不单独限制"""
+    job = job_manager.get(int(job_id)) if job_id else None
+    if job is None or job.status in jtb.TERMINAL_STATES:
+        return f"Job {job_id} is not running."
+    job.set_concurrency(int(max_workers) or None)
+    bwt.set_job_bandwidth_limit(job.name, int(bandwidth_mb * 1e6))
+    return f"Job {job.job_id}: max workers {int(max_workers) or 'auto'}, bandwidth {bandwidth_mb or 'unlimited'} MB/s"
+
+def apply_global_limits(max_concurrency, bandwidth_mb):
+    """修改每个主机的最大并发数和总带宽上限，对所有任务生效"""
+    cct.get_controller().set_max_limit(int(max_concurrency))
+    bwt.set_bandwidth_limit(int(bandwidth_mb * 1e6))
+    return f"All jobs: max {int(max_concurrency)} requests per host, bandwidth {bandwidth_mb or 'unlimited'} MB/s"
 
 
 
@@ -110,7 +123,7 @@ if __name__ == "__main__":
             
             platform = gr.Dropdown(
                 label="Platform",
-                choices=list(platform_info.keys()),
+                choices=list(platform_info.keys()) + [AGGREGATED_PLATFORM],
                 interactive=True,
                 value=initial_platform
             )
@@ -124,29 +137,69 @@ if __name__ == "__main__":
             
             # 连接回调函数，当第一个下拉列表变化时，更新第二个下拉列表的选项
             platform.change(update_options, inputs=platform, outputs=chain_type)
-            process_num = gr.Slider(label="Process Number", minimum=1, maximum=8, step=1, value=4, interactive=True)
-            thread_num = gr.Slider(label="Thread Number Per Process", minimum=1, maximum=10, step=1, value=6, interactive=True)
+            # 每个任务同一时刻下载一页，页内的并发数由 AIMD 控制器在这个初始值的基础上调整
+            thread_num = gr.Slider(label="Initial Threads Per Page", minimum=1, maximum=10, step=1, value=6, interactive=True)
             
             # 使用文本框让用户输入保存路径
             save_path = gr.Textbox(label="Save Path", placeholder="Enter the path where you want to save files", interactive=True, value=f"{ENV.DATASET_PATH}")
 
-            # 创建按钮，点击后开始下载，再次点击停止下载
-            download_button = gr.Button(value="Download", variant="primary")
-            download_button.click(
-                toggle_download_button,
-                inputs=[],
-                outputs=download_button
-            )
+            # 点击后提交后台任务并持续显示进度，可以同时提交多个项目；停止按钮取消当前页面提交的任务
+            with gr.Row():
+                download_button = gr.Button(value="Download", variant="primary")
+                stop_button = gr.Button(value="Stop", variant="stop")
+            job_id = gr.State(None)
+            job_status = gr.Textbox(label="Status", interactive=False)
+            job_table = gr.Dataframe(headers=["Job", "Collection", "Platform", "Status", "Tokens", "Tokens/s"],
+                                    value=list_jobs, interactive=False)
             download_button.click(
                 download_nft_collection,
-                inputs=[contract_address, platform, chain_type, process_num, thread_num, save_path],
-                outputs=[]
+                inputs=[contract_address, platform, chain_type, thread_num, save_path],
+                outputs=[job_id, job_status, job_table],
+                concurrency_limit=None
+            )
+            stop_button.click(
+                stop_download,
+                inputs=[job_id],
+                outputs=[job_status, job_table],
+                concurrency_limit=None
             )
 
+        with gr.Tab("Live Dashboard"):
+            gr.Markdown("# Running Jobs")
+            jobs_board = gr.Dataframe(headers=["Job", "Collection", "Status", "Tokens", "Tokens/s", "MB/s", "In Flight",
+                                            "Max Workers", "Limit MB/s", "ETA"], interactive=False)
+            with gr.Row():
+                hosts_board = gr.Dataframe(headers=["Host", "Concurrency", "In Flight", "Requests/s", "Error Rate", "Errors"], interactive=False)
+                providers_board = gr.Dataframe(headers=["Provider", "Requests/s", "Limit/s", "Headroom", "429s"], interactive=False)
+
+            # 修改单个任务的限制，下一页或下一个数据块生效
+            with gr.Row():
+                control_job_id = gr.Number(label="Job", precision=0)
+                job_workers = gr.Slider(label="Max Workers Per Page (0 = auto)", minimum=0, maximum=64, step=1, value=0)
+                job_bandwidth = gr.Number(label="Job Bandwidth MB/s (0 = unlimited)", value=0)
+                job_apply = gr.Button(value="Apply To Job")
+            # 修改所有任务共用的限制
+            with gr.Row():
+                global_concurrency = gr.Slider(label="Max Concurrency Per Host", minimum=1, maximum=64, step=1,
+                                            value=cct.get_controller().max_limit)
+                global_bandwidth = gr.Number(label="Total Bandwidth MB/s (0 = unlimited)",
+                                            value=round((bwt.load_bandwidth_config().get("limit_bytes_per_second") or 0) / 1e6, 2))
+                global_apply = gr.Button(value="Apply To All Jobs")
+            control_status = gr.Textbox(label="Result", interactive=False)
+            job_apply.click(apply_job_limits, inputs=[control_job_id, job_workers, job_bandwidth], outputs=control_status)
+            global_apply.click(apply_global_limits, inputs=[global_concurrency, global_bandwidth], outputs=control_status)
+
+            # 每 3 秒刷新一次
+            dashboard_outputs = [jobs_board, hosts_board, providers_board]
+            if hasattr(gr, "Timer"):
+                gr.Timer(3).tick(refresh_dashboard, outputs=dashboard_outputs)
+            else:
+                demo.load(refresh_dashboard, outputs=dashboard_outputs, every=3)
+
         with gr.Tab("Add missing NFTs"):
             gr.Markdown("# Coming soon!")
 
 
 
-    # 启动 Gradio 接口
-    demo.launch(server_port=5645)
+    # 启动 Gradio 接口，进度通过生成器持续推送，需要开启队列
+    demo.queue().launch(server_port=5645)
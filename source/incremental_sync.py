@@ -0,0 +1,37 @@
+"""
+Incrementally refresh every tracked NFT collection of a chain
+according to ERC-4906 MetadataUpdate and mint Transfer events
+
+
+"""
+
+
+import os
+
+
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.file_io as fio
+import utils.sync_toolbox as sync
+from CONST_ENV import CONST_ENV as ENV
+
+
+
+
+if __name__ == "__main__":
+
+    ENV.ensure_dirs()
+
+    chain_type = "ethereum"
+
+    # 所有已经记录在 target_collection_info 中的项目都会被增量同步
+    target_collection_info = fio.load_json(ENV.INFO_PATH / f"{chain_type}_target_collection_info.json")
+    if target_collection_info is None:
+        print("No tracked collections.")
+        sys.exit(0)
+
+    syncer = sync.Incremental_Syncer(chain_type = chain_type)
+    result = syncer.sync_collections(list(target_collection_info.values()), save_path = ENV.DATASET_PATH)
+
+    for contract_address, success in result.items():
+        print(f"{contract_address}: {'synced' if success else 'failed'}")
@@ -0,0 +1,248 @@
+"""
+Headless command line entry point for schedulers and scripts
+
+    python source/nft_dl.py collection <contract_address> [--chain ethereum] [--platform Alchemy] [--diff]
+    python source/nft_dl.py gaps <contract_address> [--chain ethereum] [--platform NFTScan]
+    python source/nft_dl.py verify <contract_address> [--chain ethereum]
+    python source/nft_dl.py batch [job_file] [--workers 8]
+    python source/nft_dl.py --cache replay collection <contract_address>
+
+Only the standard library is imported at startup. Each subcommand imports
+the provider modules and HTTP dependencies it needs when it runs, so small
+incremental jobs start quickly. The exit code is 0 on success and 1 on failure.
+
+
+"""
+
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+def load_collection_info(args, offline = False) -> dict:
+    """
+    读取项目信息，offline 为 True 时只读取本地记录，不请求平台接口
+
+    Returns:
+        dict: 项目信息，找不到时返回 None
+    """
+    target_collection_path = ENV.INFO_PATH / f"{args.chain}_target_collection_info.json"
+    if offline:
+        import utils.file_io as fio
+        target_collection_info = fio.load_json(target_collection_path) if target_collection_path.exists() else None
+        return (target_collection_info or {}).get(args.contract_address)
+
+    import utils.batch_toolbox as btb
+    return btb.load_collection_info(args.contract_address, args.chain)
+
+
+def get_collection_path(args, collection_info: dict) -> Path:
+    return Path(args.save_path) / collection_info["chain_type"] / collection_info["NFT_name"]
+
+
+def get_re_download_path(args) -> Path:
+    return ENV.RE_DOWNLOAD_FILES_INFO_PATH / f"{args.chain}_{args.contract_address}.json"
+
+
+def configure_output(downloader, args) -> None:
+    """按命令行参数设置目录结构和 tar 分片输出"""
+    if args.layout:
+        downloader.set_layout(args.layout)
+    if args.tar_shards:
+        downloader.enable_tar_output(args.tar_shards * 1000 ** 2)
+
+
+def verify_collection(args, collection_info: dict) -> bool:
+    """用进程池检查整个项目，把需要重新下载的tokenId写入 RE_DOWNLOAD_FILES_INFO_PATH，gaps 会一起重新下载"""
+    import utils.file_io as fio
+    import utils.verify_toolbox as vtb
+
+    result = vtb.verify_collection(get_collection_path(args, collection_info), vtb.get_expected_token_ids(collection_info),
+                                    process_num = args.verify_processes, full = getattr(args, "full", False))
+    for key in ("missing_metadata", "missing_media", "no_media", "empty_files", "corrupt_metadata", "corrupt_media"):
+        print(f"{key}: {len(result[key])}")
+    for file_name, error in sorted(result["errors"].items())[:20]:
+        print(f"    {file_name}: {error}")
+    result["bad"] = vtb.get_bad_token_ids(result)
+    fio.save_json(get_re_download_path(args), result)
+    return not result["bad"]
+
+
+def run_collection(args) -> bool:
+    """下载整个项目"""
+    import utils.batch_toolbox as btb
+
+    collection_info = load_collection_info(args)
+    if collection_info is None:
+        print(f"Collection {args.contract_address} not found on {args.chain}.")
+        return False
+    downloader = btb.create_downloader(collection_info, args.platform, args.save_path, args.process_num, args.thread_num)
+    if args.diff:
+        downloader.enable_diff_mode()
+    configure_output(downloader, args)
+    success = downloader.download_media_and_metadata() is not False
+    if args.verify:
+        success = verify_collection(args, collection_info) and success
+    return success
+
+
+def run_gaps(args) -> bool:
+    """只下载本地缺少 metadata 或媒体文件的token，以及 verify 记录的损坏文件"""
+    import utils.file_io as fio
+    import utils.verify_toolbox as vtb
+
+    collection_info = load_collection_info(args)
+    if collection_info is None:
+        print(f"Collection {args.contract_address} not found on {args.chain}.")
+        return False
+    result = vtb.scan_collection(get_collection_path(args, collection_info), vtb.get_expected_token_ids(collection_info))
+    missing = set(vtb.get_bad_token_ids(result))
+    re_download_path = get_re_download_path(args)
+    if re_download_path.exists():
+        missing.update((fio.load_json(re_download_path) or {}).get("bad", []))
+    missing = sorted(missing)
+    print(f"{collection_info['NFT_name']}: {len(missing)} tokens missing or corrupt")
+    if not missing:
+        return True
+
+    import utils.batch_toolbox as btb
+    import utils.discovery_toolbox as dst
+    import utils.downloading_toolbox as dtb
+
+    # RPC 下载器可以直接按tokenId下载，其他平台通过聚合下载器的批量接口只领取缺少的token
+    if args.platform == "RPC":
+        downloader = btb.create_downloader(collection_info, "RPC", args.save_path, args.process_num, args.thread_num)
+        configure_output(downloader, args)
+        success = downloader.download_media_and_metadata(token_ids = missing) is not False
+    else:
+        downloader = dtb.NFT_Downloader_for_Whole_Collection_Aggregator(chain_type = collection_info["chain_type"],
+                                                                        NFT_name = collection_info["NFT_name"],
+                                                                        contract_address = collection_info["contract_address"],
+                                                                        candidate_format = collection_info["candidate_format"],
+                                                                        save_path = args.save_path,
+                                                                        process_num = args.process_num,
+                                                                        thread_num = args.thread_num,
+                                                                        total_supply = collection_info["total_supply"],
+                                                                        start_index = collection_info["start_index"],
+                                                                        # Aggregator 与不指定平台相同，使用所有已配置API密钥的平台
+                                                                        platforms = [args.platform] if args.platform not in (None, "Aggregator") else None)
+        downloader.load_task_plan({"ranges": dst.compress_ranges(missing)})
+        configure_output(downloader, args)
+        success = downloader.download_media_and_metadata() is not False
+    # 记录中的token已经重新下载，下次 verify 时重新生成
+    if success and re_download_path.exists():
+        re_download_path.unlink()
+    return success
+
+
+def run_verify(args) -> bool:
+    """检查本地文件的完整性，把有问题的tokenId写入 RE_DOWNLOAD_FILES_INFO_PATH，之后可以用 gaps 重新下载"""
+    collection_info = load_collection_info(args, offline = True)
+    if collection_info is None:
+        print(f"Collection {args.contract_address} on {args.chain} has not been downloaded.")
+        return False
+    return verify_collection(args, collection_info)
+
+
+def run_batch(args) -> bool:
+    """批量下载任务文件中的所有项目"""
+    import utils.batch_toolbox as btb
+
+    job_list = btb.load_job_list(args.job_file)
+    runner = btb.Batch_Runner(job_list, save_path = args.save_path, worker_num = args.workers, thread_num = args.thread_num)
+    result = runner.run()
+    for contract_address, success in result.items():
+        print(f"{contract_address}: {'downloaded' if success else 'failed'}")
+    return all(result.values())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog = "nft-dl", description = "Download NFT collections without the GUI")
+    parser.add_argument("--save-path", default = str(ENV.DATASET_PATH))
+    parser.add_argument("--thread-num", type = int, default = 8, help = "initial download threads per process")
+    parser.add_argument("--log-level", help = "overrides NFT_DL_LOG_LEVEL")
+    parser.add_argument("--log-format", choices = ["text", "json"], help = "overrides NFT_DL_LOG_FORMAT")
+    parser.add_argument("--metrics-port", type = int, default = 0, help = "serve Prometheus metrics on this port, 0 disables it")
+    parser.add_argument("--trace", action = "store_true", help = "write per-token traces and print the slow token report")
+    parser.add_argument("--profile", action = "store_true", help = "profile every process and print hot functions by subsystem")
+    parser.add_argument("--summary", action = "store_true", help = "print the per-stage metrics summary at the end")
+    parser.add_argument("--cache", choices = ["off", "on", "refresh", "replay"],
+                        help = "cache API responses on disk, replay re-runs a cached collection without any API calls")
+    parser.add_argument("--cache-ttl", type = float, help = "seconds a cached response stays valid, default is 7 days")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    for name, handler, help_text in (("collection", run_collection, "download a whole collection"),
+                                     ("gaps", run_gaps, "download tokens whose files are missing"),
+                                     ("verify", run_verify, "check downloaded files and record the bad ones")):
+        subparser = subparsers.add_parser(name, help = help_text)
+        subparser.add_argument("contract_address")
+        subparser.add_argument("--chain", default = "ethereum", type = str.lower)
+        subparser.add_argument("--platform", help = "Alchemy, NFTScan, NFTGo, OpenSea, RPC or Aggregator, default is the first configured one")
+        subparser.add_argument("--process-num", type = int, default = 4)
+        subparser.set_defaults(handler = handler)
+    subparsers.choices["collection"].add_argument("--diff", action = "store_true", help = "only re-download tokens whose metadata changed")
+    subparsers.choices["collection"].add_argument("--verify", action = "store_true", help = "verify every file after downloading")
+    subparsers.choices["verify"].add_argument("--full", action = "store_true", help = "re-check files that passed before")
+    for name in ("collection", "verify"):
+        subparsers.choices[name].add_argument("--verify-processes", type = int, help = "verification processes, default is the CPU count")
+    for name in ("collection", "gaps"):
+        subparsers.choices[name].add_argument("--tar-shards", type = int, default = 0, metavar = "MB",
+                                            help = "write WebDataset tar shards of this size instead of separate files")
+        subparsers.choices[name].add_argument("--layout", choices = ["flat", "id", "hash"],
+                                            help = "directory layout saved with the collection, id and hash split files into subdirectories")
+
+    batch_parser = subparsers.add_parser("batch", help = "download every collection of a job file")
+    batch_parser.add_argument("job_file", nargs = "?", default = str(ENV.INFO_PATH / "batch_jobs.txt"))
+    batch_parser.add_argument("--workers", type = int, default = 8, help = "page workers shared by all collections")
+    batch_parser.set_defaults(handler = run_batch)
+    return parser
+
+
+def main(argv = None) -> int:
+    args = build_parser().parse_args(argv)
+    if hasattr(args, "contract_address"):
+        args.contract_address = args.contract_address.strip()
+    ENV.ensure_dirs()
+
+    # 日志和追踪通过环境变量配置，必须在导入下载模块之前设置，子进程也会继承
+    if args.log_level:
+        os.environ["NFT_DL_LOG_LEVEL"] = args.log_level
+    if args.log_format:
+        os.environ["NFT_DL_LOG_FORMAT"] = args.log_format
+    if args.trace:
+        import utils.trace_toolbox as ttb
+        ttb.enable_tracing()
+    if args.profile:
+        import utils.profile_toolbox as ptb
+        ptb.enable_profiling(sampling = True)
+    if args.cache:
+        import utils.cache_toolbox as cht
+        cht.enable_cache(args.cache, args.cache_ttl)
+    if args.metrics_port:
+        import utils.metrics_toolbox as mtb
+        mtb.start_metrics_server(port = args.metrics_port)
+
+    success = args.handler(args)
+
+    if args.summary:
+        import utils.metrics_toolbox as mtb
+        mtb.print_stage_summary()
+    if args.trace:
+        import utils.trace_toolbox as ttb
+        ttb.print_report()
+    if args.profile:
+        import utils.profile_toolbox as ptb
+        ptb.print_report()
+    return 0 if success else 1
+
+
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.file_io as fio
+from benchmarks.mock_server import DEFAULT_HOST, Mock_Server
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+@pytest.fixture(scope = "module")
+def mock_server():
+    """没有延迟和错误的本地模拟服务器，tokenId 为 0 到 19，读取 13 的 tokenURI 时节点返回限流错误"""
+    server = Mock_Server({"token_count": 20,
+                        "media_size": 1024,
+                        "metadata_size": 16,
+                        "rpc_failing_ids": [13],
+                        "hosts": {role: dict(DEFAULT_HOST) for role in Mock_Server.ROLES}}).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def mock_client(mock_server, tmp_path, monkeypatch):
+    """让 spider_toolbox 读取指向模拟服务器的 api_keys.json"""
+    env = mock_server.write_client_config(tmp_path / "mock_client")
+    monkeypatch.setattr(ENV, "API_KEYS_PATH", Path(env["NFT_DL_API_KEYS_PATH"]))
+    return mock_server
+
+
+def collection_info(contract_address: str, NFT_name: str, total_supply: int) -> dict:
+    return {"contract_address": contract_address, "NFT_name": NFT_name, "chain_type": "ethereum", "candidate_format": ".png",
+            "total_supply": total_supply, "start_index": 0}
+
+
+@pytest.fixture
+def rpc_collections(mock_client, tmp_path, monkeypatch):
+    """三个通过 RPC 下载的项目：全部成功、token 4 的图片下载失败、token 13 的 tokenURI 读取失败，返回任务列表"""
+    monkeypatch.setattr(ENV, "INFO_PATH", tmp_path / "info")
+    ENV.INFO_PATH.mkdir()
+    collections = {"0x" + "01" * 20: collection_info("0x" + "01" * 20, "Complete", 3),
+                   "0x" + "02" * 20: collection_info("0x" + "02" * 20, "Partial", 6),
+                   "0x" + "03" * 20: collection_info("0x" + "03" * 20, "Unreadable", 15)}
+    fio.save_json(ENV.INFO_PATH / "ethereum_target_collection_info.json", collections)
+    # token 4 的图片链接返回 404，token 13 的 tokenURI 读取时节点返回限流错误
+    media_url = mock_client.state.media_url
+    monkeypatch.setattr(mock_client.state, "media_url",
+                        lambda token_id: f"{mock_client.state.base_urls['origin']}/missing/{token_id}.png" if token_id == 4 else media_url(token_id))
+    return [{"chain_type": "ethereum", "contract_address": contract_address, "platform": "RPC"} for contract_address in collections]
@@ -0,0 +1,22 @@
+import utils.batch_toolbox as btb
+import utils.file_io as fio
+
+
+def test_load_job_list(tmp_path):
+    job_file = tmp_path / "jobs.txt"
+    job_file.write_text("# chain, contract, platform\nEthereum, 0xabc , RPC\n\npolygon 0xdef  # no platform\n", encoding = "UTF-8")
+    assert btb.load_job_list(job_file) == [{"chain_type": "ethereum", "contract_address": "0xabc", "platform": "RPC"},
+                                           {"chain_type": "polygon", "contract_address": "0xdef", "platform": None}]
+    job_file = tmp_path / "jobs.json"
+    fio.save_json(job_file, [["ethereum", "0xabc"], {"chain_type": "BSC", "contract_address": "0xdef", "platform": "NFTScan"}])
+    assert btb.load_job_list(job_file) == [{"chain_type": "ethereum", "contract_address": "0xabc", "platform": None},
+                                           {"chain_type": "bsc", "contract_address": "0xdef", "platform": "NFTScan"}]
+
+
+def test_batch_runner_reports_failed_tokens(rpc_collections, tmp_path):
+    runner = btb.Batch_Runner(rpc_collections, save_path = tmp_path / "data", worker_num = 2, thread_num = 2)
+    assert runner.run() == {"0x" + "01" * 20: True, "0x" + "02" * 20: False, "0x" + "03" * 20: False}
+    complete, partial, unreadable = runner.jobs
+    assert (complete.saved, complete.failed) == (3, set())
+    assert (partial.saved, partial.failed) == (5, {4})
+    assert unreadable.saved == 0
@@ -0,0 +1,39 @@
+import json
+
+import utils.cache_toolbox as cht
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+SECRET = "k" * 32
+
+
+def create_cache(tmp_path, monkeypatch):
+    api_keys_path = tmp_path / "api_keys.json"
+    api_keys_path.write_text(json.dumps({"Alchemy": [SECRET], "RPC": {"ethereum": f"https://eth.example/v2/{SECRET}"}}))
+    monkeypatch.setattr(ENV, "API_KEYS_PATH", api_keys_path)
+    return cht.Response_Cache(tmp_path / "cache")
+
+
+def test_redact(tmp_path, monkeypatch):
+    cache = create_cache(tmp_path, monkeypatch)
+    assert cache.secrets == [SECRET]
+    assert cache.redact(f"https://eth.example/v2/{SECRET}") == "https://eth.example/v2/{API_KEY}"
+
+
+def test_make_key_normalizes_url(tmp_path, monkeypatch):
+    cache = create_cache(tmp_path, monkeypatch)
+    key, request = cache.make_key("get", f"HTTPS://Api.Example:443/nfts?b=2&apiKey={SECRET}", params = {"a": 1, "c": None})
+    assert request == {"method": "GET", "url": "https://api.example/nfts?a=1&apiKey={API_KEY}&b=2"}
+    # 参数顺序和默认端口不影响缓存的键
+    assert cache.make_key("GET", "https://api.example/nfts", params = [("b", 2), ("apiKey", SECRET), ("a", 1)])[0] == key
+    # 不在 api_keys.json 中的参数不会被替换
+    assert cache.make_key("GET", "https://api.example/nfts", params = [("b", 2), ("apiKey", "x" * 32), ("a", 1)])[0] != key
+
+
+def test_make_key_redacts_payload(tmp_path, monkeypatch):
+    cache = create_cache(tmp_path, monkeypatch)
+    key, request = cache.make_key("post", "https://eth.example/", payload = {"key": SECRET, "id": 1})
+    assert request["payload"] == {"id": 1, "key": "{API_KEY}"}
+    assert SECRET not in json.dumps(request)
+    assert cache.make_key("post", "https://eth.example/", payload = {"id": 1, "key": SECRET})[0] == key
+    assert cache.make_key("post", "https://eth.example/", payload = {"id": 2, "key": SECRET})[0] != key
@@ -0,0 +1,63 @@
+import json
+import os
+import time
+
+import pytest
+
+import utils.concurrency_toolbox as cct
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ENV, "CONCURRENCY_LOGGING_PATH", tmp_path)
+    return tmp_path
+
+
+def test_current_limit():
+    controller = cct.AIMD_Controller(initial_limit = 4, max_limit = 16)
+    assert controller.current_limit() == 4
+    controller._state("a.example").limit = 6.5
+    controller._state("b.example").limit = 5
+    assert controller.current_limit() == 11
+    controller._state("c.example").limit = 10
+    assert controller.current_limit() == 16
+
+
+def test_decrease_once_per_window():
+    controller = cct.AIMD_Controller(initial_limit = 8, window = 60)
+    for _ in range(3):
+        controller.acquire("a.example")
+    for _ in range(3):
+        controller.release("a.example", False, 0.1, congested = True)
+    assert controller.hosts["a.example"].limit == 4
+
+
+def test_increase_when_saturated():
+    controller = cct.AIMD_Controller(initial_limit = 2, window = 0)
+    controller.acquire("a.example")
+    controller.acquire("a.example")
+    controller.release("a.example", True, 0.1)
+    assert controller.hosts["a.example"].limit == 3
+
+
+def test_snapshot_removed_at_exit(snapshot_dir):
+    controller = cct.AIMD_Controller()
+    controller.dump_snapshot(interval = 0)
+    file_path = snapshot_dir / f"{os.getpid()}.json"
+    assert file_path.exists()
+    controller.remove_snapshot()
+    assert not file_path.exists()
+
+
+def test_stale_snapshots_swept(snapshot_dir):
+    stale = snapshot_dir / "1.json"
+    stale.write_text(json.dumps({"time": 0, "hosts": {}}))
+    old = time.time() - cct.STALE_SECONDS - 1
+    os.utime(stale, (old, old))
+    fresh = snapshot_dir / "2.json"
+    fresh.write_text(json.dumps({"time": time.time(), "hosts": {}}))
+
+    cct.AIMD_Controller().dump_snapshot(interval = 0)
+    assert not stale.exists()
+    assert fresh.exists()
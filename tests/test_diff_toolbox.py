@@ -0,0 +1,96 @@
+import json
+
+import utils.diff_toolbox as dft
+import utils.file_io as fio
+import utils.record_toolbox as rtb
+from tests.test_downloading_toolbox import create_rpc_downloader
+
+
+METADATA = {"name": "Mock #1", "image": "ipfs://Qm/1.png", "attributes": [{"trait_type": "Index", "value": "1"}]}
+
+
+def test_hash_metadata_ignores_key_order():
+    record = rtb.Token_Record(1, raw = dict(reversed(list(METADATA.items()))))
+    assert dft.hash_metadata(record) == dft.hash_content(METADATA)
+    assert dft.hash_metadata(rtb.Token_Record(1, token_uri = "ipfs://Qm/1.json")) != dft.hash_content(METADATA)
+
+
+def test_get_image_uri():
+    record = rtb.Token_Record(1, raw = METADATA, sources = ["https://cdn/1.png"], format = ".png")
+    assert dft.get_image_uri(record) == "ipfs://Qm/1.png"
+    assert dft.get_image_uri(rtb.Token_Record(1, sources = ["https://cdn/1.png"], format = ".png")) == "https://cdn/1.png"
+
+
+def make_files(tmp_path):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "metadata").mkdir()
+    media_file = lambda token_id, format: tmp_path / "img" / f"{token_id}{format}"
+    metadata_file = lambda token_id: tmp_path / "metadata" / f"{token_id}.json"
+    return media_file, metadata_file
+
+
+def test_filter_changed_seeds_from_stored_metadata(tmp_path):
+    media_file, metadata_file = make_files(tmp_path)
+    fio.save_json(metadata_file(1), METADATA)
+    media_file(1, ".png").write_bytes(b"png")
+    index = dft.Diff_Index(tmp_path)
+
+    record = rtb.Token_Record(1, raw = METADATA, sources = ["https://cdn/1.png"], format = ".png")
+    assert index.filter_changed([record], media_file, metadata_file)[:2] == ([], [])
+
+    revealed = rtb.Token_Record(1, raw = dict(METADATA, image = "ipfs://Qm/revealed.png"), sources = ["https://cdn/1.png"], format = ".png")
+    metadata_records, media_records, entries = index.filter_changed([revealed], media_file, metadata_file)
+    assert metadata_records == media_records == [revealed]
+    assert entries == {"1": {"hash": dft.hash_metadata(revealed), "image": "ipfs://Qm/revealed.png"}}
+
+
+def test_filter_changed_retries_failed_downloads(tmp_path):
+    media_file, metadata_file = make_files(tmp_path)
+    fio.save_json(metadata_file(1), METADATA)
+    media_file(1, ".png").write_bytes(b"png")
+    index = dft.Diff_Index(tmp_path)
+    record = rtb.Token_Record(1, raw = METADATA, sources = ["https://cdn/1.png"], format = ".png")
+
+    # 上次下载失败时没有记录哈希值和图片链接，之前的文件还在也要重新下载
+    index.record({"1": {"hash": None, "image": None}})
+    assert index.filter_changed([record], media_file, metadata_file)[:2] == ([record], [record])
+    # 索引文件中后写入的记录生效
+    index.record({"1": {"hash": dft.hash_metadata(record), "image": dft.get_image_uri(record)}})
+    dft._INDEX_CACHE.clear()
+    assert index.filter_changed([record], media_file, metadata_file)[:2] == ([], [])
+
+
+def test_rpc_diff_detects_content_reveal(mock_client, tmp_path, monkeypatch):
+    downloader = create_rpc_downloader(mock_client, tmp_path)
+    downloader.enable_diff_mode()
+    assert downloader.single_process_worker([1, 2]) == set()
+
+    # tokenURI 不变，链接指向的内容在揭示后变化
+    monkeypatch.setattr(mock_client.state, "description", "revealed")
+    assert downloader.single_process_worker([1, 2]) == set()
+    assert fio.load_json(downloader.metadata_file(1))["description"] == "revealed"
+
+    # 内容没有变化时不重写文件
+    fio.save_json(downloader.metadata_file(2), {"untouched": True})
+    assert downloader.single_process_worker([1, 2]) == set()
+    assert fio.load_json(downloader.metadata_file(2)) == {"untouched": True}
+
+
+def test_rpc_diff_retries_failed_metadata(mock_client, tmp_path, monkeypatch):
+    downloader = create_rpc_downloader(mock_client, tmp_path)
+    downloader.enable_diff_mode()
+    assert downloader.single_process_worker([3]) == set()
+    monkeypatch.setattr(mock_client.state, "description", "revealed")
+
+    save_metadata = downloader.save_metadata
+    def fail(token_id, file_path, metadata):
+        raise OSError("disk full")
+    monkeypatch.setattr(downloader, "save_metadata", fail)
+    assert downloader.single_process_worker([3]) == {3}
+    assert downloader.diff_index.entries["3"]["hash"] is None
+
+    monkeypatch.setattr(downloader, "save_metadata", save_metadata)
+    assert downloader.single_process_worker([3]) == set()
+    assert fio.load_json(downloader.metadata_file(3))["description"] == "revealed"
+    with open(downloader.diff_index.index_path, 'r', encoding='UTF-8') as file:
+        assert json.loads(file.readlines()[-1])["3"]["hash"] is not None
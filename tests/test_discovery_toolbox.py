@@ -0,0 +1,7 @@
+import utils.discovery_toolbox as dst
+
+
+def test_compress_ranges():
+    assert dst.compress_ranges([]) == []
+    assert dst.compress_ranges([5]) == [[5, 5]]
+    assert dst.compress_ranges([0, 1, 2, 5, 6, 9]) == [[0, 2], [5, 6], [9, 9]]
@@ -0,0 +1,69 @@
+import utils.downloading_toolbox as dtb
+
+
+CONTRACT = "0x" + "ab" * 20
+
+
+def create_rpc_downloader(mock_server, save_path, **kwargs):
+    return dtb.NFT_Downloader_for_Whole_Collection_RPC("ethereum", "Mock", CONTRACT, ".png", save_path,
+                                                        process_num = 1, thread_num = 2, total_supply = 20, interval_length = 5,
+                                                        rpc_url = mock_server.rpc_url, **kwargs)
+
+
+def test_rpc_worker_returns_failed_tokens(mock_client, tmp_path):
+    downloader = create_rpc_downloader(mock_client, tmp_path)
+    assert downloader.single_process_worker([0, 1]) == set()
+    assert downloader.metadata_file(0).exists() and downloader.media_file(0, ".png").exists()
+    # 节点错误时整组token都失败，不能当成不存在的token跳过
+    assert downloader.single_process_worker([12, 13]) == {12, 13}
+    # 不存在的token revert，不算失败
+    assert downloader.single_process_worker([25]) == set()
+
+
+def test_rpc_download_fails_on_node_errors(mock_client, tmp_path):
+    downloader = create_rpc_downloader(mock_client, tmp_path)
+    assert downloader.download_media_and_metadata(token_ids = [2, 3, 25])
+    assert not downloader.download_media_and_metadata(token_ids = [13])
+
+
+def test_rpc_download_fails_on_unreachable_node(mock_client, tmp_path):
+    downloader = dtb.NFT_Downloader_for_Whole_Collection_RPC("ethereum", "Mock", CONTRACT, ".png", tmp_path,
+                                                            process_num = 1, thread_num = 2, total_supply = 20,
+                                                            rpc_url = "http://127.0.0.1:9/")
+    assert not downloader.download_media_and_metadata(token_ids = [5])
+
+
+def create_alchemy_downloader(save_path, **kwargs):
+    return dtb.NFT_Downloader_for_Whole_Collection_Alchemy("ethereum", "Mock", CONTRACT, ".png", save_path,
+                                                            interval_length = 10, **kwargs)
+
+
+def test_alchemy_segments(tmp_path):
+    downloader = create_alchemy_downloader(tmp_path, process_num = 4, total_supply = 100)
+    assert downloader.segment_list == [{"cursor": 0, "end": 25}, {"cursor": 25, "end": 50},
+                                        {"cursor": 50, "end": 75}, {"cursor": 75, "end": None}]
+
+
+def test_alchemy_split_segment(tmp_path):
+    downloader = create_alchemy_downloader(tmp_path, process_num = 2, total_supply = 100)
+    segment = {"cursor": 10, "end": 50}
+    assert downloader.split_segment(segment) == {"cursor": 30, "end": 50}
+    assert segment == {"cursor": 10, "end": 30}
+    # 剩余不足两页时不再切分
+    assert downloader.split_segment({"cursor": 10, "end": 29}) is None
+    # 没有上界的分段按分段长度推测性切分
+    open_segment = {"cursor": 60, "end": None}
+    assert downloader.split_segment(open_segment) == {"cursor": 110, "end": None}
+    assert open_segment == {"cursor": 60, "end": 110}
+
+
+def test_alchemy_cache_segments_use_fixed_grid(tmp_path, monkeypatch):
+    monkeypatch.setenv("NFT_DL_CACHE", "on")
+    segment_lists = []
+    for process_num in (2, 3):
+        downloader = create_alchemy_downloader(tmp_path, process_num = process_num, total_supply = 250)
+        segment_lists.append(downloader.get_segments())
+    # 分段只取决于 start_index、total_supply 和 interval_length，与进程数无关
+    assert segment_lists[0] == segment_lists[1]
+    assert segment_lists[0] == [{"cursor": 0, "end": 100}, {"cursor": 100, "end": 200},
+                                {"cursor": 200, "end": 250}, {"cursor": 250, "end": None}]
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+import utils.job_toolbox as jtb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+def wait_for(job, timeout = 30):
+    deadline = time.monotonic() + timeout
+    while job.status not in jtb.TERMINAL_STATES:
+        assert time.monotonic() < deadline, f"job {job.job_id} is still {job.status}"
+        time.sleep(0.05)
+    return job.status
+
+
+@pytest.fixture
+def job_manager(rpc_collections, tmp_path, monkeypatch):
+    monkeypatch.setattr(ENV, "JOB_STATE_PATH", tmp_path / "jobs")
+    return jtb.Job_Manager(worker_num = 2)
+
+
+def test_job_finished(rpc_collections, job_manager, tmp_path):
+    job = job_manager.submit("ethereum", rpc_collections[0]["contract_address"], "RPC", save_path = tmp_path / "data", thread_num = 2)
+    assert wait_for(job) == jtb.FINISHED
+    assert job.completed == {0, 1, 2}
+
+
+def test_partial_job_retries_only_failed_tokens(rpc_collections, job_manager, mock_client, tmp_path, monkeypatch):
+    contract_address = rpc_collections[1]["contract_address"]
+    job = job_manager.submit("ethereum", contract_address, "RPC", save_path = tmp_path / "data", thread_num = 2)
+    assert wait_for(job) == jtb.PARTIAL
+    assert job.completed == {0, 1, 2, 3, 5} and job.failed == {4}
+    assert job.progress()["failed"] == 1
+
+    # 图片恢复后重新提交，只下载上次失败的token
+    monkeypatch.delattr(mock_client.state, "media_url")
+    job = job_manager.submit("ethereum", contract_address, "RPC", save_path = tmp_path / "data", thread_num = 2)
+    assert wait_for(job) == jtb.FINISHED
+    assert job.resumed == 5 and job.saved == 1 and job.completed == set(range(6))
+
+    # 全部完成的项目再次提交时重新下载
+    job = job_manager.submit("ethereum", contract_address, "RPC", save_path = tmp_path / "data", thread_num = 2)
+    assert wait_for(job) == jtb.FINISHED
+    assert job.resumed == 0 and job.saved == 6
+
+
+def test_job_failed(rpc_collections, job_manager, tmp_path):
+    job = job_manager.submit("ethereum", rpc_collections[2]["contract_address"], "RPC", save_path = tmp_path / "data", thread_num = 2)
+    assert wait_for(job) == jtb.FAILED
+    assert job.error
@@ -0,0 +1,44 @@
+import hashlib
+
+import pytest
+
+import utils.layout_toolbox as lyt
+
+
+def test_flat_path(tmp_path):
+    layout = lyt.Layout(tmp_path)
+    assert layout.path("img", 1234, ".png") == tmp_path / "img" / "1234.png"
+    assert not (tmp_path / "img").exists()
+
+
+def test_id_path(tmp_path):
+    layout = lyt.Layout(tmp_path, "id")
+    assert layout.path("img", 1234, ".png") == tmp_path / "img" / "00" / "12" / "1234.png"
+    assert layout.path("metadata", 98765432, ".json") == tmp_path / "metadata" / "76" / "54" / "98765432.json"
+    assert (tmp_path / "img" / "00" / "12").is_dir()
+
+
+def test_hash_path(tmp_path):
+    layout = lyt.Layout(tmp_path, "hash")
+    digest = hashlib.md5(b"1234").hexdigest()
+    assert layout.path("img", 1234, ".png") == tmp_path / "img" / digest[:2] / digest[2:4] / "1234.png"
+
+
+def test_unknown_layout(tmp_path):
+    with pytest.raises(ValueError):
+        lyt.Layout(tmp_path, "tree")
+
+
+def test_layout_saved_and_manifest(tmp_path):
+    assert lyt.load_layout(tmp_path).scheme == "flat"
+    layout = lyt.Layout(tmp_path, "id")
+    layout.save()
+    assert lyt.load_layout(tmp_path).scheme == "id"
+
+    layout.record(1234, "img", layout.path("img", 1234, ".png"))
+    layout.record(1234, "metadata", layout.path("metadata", 1234, ".json"))
+    layout.flush()
+    # 中断时写了一半的最后一行被忽略
+    with open(layout.manifest_path, 'a', encoding='UTF-8') as file:
+        file.write('{"5": {"img"')
+    assert lyt.load_manifest(tmp_path) == {1234: {"img": "img/00/12/1234.png", "metadata": "metadata/00/12/1234.json"}}
@@ -0,0 +1,39 @@
+import pytest
+
+import source.nft_dl as nft_dl
+import utils.downloading_toolbox as dtb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+COLLECTION_INFO = {"contract_address": "0xabc", "NFT_name": "Mock", "chain_type": "ethereum", "candidate_format": ".png",
+                   "total_supply": 3, "start_index": 0}
+
+
+class Fake_Aggregator(object):
+
+    created = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        Fake_Aggregator.created.append(self)
+
+    def load_task_plan(self, plan):
+        self.plan = plan
+
+    def download_media_and_metadata(self):
+        return True
+
+
+@pytest.mark.parametrize("platform, platforms", [(None, None), ("Aggregator", None), ("NFTScan", ["NFTScan"])])
+def test_run_gaps_platforms(tmp_path, monkeypatch, platform, platforms):
+    monkeypatch.setattr(ENV, "RE_DOWNLOAD_FILES_INFO_PATH", tmp_path)
+    monkeypatch.setattr(nft_dl, "load_collection_info", lambda args: COLLECTION_INFO)
+    monkeypatch.setattr(dtb, "NFT_Downloader_for_Whole_Collection_Aggregator", Fake_Aggregator)
+    Fake_Aggregator.created.clear()
+
+    args = nft_dl.build_parser().parse_args(["--save-path", str(tmp_path), "gaps", "0xabc"]
+                                            + (["--platform", platform] if platform else []))
+    assert nft_dl.run_gaps(args)
+    downloader, = Fake_Aggregator.created
+    assert downloader.kwargs["platforms"] == platforms
+    assert downloader.plan == {"ranges": [[0, 2]]}
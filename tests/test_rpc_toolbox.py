@@ -0,0 +1,106 @@
+import pytest
+
+import utils.rpc_toolbox as rpc
+from benchmarks.mock_server import abi_string, decode_aggregate3_calls, encode_aggregate3_results
+
+
+CONTRACT = "0x" + "ab" * 20
+
+
+def test_encode_call():
+    assert rpc.encode_call(rpc.TOKEN_URI_SELECTOR, 255) == rpc.TOKEN_URI_SELECTOR + "0" * 62 + "ff"
+    assert rpc.encode_call(rpc.URI_SELECTOR, "16") == rpc.URI_SELECTOR + "0" * 62 + "10"
+
+
+def test_decode_abi_string():
+    assert rpc.decode_abi_string("0x" + abi_string("ipfs://Qm/1").hex()) == "ipfs://Qm/1"
+    assert rpc.decode_abi_string(abi_string("")) == ""
+    # 数据太短或者长度超出范围时不是合法的 string
+    assert rpc.decode_abi_string("0x") is None
+    assert rpc.decode_abi_string(abi_string("ipfs://Qm/1")[:-32]) is None
+
+
+def test_decode_abi_string_rejects_malformed_hex():
+    with pytest.raises(ValueError):
+        rpc.decode_abi_string("0xzz")
+
+
+def test_encode_aggregate3():
+    call_data_list = [rpc.encode_call(rpc.TOKEN_URI_SELECTOR, token_id) for token_id in (1, 2, 3)]
+    data = bytes.fromhex(rpc.encode_aggregate3(CONTRACT, call_data_list)[2:])
+    assert data[:4].hex() == rpc.AGGREGATE3_SELECTOR[2:]
+    assert decode_aggregate3_calls(data[4:]) == [(CONTRACT, bytes.fromhex(call_data[2:])) for call_data in call_data_list]
+
+
+def test_decode_aggregate3():
+    results = [(True, abi_string("ipfs://Qm/1")), (False, b""), (True, b"\x01" * 33)]
+    assert rpc.decode_aggregate3("0x" + encode_aggregate3_results(results).hex()) == results
+    assert rpc.decode_aggregate3(encode_aggregate3_results([])) == []
+
+
+@pytest.mark.parametrize("data", ["0x", "0xzz", "0x" + "00" * 31 + "20" + "ff" * 32,
+                                  "0x" + encode_aggregate3_results([(True, b"\x01" * 64)]).hex()[:-64]])
+def test_decode_aggregate3_rejects_malformed_data(data):
+    with pytest.raises(ValueError):
+        rpc.decode_aggregate3(data)
+
+
+def test_parse_rpc_results():
+    body = [{"id": 1, "result": "0x01"},
+            {"id": 0, "error": {"code": 3, "message": "execution reverted"}},
+            {"id": 2, "error": {"code": -32000, "message": "execution reverted"}}]
+    assert rpc.parse_rpc_results(body, 3, raise_errors = True) == [None, "0x01", None]
+    assert not rpc.has_rpc_error(body)
+
+
+def test_parse_rpc_results_node_errors():
+    body = [{"id": 0, "result": "0x01"}, {"id": 1, "error": {"code": -32005, "message": "rate limit exceeded"}}]
+    assert rpc.has_rpc_error(body)
+    assert rpc.parse_rpc_results(body, 2) == ["0x01", None]
+    with pytest.raises(rpc.RPC_Error):
+        rpc.parse_rpc_results(body, 2, raise_errors = True)
+    # 缺少结果的调用同样按节点错误处理
+    with pytest.raises(rpc.RPC_Error):
+        rpc.parse_rpc_results(body[:1], 2, raise_errors = True)
+    with pytest.raises(rpc.RPC_Error):
+        rpc.parse_rpc_results("rate limited", 1, raise_errors = True)
+
+
+def test_resolve_uri():
+    assert rpc.resolve_uri("ipfs://ipfs/Qm/1", "https://gw/ipfs/") == (None, "https://gw/ipfs/Qm/1")
+    assert rpc.resolve_uri("ar://abc") == (None, "https://arweave.net/abc")
+    assert rpc.resolve_uri("data:application/json;base64,eyJhIjogMX0=") == ({"a": 1}, None)
+    assert rpc.resolve_uri("data:application/json,%7B%22a%22%3A%201%7D") == ({"a": 1}, None)
+    assert rpc.resolve_uri("data:application/json;base64,!!") == (None, None)
+
+
+@pytest.mark.parametrize("use_multicall", [False, True])
+def test_read_token_uris(mock_server, use_multicall):
+    reader = rpc.RPC_TokenURI_Reader(mock_server.rpc_url, CONTRACT, batch_size = 2, use_multicall = use_multicall, multicall_size = 3)
+    token_ids = [0, 1, 2, 19, 20, 25]
+    uri_dict = reader.read_token_uris(token_ids)
+    # 不存在的token revert，对应 None
+    assert uri_dict == {str(token_id): mock_server.state.metadata_url(token_id) if token_id < 20 else None for token_id in token_ids}
+
+
+def test_read_token_uris_erc1155(mock_server):
+    reader = rpc.RPC_TokenURI_Reader(mock_server.rpc_url, CONTRACT, token_type = "ERC1155")
+    assert reader.read_token_uris([5]) == {"5": mock_server.state.metadata_url(5)}
+
+
+@pytest.mark.parametrize("use_multicall", [False, True])
+def test_read_token_uris_node_error(mock_server, use_multicall):
+    reader = rpc.RPC_TokenURI_Reader(mock_server.rpc_url, CONTRACT, use_multicall = use_multicall)
+    with pytest.raises(rpc.RPC_Error):
+        reader.read_token_uris([12, 13, 14])
+
+
+def test_read_token_uris_unreachable():
+    reader = rpc.RPC_TokenURI_Reader("http://127.0.0.1:9/", CONTRACT, timeout = 5)
+    with pytest.raises(rpc.RPC_Error):
+        reader.read_token_uris([1])
+
+
+def test_send_rpc_batch(mock_server):
+    results = rpc.send_rpc_batch(mock_server.rpc_url, [("eth_blockNumber", []), ("eth_unknown", [])])
+    assert results == [hex(mock_server.state.config["block_number"]), None]
@@ -0,0 +1,48 @@
+import utils.spider_toolbox as stb
+
+
+class Fake_Clock(object):
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_rate_limiter_token_bucket(monkeypatch):
+    clock = Fake_Clock()
+    monkeypatch.setattr(stb.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(stb.time, "sleep", clock.sleep)
+    limiter = stb.Rate_Limiter(rate = 2, burst = 3)
+
+    # 桶满时连续取出 burst 个令牌不需要等待
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+    # 令牌用完后按速率等待
+    limiter.acquire()
+    assert clock.sleeps == [0.5]
+
+    # 空闲再久也最多积累 burst 个令牌
+    clock.now += 10
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.sleeps == [0.5]
+    limiter.acquire()
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_rate_limiter_share(monkeypatch):
+    monkeypatch.setattr(stb, "_RATE_LIMITERS", {})
+    monkeypatch.setattr(stb, "get_platform_profile", lambda platform: {"requests_per_second": 10, "burst_size": 4})
+    limiter = stb.get_rate_limiter("Mock", share = 0.25)
+    assert (limiter.rate, limiter.burst) == (2.5, 1)
+    # 只在第一次创建时按比例分配
+    assert stb.get_rate_limiter("Mock", share = 1.0) is limiter
@@ -0,0 +1,76 @@
+import pytest
+
+import utils.sync_toolbox as syt
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+CONTRACT = "0x" + "ab" * 20
+COLLECTION_INFO = {"contract_address": CONTRACT, "NFT_name": "Mock", "candidate_format": ".png",
+                   "total_supply": 20, "start_index": 0, "token_Type": "ERC721"}
+
+
+def word(value: int) -> str:
+    return format(value, "064x")
+
+
+def metadata_update(token_id: int, block = 15) -> dict:
+    return {"blockNumber": hex(block), "topics": [syt.METADATA_UPDATE_TOPIC], "data": "0x" + word(token_id)}
+
+
+def batch_metadata_update(from_id: int, to_id: int, block = 15) -> dict:
+    return {"blockNumber": hex(block), "topics": [syt.BATCH_METADATA_UPDATE_TOPIC], "data": "0x" + word(from_id) + word(to_id)}
+
+
+def transfer(from_topic: str, token_id: int, block = 15) -> dict:
+    return {"blockNumber": hex(block), "topics": [syt.TRANSFER_TOPIC, from_topic, "0x" + word(1), "0x" + word(token_id)], "data": "0x"}
+
+
+def test_parse_logs():
+    logs = [metadata_update(3), transfer(syt.ZERO_TOPIC, 7), transfer("0x" + word(2), 8), {"topics": []}]
+    assert syt.parse_logs(logs) == ({3, 7}, False)
+
+
+def test_parse_logs_batch_update():
+    assert syt.parse_logs([batch_metadata_update(2, 4)], total_supply = 20) == ({2, 3, 4}, False)
+    # 揭示时的全量更新事件被限制在项目的编号范围内
+    token_ids, full_refresh = syt.parse_logs([batch_metadata_update(0, 2 ** 256 - 1)], start_index = 1, total_supply = 5)
+    assert token_ids == {1, 2, 3, 4, 5} and full_refresh
+    assert syt.parse_logs([batch_metadata_update(2, 4)]) == (set(), True)
+
+
+@pytest.fixture
+def syncer(mock_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(ENV, "SYNC_STATE_PATH", tmp_path / "sync_state")
+    ENV.SYNC_STATE_PATH.mkdir()
+    syt.save_sync_state("ethereum", CONTRACT, 10)
+    yield syt.Incremental_Syncer("ethereum", rpc_url = mock_client.rpc_url, block_range = 4, ranges_per_batch = 3)
+    mock_client.state.config["logs"] = []
+
+
+def test_get_logs(syncer, mock_client):
+    logs = [metadata_update(1, block = 12), transfer(syt.ZERO_TOPIC, 2, block = 18), transfer("0x" + word(2), 3, block = 18),
+            metadata_update(4, block = 30)]
+    mock_client.state.config["logs"] = logs
+    assert syncer.get_logs(CONTRACT, 11, 20) == logs[:2]
+
+
+def test_sync_collection(syncer, mock_client, tmp_path):
+    mock_client.state.config["logs"] = [metadata_update(5)]
+    assert syncer.sync_collection(COLLECTION_INFO, tmp_path, latest_block = 20)
+    assert syt.load_sync_state("ethereum")[CONTRACT]["last_synced_block"] == 20
+    assert (tmp_path / "ethereum" / "Mock" / "metadata" / "5.json").exists()
+
+
+def test_sync_collection_keeps_block_on_failure(syncer, mock_client, tmp_path):
+    # 节点读取 13 的 tokenURI 时返回限流错误
+    mock_client.state.config["logs"] = [metadata_update(5), metadata_update(13)]
+    assert not syncer.sync_collection(COLLECTION_INFO, tmp_path, latest_block = 20)
+    assert syt.load_sync_state("ethereum")[CONTRACT]["last_synced_block"] == 10
+
+
+def test_sync_collection_unreachable_node(syncer, mock_client, tmp_path):
+    syncer.rpc_url = "http://127.0.0.1:9/"
+    syncer.sync_state = syt.load_sync_state("ethereum")
+    assert not syncer.sync_collection(COLLECTION_INFO, tmp_path)
+    assert not syncer.sync_collection(COLLECTION_INFO, tmp_path, latest_block = 20)
+    assert syt.load_sync_state("ethereum")[CONTRACT]["last_synced_block"] == 10
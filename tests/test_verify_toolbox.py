@@ -0,0 +1,94 @@
+import struct
+
+import pytest
+
+import utils.verify_toolbox as vtb
+from benchmarks.mock_server import make_png
+
+
+PNG = make_png(4096)
+JPEG = b"\xff\xd8\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9 + b"\xff\xda" + b"\x00" * 64 + b"\xff\xd9"
+
+
+@pytest.mark.parametrize("head, kind", [(PNG, "png"), (JPEG, "jpeg"), (b"GIF89a", "gif"), (b"RIFF\x00\x00\x00\x00WEBP", "webp"),
+                                        (b"\x00\x00\x00\x18ftypisom", "mp4"), (b"glTF", "glb"), (b"\xef\xbb\xbf<!DOCTYPE html>", "html"),
+                                        (b"  <svg ", "svg"), (b'\n{"a": 1}', "json"), (b"abc", "unknown")])
+def test_sniff_format(head, kind):
+    assert vtb.sniff_format(head[:64]) == kind
+
+
+@pytest.mark.parametrize("deep", [False, True])
+def test_check_png(deep):
+    assert vtb.check_content(PNG, ".png", deep) is None
+    assert vtb.check_content(PNG[:-20], ".png", deep) == "truncated"
+    assert vtb.check_content(PNG[:-4] + b"\x00\x00\x00\x00", ".png", deep) is not None
+
+
+def test_check_png_trailing_bytes():
+    # 快速检查在文件末尾附近查找 IEND，完整检查要求 IEND 在文件末尾
+    data = PNG + b"\x00" * 100
+    assert vtb.check_content(data, ".png", deep = False) is None
+    assert vtb.check_content(data, ".png", deep = True) == "100 bytes after IEND"
+    assert vtb.check_content(PNG + b"\x00" * (vtb.TAIL_SEARCH_SIZE + 1), ".png", deep = False) == "truncated"
+
+
+def test_check_png_corrupt_data():
+    position = PNG.index(b"IDAT") + 8
+    data = PNG[:position] + bytes([PNG[position] ^ 0xFF]) + PNG[position + 1:]
+    assert vtb.check_content(data, ".png") == "bad crc in IDAT chunk"
+
+
+@pytest.mark.parametrize("deep", [False, True])
+def test_check_jpeg(deep):
+    assert vtb.check_content(JPEG, ".jpg", deep) is None
+    assert vtb.check_content(JPEG[:-2], ".jpg", deep) == "truncated"
+
+
+def test_check_content_other_formats():
+    assert vtb.check_content(b"", ".png") == "empty file"
+    assert vtb.check_content(b"<html><body>502</body></html>", ".png") == "html instead of media"
+    assert vtb.check_content(b'{"name": "Mock #1"}', ".json") is None
+    assert vtb.check_content(b'{"name": "Mock', ".json").startswith("invalid json")
+    assert vtb.check_content(b"GIF89a" + b"\x00" * 32 + b";", ".gif") is None
+    assert vtb.check_content(b"GIF89a" + b"\x00" * 32, ".gif") == "truncated"
+    mp4 = struct.pack(">I", 16) + b"ftypisom" + b"\x00" * 4 + struct.pack(">I", 8) + b"mdat"
+    assert vtb.check_content(mp4, ".mp4") is None
+    assert vtb.check_content(mp4[:-2], ".mp4") == "truncated"
+
+
+def test_check_file(tmp_path):
+    file_path = tmp_path / "1.png"
+    file_path.write_bytes(PNG + b"\x00" * 100)
+    assert vtb.check_file(file_path, deep = False) is None
+    assert vtb.check_file(file_path) == "100 bytes after IEND"
+
+
+def make_collection(tmp_path):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "metadata" / "00").mkdir(parents = True)
+    for token_id, metadata in ((1, {"image": "ipfs://Qm/1.png"}), (2, {"image": "ipfs://Qm/2.png"}), (3, {"name": "no media"}),
+                               (4, {"image": ""})):
+        (tmp_path / "metadata" / "00" / f"{token_id}.json").write_text(vtb.json.dumps(metadata), encoding = "UTF-8")
+    (tmp_path / "metadata" / "5.json").write_text("{", encoding = "UTF-8")
+    (tmp_path / "img" / "1.png").write_bytes(PNG)
+    (tmp_path / "img" / "6.png").write_bytes(b"")
+    return tmp_path
+
+
+def test_scan_collection(tmp_path):
+    result = vtb.scan_collection(make_collection(tmp_path), list(range(8)))
+    assert result == {"missing_metadata": [0, 6, 7], "missing_media": [0, 2, 5, 7], "no_media": [3, 4], "empty_files": [6]}
+    # 没有媒体资源的token不需要重新下载
+    assert vtb.get_bad_token_ids(result) == [0, 2, 5, 6, 7]
+
+
+def test_verify_collection(tmp_path):
+    make_collection(tmp_path)
+    (tmp_path / "img" / "2.png").write_bytes(PNG[:-20])
+    result = vtb.verify_collection(tmp_path, list(range(8)), process_num = 1)
+    assert result["corrupt_metadata"] == [5]
+    assert result["corrupt_media"] == [2, 6]
+    assert result["no_media"] == [3, 4]
+    assert vtb.get_bad_token_ids(result) == [0, 2, 5, 6, 7]
+    # 没有问题的文件下次跳过，有问题的文件每次都重新检查
+    assert vtb.verify_collection(tmp_path, list(range(8)), process_num = 1)["errors"].keys() == result["errors"].keys()
@@ -0,0 +1,339 @@
+"""
+全局带宽控制
+
+所有下载都以数据块为单位经过同一个带宽控制器，总带宽在各个进程之间按权重分配，
+进程内再按 主机权重 × 任务权重 在正在下载的数据流之间公平分配。
+带宽配置保存在 bandwidth.json 中，修改后正在运行的任务会在一秒内生效，例如白天和夜间使用不同的上限：
+
+    {
+        "limit_bytes_per_second": 20971520,    # 总带宽上限，0 表示不限速
+        "chunk_size": 65536,                   # 每次读取的数据块大小
+        "hosts": {"ipfs.io": 0.5},             # 主机权重，默认为 1，0 或负数表示这个主机不受总带宽限制
+        "jobs": {"BoredApeYachtClub": 2},      # 任务（项目）权重，默认为 1，0 或负数表示这个任务不受总带宽限制
+        "job_limits": {"Azuki": 5242880}       # 单个任务在每个进程中的带宽上限，不受总带宽是否限速的影响
+    }
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.concurrency_toolbox as cct
+import utils.log_toolbox as ltb
+import utils.metrics_toolbox as mtb
+import utils.trace_toolbox as ttb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# 超过这个时间（秒）没有更新的进程权重文件视为已退出，超过 STALE_SECONDS 后删除
+ACTIVE_SECONDS = 10
+STALE_SECONDS = 60
+
+
+class Stream(object):
+    """一个正在进行的下载数据流"""
+
+    def __init__(self, host: str, job: str, weight: float):
+        self.host = host
+        self.job = job
+        self.weight = weight
+        self.next_time = time.monotonic()   # 按分配到的速率，下一个数据块最早可以读取的时间
+
+
+class Bandwidth_Governor(object):
+    """
+    进程内共用的带宽控制器
+    """
+
+    def __init__(self, config_path = None, share_path = None, reload_interval = 1.0):
+        """
+        Args:
+            config_path (Path): 带宽配置文件路径
+            share_path (Path): 各进程登记活跃权重的目录，用来在进程之间分配总带宽
+            reload_interval (float): 重新读取配置文件和其他进程权重的最短间隔（秒）
+        """
+        self.config_path = Path(config_path or ENV.BANDWIDTH_CONFIG_PATH)
+        self.share_path = Path(share_path or ENV.BANDWIDTH_LOGGING_PATH)
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.streams = set()
+        self.config = {}
+        self.config_mtime = None
+        self.process_share = 1.0
+        self.last_reload = 0.0
+        # 写过权重文件的进程，用于退出时删除
+        self.share_pid = None
+        # 每个任务累计接收的字节数，供界面计算各任务的下载速度
+        self.job_bytes = {}
+
+    @property
+    def limit(self) -> float:
+        return float(self.config.get("limit_bytes_per_second") or 0)
+
+    @property
+    def chunk_size(self) -> int:
+        return int(self.config.get("chunk_size") or DEFAULT_CHUNK_SIZE)
+
+    def get_job_limit(self, job: str) -> float:
+        return float((self.config.get("job_limits") or {}).get(job) or 0)
+
+    def get_weight(self, host: str, job: str) -> float:
+        """数据流的权重，主机或任务的权重不是正数时返回 0，表示不受总带宽限制"""
+        hosts = self.config.get("hosts") or {}
+        jobs = self.config.get("jobs") or {}
+        host_weight, job_weight = float(hosts.get(host, 1)), float(jobs.get(job, 1))
+        if host_weight <= 0 or job_weight <= 0:
+            return 0.0
+        return host_weight * job_weight
+
+    def reload(self, force = False) -> None:
+        """配置文件发生变化时重新读取，同时登记本进程的活跃权重并计算本进程分到的带宽比例"""
+        now = time.monotonic()
+        if not force and now - self.last_reload < self.reload_interval:
+            return
+        self.last_reload = now
+
+        try:
+            mtime = self.config_path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self.config_mtime:
+            self.config_mtime = mtime
+            try:
+                with open(self.config_path, 'r', encoding='UTF-8') as file:
+                    self.config = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                self.config = {}
+            for stream in self.streams:
+                stream.weight = self.get_weight(stream.host, stream.job)
+
+        if self.limit <= 0:
+            self.process_share = 1.0
+            return
+
+        # 每个进程写入自己的活跃权重，按权重比例分配总带宽，超过 10 秒没有更新的进程视为已退出
+        own_weight = sum(stream.weight for stream in self.streams)
+        try:
+            with open(self.share_path / f"{os.getpid()}.json", 'w', encoding='UTF-8') as file:
+                json.dump({"time": time.time(), "weight": own_weight}, file)
+            if self.share_pid != os.getpid():
+                self.share_pid = os.getpid()
+                atexit.register(self.remove_share)
+        except OSError:
+            pass
+        total_weight = own_weight
+        for file_path in self.share_path.glob("*.json"):
+            if file_path.stem == str(os.getpid()):
+                continue
+            try:
+                with open(file_path, 'r', encoding='UTF-8') as file:
+                    share = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                continue
+            age = time.time() - share.get("time", 0)
+            if age <= ACTIVE_SECONDS:
+                total_weight += share.get("weight", 0)
+            elif age > STALE_SECONDS:
+                # mp.Pool 结束子进程时不会执行退出函数，由其他进程删除它们留下的文件
+                try:
+                    file_path.unlink()
+                except OSError:
+                    pass
+        self.process_share = own_weight / total_weight if total_weight > 0 else 1.0
+
+    def remove_share(self) -> None:
+        """进程退出时删除自己的权重文件，fork 出的子进程不删除父进程的文件"""
+        if self.share_pid != os.getpid():
+            return
+        try:
+            (self.share_path / f"{os.getpid()}.json").unlink()
+        except OSError:
+            pass
+
+    def open_stream(self, host: str, job = None) -> Stream:
+        with self.lock:
+            self.reload()
+            stream = Stream(host, job, self.get_weight(host, job))
+            self.streams.add(stream)
+            return stream
+
+    def close_stream(self, stream: Stream) -> None:
+        with self.lock:
+            self.streams.discard(stream)
+
+    def job_snapshot(self) -> dict:
+        """
+        各个任务的累计字节数和正在进行的下载数
+
+        Returns:
+            dict: key 为任务名称，value 为 {"bytes": int, "streams": int}
+        """
+        with self.lock:
+            snapshot = {job: {"bytes": nbytes, "streams": 0} for job, nbytes in self.job_bytes.items()}
+            for stream in self.streams:
+                snapshot.setdefault(stream.job, {"bytes": 0, "streams": 0})["streams"] += 1
+            return snapshot
+
+    def consume(self, stream: Stream, nbytes: int) -> None:
+        """
+        读取了 nbytes 字节后调用，按照数据流分到的速率等待
+
+        数据流的速率 = 总带宽 × 本进程比例 × 数据流权重 / 本进程所有活跃数据流的权重之和，
+        任务设置了单独的上限时，再由这个任务的所有活跃数据流平分
+        """
+        with self.lock:
+            self.job_bytes[stream.job] = self.job_bytes.get(stream.job, 0) + nbytes
+            self.reload()
+            rate = None
+            # 权重为 0 的数据流不参与总带宽分配，也不占用其他数据流的份额
+            if self.limit > 0 and stream.weight > 0:
+                total_weight = sum(item.weight for item in self.streams) or 1.0
+                rate = self.limit * self.process_share * stream.weight / total_weight
+            if job_limit := self.get_job_limit(stream.job):
+                job_streams = sum(1 for item in self.streams if item.job == stream.job) or 1
+                rate = min(rate or job_limit, job_limit / job_streams)
+            if rate is None:
+                return
+            now = time.monotonic()
+            # 空闲过的数据流不能积攒额度，最多只允许一个数据块的突发
+            stream.next_time = max(stream.next_time, now) + nbytes / max(rate, 1.0)
+            delay = stream.next_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+_GOVERNOR = None
+_GOVERNOR_LOCK = threading.Lock()
+
+
+def get_governor() -> Bandwidth_Governor:
+    """获取当前进程共用的带宽控制器"""
+    global _GOVERNOR
+    with _GOVERNOR_LOCK:
+        if _GOVERNOR is None:
+            _GOVERNOR = Bandwidth_Governor()
+        return _GOVERNOR
+
+
+def load_bandwidth_config() -> dict:
+    config_path = Path(ENV.BANDWIDTH_CONFIG_PATH)
+    if not config_path.exists():
+        return {}
+    with open(config_path, 'r', encoding='UTF-8') as file:
+        return json.load(file)
+
+
+def save_bandwidth_config(config: dict) -> None:
+    # 先写临时文件再替换，避免其他进程读到写了一半的配置
+    config_path = Path(ENV.BANDWIDTH_CONFIG_PATH)
+    temp_path = config_path.with_suffix(".tmp")
+    with open(temp_path, 'w', encoding='UTF-8') as file:
+        json.dump(config, file, indent=4)
+    os.replace(temp_path, config_path)
+
+
+def set_bandwidth_limit(limit_bytes_per_second: int, hosts = None, jobs = None) -> None:
+    """
+    修改带宽配置文件，所有正在运行的任务会在下一次重新读取配置时生效
+
+    Args:
+        limit_bytes_per_second (int): 总带宽上限，0 表示不限速
+        hosts (dict): 主机权重，为 None 时保留原配置
+        jobs (dict): 任务权重，为 None 时保留原配置
+    """
+    config = load_bandwidth_config()
+    config["limit_bytes_per_second"] = limit_bytes_per_second
+    if hosts is not None:
+        config["hosts"] = hosts
+    if jobs is not None:
+        config["jobs"] = jobs
+    save_bandwidth_config(config)
+
+
+def set_job_bandwidth_limit(job: str, limit_bytes_per_second: int) -> None:
+    """
+    修改单个任务的带宽上限，正在运行的任务会在下一次重新读取配置时生效
+
+    Args:
+        job (str): 任务名称，与 stream_download 的 job 参数一致
+        limit_bytes_per_second (int): 带宽上限，0 表示取消单独的上限
+    """
+    config = load_bandwidth_config()
+    job_limits = config.setdefault("job_limits", {})
+    if limit_bytes_per_second:
+        job_limits[job] = limit_bytes_per_second
+    else:
+        job_limits.pop(job, None)
+    save_bandwidth_config(config)
+
+
+def stream_download(url: str, file_path, job = None, session = None, timeout = 60, validate = None, slot = None) -> int:
+    """
+    以数据块为单位下载文件，每个数据块都经过全局带宽控制器
+
+    先写入临时文件，下载完成后再改名，中断的下载不会留下不完整的文件。
+    接收的字节数与 Content-Length 不一致，或者 validate 返回问题描述时抛出 IOError，临时文件会被删除
+
+    Args:
+        url (str): 下载链接
+        file_path (Path): 保存路径
+        job (str): 任务名称，用于按任务分配带宽
+        session (requests.Session): 复用连接的会话
+        timeout (int): 连接和读取的超时时间（秒）
+        validate (callable): 检查下载内容的函数，参数为临时文件路径和保存路径的扩展名，没有问题时返回 None
+        slot (dict): AIMD 控制器的并发位置，收到响应头时记录首字节延迟
+
+    Returns:
+        int: 下载的字节数
+    """
+    governor = get_governor()
+    file_path = Path(file_path)
+    temp_path = file_path.with_name(file_path.name + ".part")
+    stream = governor.open_stream(cct.get_host(url), job)
+    nbytes = 0
+    write_seconds = 0.0
+    try:
+        with (session or requests).get(url, stream=True, timeout=timeout) as response:
+            if slot is not None:
+                # stream=True 时 elapsed 是从发出请求到解析完响应头的耗时，不包含传输和限速等待
+                slot["latency"] = response.elapsed.total_seconds()
+            # 状态码会出现在异常信息中，AIMD 控制器据此判断是否被限流
+            response.raise_for_status()
+            with open(temp_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=governor.chunk_size):
+                    if not chunk:
+                        continue
+                    begin = time.perf_counter()
+                    file.write(chunk)
+                    write_seconds += time.perf_counter() - begin
+                    nbytes += len(chunk)
+                    governor.consume(stream, len(chunk))
+            # 压缩传输时 Content-Length 是压缩后的大小，无法和解压后的字节数比较
+            expected = response.headers.get("Content-Length")
+            if expected and response.headers.get("Content-Encoding", "identity") == "identity" and int(expected) != nbytes:
+                raise IOError(f"Truncated download: received {nbytes} of {expected} bytes")
+        if validate is not None and (error := validate(temp_path, suffix = file_path.suffix)):
+            raise IOError(f"Invalid content: {error}")
+        begin = time.perf_counter()
+        os.replace(temp_path, file_path)
+        # 写盘耗时单独记录，用来区分网络和磁盘瓶颈
+        write_seconds += time.perf_counter() - begin
+        mtb.get_registry().record("disk_write", None, "local", "ok", write_seconds, nbytes)
+        ltb.add_progress_bytes(nbytes)
+        # 写盘分散在各个数据块之间，追踪中记录为结束前的一段累计耗时
+        ttb.get_tracer().add_span("disk_write", ttb.now_us() - int(write_seconds * 1e6), int(write_seconds * 1e6), bytes = nbytes)
+    finally:
+        governor.close_stream(stream)
+        if temp_path.exists():
+            temp_path.unlink()
+    return nbytes
@@ -0,0 +1,295 @@
+"""
+多项目批量下载
+
+从任务文件中读取 (chain_type, contract_address, platform) 列表，所有项目在同一个进程中共用连接池、
+平台限速器、并发控制器和带宽控制器。工作线程按页在项目之间轮流调度，并且优先启动供应量小的项目，
+小项目可以很快完成，不会排在一个十万级别的项目后面。
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.discovery_toolbox as dst
+import utils.downloading_toolbox as dtb
+import utils.file_io as fio
+import utils.log_toolbox as ltb
+import utils.spider_toolbox as stb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+def load_collection_info(contract_address: str, chain_type = "ethereum") -> dict:
+    """
+    读取项目信息，本地没有记录时请求平台接口并保存到 {chain_type}_target_collection_info.json
+
+    Args:
+        contract_address (str): 合约地址
+        chain_type (str): 区块链类型
+
+    Returns:
+        dict: 项目信息，查询失败时返回 None
+    """
+    target_collection_path = ENV.INFO_PATH / f"{chain_type}_target_collection_info.json"
+    target_collection_info = fio.load_json(target_collection_path) if target_collection_path.exists() else None
+    target_collection_info = target_collection_info or {}
+    if contract_address not in target_collection_info:
+        collection_info = stb.get_target_collection_info(chain_type = chain_type, contract_address = contract_address)
+        if collection_info is None:
+            return None
+        target_collection_info[contract_address] = collection_info
+        fio.save_json(target_collection_path, target_collection_info)
+    return target_collection_info[contract_address]
+
+
+def load_job_list(file_path) -> list:
+    """
+    读取批量任务文件
+
+    支持两种格式：
+        1. json 文件：[{"chain_type": ..., "contract_address": ..., "platform": ...}, ...] 或 [[chain_type, contract_address, platform], ...]
+        2. 文本文件：每行一个任务，字段之间用逗号或空白分隔，# 开头的行为注释
+
+    platform 可以省略，省略时使用第一个支持该区块链并且配置了API密钥的平台
+
+    Args:
+        file_path (Path): 任务文件路径
+
+    Returns:
+        list: [{"chain_type": str, "contract_address": str, "platform": str | None}, ...]
+    """
+    file_path = Path(file_path)
+    if file_path.suffix == ".json":
+        with open(file_path, 'r', encoding='UTF-8') as file:
+            items = json.load(file)
+    else:
+        items = []
+        with open(file_path, 'r', encoding='UTF-8') as file:
+            for line in file:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    items.append(line.replace(",", " ").split())
+
+    job_list = []
+    for item in items:
+        if isinstance(item, dict):
+            chain_type, contract_address, platform = item["chain_type"], item["contract_address"], item.get("platform")
+        else:
+            chain_type, contract_address, platform = (list(item) + [None])[:3]
+        job_list.append({"chain_type": chain_type.lower(),
+                        "contract_address": contract_address.strip(),
+                        "platform": platform})
+    return job_list
+
+
+def get_downloader_class(platform, chain_type = "ethereum"):
+    """
+    获取平台对应的下载器类
+
+    Args:
+        platform (str): 平台名称，RPC 表示直接通过 JSON-RPC 节点下载，Aggregator 表示同时使用所有已配置API密钥的平台，为 None 时使用第一个支持该区块链并且配置了API密钥的平台
+        chain_type (str): 区块链类型
+
+    Returns:
+        type: 下载器类
+    """
+    if platform is None:
+        configured = stb.get_configured_platforms(chain_type)
+        if not configured:
+            raise ValueError(f"No platform with API keys supports {chain_type}.")
+        platform = configured[0]
+    if platform == "RPC":
+        return dtb.NFT_Downloader_for_Whole_Collection_RPC
+    if platform == "Aggregator":
+        return dtb.NFT_Downloader_for_Whole_Collection_Aggregator
+    if platform in dtb.PLATFORM_DOWNLOADERS:
+        return dtb.PLATFORM_DOWNLOADERS[platform]
+    raise ValueError(f"Platform {platform} not supported!")
+
+
+def create_downloader(collection_info: dict, platform = None, save_path = ENV.DATASET_PATH, process_num = 1, thread_num = 4):
+    """
+    按项目信息创建下载器，项目信息中有探测出的tokenId布局时只下载存在的token
+
+    Args:
+        collection_info (dict): load_collection_info 的返回值
+        platform (str): 平台名称，参考 get_downloader_class
+        save_path (Path): 数据保存路径
+        process_num (int): 进程数
+        thread_num (int): 每个进程的线程数
+
+    Returns:
+        NFT_Downloader_for_Whole_Collection: 下载器
+    """
+    downloader_class = get_downloader_class(platform, collection_info["chain_type"])
+    downloader = downloader_class(chain_type = collection_info["chain_type"],
+                                NFT_name = collection_info["NFT_name"],
+                                contract_address = collection_info["contract_address"],
+                                candidate_format = collection_info["candidate_format"],
+                                save_path = save_path,
+                                process_num = process_num,
+                                thread_num = thread_num,
+                                total_supply = collection_info["total_supply"],
+                                start_index = collection_info["start_index"])
+    if hasattr(downloader, "load_task_plan") and (token_space := dst.load_token_space(collection_info)):
+        downloader.load_task_plan(token_space)
+    return downloader
+
+
+class Batch_Job(object):
+    """批量下载中的单个项目"""
+
+    def __init__(self, chain_type: str, contract_address: str, platform = None):
+        self.chain_type = chain_type
+        self.contract_address = contract_address
+        self.platform = platform
+        self.collection_info = None
+        self.downloader = None
+        self.pages = None
+        self.page_count = 0
+        # 本次运行中metadata和媒体文件都已经保存的token数量，以及下载失败的tokenId
+        self.saved = 0
+        self.failed = set()
+        self.success = None
+
+    @property
+    def size(self) -> int:
+        """用于调度排序的项目规模，未知时视为 10000"""
+        if self.collection_info is None:
+            return 10000
+        token_space = self.collection_info.get("token_space") or {}
+        return token_space.get("token_count") or self.collection_info.get("total_supply") or 10000
+
+    def start(self, save_path, thread_num: int) -> None:
+        """创建下载器并开始按页迭代"""
+        if self.collection_info is None:
+            self.collection_info = load_collection_info(self.contract_address, self.chain_type)
+            if self.collection_info is None:
+                raise ValueError(f"Collection {self.contract_address} not found on {self.chain_type}.")
+
+        self.downloader = create_downloader(self.collection_info, self.platform, save_path, process_num = 1, thread_num = thread_num)
+        self.pages = self.downloader.iter_pages()
+
+    def record_page(self, response_data: list, saved: set) -> None:
+        """
+        统计下载完的一页
+
+        Args:
+            response_data (list): 这一页的 Token_Record 列表
+            saved (set): process_response_data 返回的已经保存的tokenId
+        """
+        self.page_count += 1
+        self.saved += len(saved)
+        self.failed.update(record.token_id for record in response_data if record.token_id not in saved)
+        # 之前失败的token在后面的页中保存成功时不再算失败
+        self.failed.difference_update(saved)
+
+
+class Batch_Runner(object):
+    """
+    多项目批量下载器
+
+    每个工作线程每次从就绪队列的队首取出一个项目，只下载它的一页，然后把它放回队尾。
+    同一个项目同一时刻只会被一个线程处理，所有项目共用进程内的连接池、限速器和控制器。
+    """
+
+    def __init__(self, job_list: list, save_path = ENV.DATASET_PATH, worker_num = 8, thread_num = 4, max_active_jobs = None):
+        """
+        Args:
+            job_list (list): load_job_list 的返回值
+            save_path (Path): 数据保存路径
+            worker_num (int): 同时下载页面的工作线程数，所有项目共用
+            thread_num (int): 每页media和metadata下载的初始并发数，实际并发由 AIMD 控制器调整
+            max_active_jobs (int): 同时处于下载状态的最大项目数，默认为 worker_num 的两倍
+        """
+        self.save_path = Path(save_path)
+        self.worker_num = worker_num
+        self.thread_num = thread_num
+        self.max_active_jobs = max_active_jobs or worker_num * 2
+        self.jobs = [Batch_Job(**job) for job in job_list]
+        self.waiting = deque()
+        self.ready = deque()
+        self.running = 0
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def prepare(self) -> None:
+        """读取本地已记录的项目信息，按项目规模从小到大排队"""
+        for job in self.jobs:
+            target_collection_path = ENV.INFO_PATH / f"{job.chain_type}_target_collection_info.json"
+            if target_collection_path.exists():
+                job.collection_info = (fio.load_json(target_collection_path) or {}).get(job.contract_address)
+        self.waiting = deque(sorted(self.jobs, key = lambda job: job.size))
+
+    def next_job(self):
+        """获取下一个需要处理的项目，所有项目都完成时返回 None"""
+        with self.condition:
+            while True:
+                while self.waiting and self.active < self.max_active_jobs:
+                    self.ready.append(self.waiting.popleft())
+                    self.active += 1
+                if self.ready:
+                    self.running += 1
+                    return self.ready.popleft()
+                if self.running == 0 and not self.waiting:
+                    return None
+                self.condition.wait()
+
+    def finish_turn(self, job: Batch_Job, done: bool) -> None:
+        with self.condition:
+            self.running -= 1
+            if done:
+                self.active -= 1
+            else:
+                self.ready.append(job)
+            self.condition.notify_all()
+
+    def worker(self) -> None:
+        while (job := self.next_job()) is not None:
+            done = True
+            try:
+                if job.pages is None:
+                    job.start(self.save_path, self.thread_num)
+                    ltb.get_logger().info(f"**********  ## {job.downloader.NFT_name} ## Start downloading... **********")
+                response_data = next(job.pages)
+                job.record_page(response_data, job.downloader.process_response_data(response_data))
+                done = False
+            except StopIteration:
+                # 有token下载失败时项目只完成了一部分，按失败处理，重新运行时再下载
+                job.success = not job.failed
+                if job.success:
+                    ltb.get_logger().info(f"**********  ## {job.downloader.NFT_name} ## Download successfully! {job.page_count} pages **********")
+                else:
+                    ltb.get_logger().error(f"Error downloading: {job.downloader.NFT_name} partially downloaded, {len(job.failed)} of "
+                                        f"{job.saved + len(job.failed)} tokens failed, e.g. {sorted(job.failed)[:10]}")
+            except Exception as e:
+                job.success = False
+                ltb.get_logger().error(f"Error downloading: {job.contract_address} on {job.chain_type}: {e}")
+            finally:
+                self.finish_turn(job, done)
+
+    def run(self) -> dict:
+        """
+        下载全部项目
+
+        Returns:
+            dict: key 为合约地址，value 为是否下载成功，有token下载失败的项目为 False
+        """
+        self.prepare()
+        begin = time.time()
+        # 所有项目共用一个进度，输出量不随项目数量增长
+        with ltb.progress("batch", sum(job.size for job in self.jobs)):
+            threads = [threading.Thread(target = self.worker, daemon = True) for _ in range(self.worker_num)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        partial = sum(1 for job in self.jobs if not job.success and job.saved)
+        ltb.get_logger().info(f"Batch finished: {sum(bool(job.success) for job in self.jobs)}/{len(self.jobs)} collections, "
+                            f"{partial} partial, in {time.time() - begin:.1f}s")
+        return {job.contract_address: bool(job.success) for job in self.jobs}
@@ -0,0 +1,266 @@
+"""
+平台接口响应的磁盘缓存
+
+修改解析逻辑或者输出格式后重新处理一个项目时，不需要再次请求平台接口：
+    NFT_DL_CACHE        off（默认）不使用缓存
+                        on      先读缓存，没有或过期时请求接口并写入缓存
+                        refresh 总是请求接口，并用新的响应覆盖缓存
+                        replay  离线回放，只读缓存且不检查有效期，缓存中没有的请求抛出 Cache_Miss_Error，不会发出任何接口请求
+    NFT_DL_CACHE_TTL    缓存有效期（秒），默认 7 天，replay 模式下不检查
+
+缓存的键由 请求方法、规范化的链接（参数排序、去掉默认端口）、params 和 json 请求体 计算，
+链接和参数中出现的 API 密钥会被替换成占位符，更换密钥或者多个密钥轮换使用时依然命中，缓存文件中也不保存密钥。
+只缓存状态码为 200 的响应，每个响应 gzip 压缩后保存在 ENV.CACHE_PATH / {平台} / {键的前两位} / {键}.gz。
+replay 模式下不再按平台速率等待；on 模式下命中缓存的请求仍然会等待，只重新处理已经缓存的项目时使用 replay 最快。
+
+回放能否命中取决于请求参数是否与写入缓存时一致，需要使用相同的项目信息（start_index、total_supply、探测出的分段计划）：
+    Alchemy     开启缓存时按 interval_length 的固定网格切分分段且不再动态切分，每页的 startToken / limit 与进程数和完成顺序无关
+    RPC         只缓存 tokenURI 批量请求，且响应中包含错误条目时不写入缓存；区块高度、日志和探测请求总是实时发出，replay 模式下需要联网
+    Aggregator  多个平台同时下载时，每个平台领取的批次取决于完成顺序，回放时可能未命中，需要回放时只使用一个平台
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+import urllib.parse
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.file_io as fio
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+CACHE_ENV = "NFT_DL_CACHE"
+CACHE_TTL_ENV = "NFT_DL_CACHE_TTL"
+CACHE_MODES = ("off", "on", "refresh", "replay")
+DEFAULT_TTL = 7 * 24 * 3600
+
+# 缓存中保留的响应头
+KEPT_HEADERS = ("Content-Type",)
+
+
+class Cache_Miss_Error(Exception):
+    """replay 模式下请求的响应不在缓存中"""
+    pass
+
+
+def get_mode() -> str:
+    mode = os.environ.get(CACHE_ENV, "off").lower()
+    return mode if mode in CACHE_MODES else "off"
+
+
+def is_enabled() -> bool:
+    return get_mode() != "off"
+
+
+def is_replay() -> bool:
+    return get_mode() == "replay"
+
+
+def enable_cache(mode = "on", ttl = None) -> None:
+    """开启缓存，之后创建的子进程也会开启"""
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode {mode}, expected one of {', '.join(CACHE_MODES)}.")
+    os.environ[CACHE_ENV] = mode
+    if ttl is not None:
+        os.environ[CACHE_TTL_ENV] = str(ttl)
+
+
+class Cached_Response(object):
+    """
+    从缓存中读出的响应，提供下载器用到的 requests.Response 属性
+    """
+
+    def __init__(self, url: str, status_code: int, headers: dict, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = True
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('UTF-8', errors = 'replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class Response_Cache(object):
+    """
+    磁盘上的响应缓存，只保存配置，多个进程可以同时读写
+    """
+
+    def __init__(self, cache_path = None, mode = "on", ttl = DEFAULT_TTL):
+        """
+        Args:
+            cache_path (Path): 缓存文件夹，默认为 ENV.CACHE_PATH
+            mode (str): on、refresh 或 replay
+            ttl (float): 缓存有效期（秒）
+        """
+        self.cache_path = Path(cache_path or ENV.CACHE_PATH)
+        self.mode = mode
+        self.ttl = ttl
+        self.secrets = load_secrets()
+
+    def redact(self, text: str) -> str:
+        for secret in self.secrets:
+            if secret in text:
+                text = text.replace(secret, "{API_KEY}")
+        return text
+
+    def normalize_url(self, url: str, params = None) -> str:
+        """规范化链接：主机名小写、去掉默认端口、合并并排序查询参数、替换 API 密钥"""
+        parts = urllib.parse.urlsplit(url)
+        netloc = parts.netloc.lower()
+        if (parts.scheme, parts.port) in (("https", 443), ("http", 80)):
+            netloc = netloc.rsplit(":", 1)[0]
+        query = urllib.parse.parse_qsl(parts.query, keep_blank_values = True)
+        if params:
+            query += [(str(key), str(value)) for key, value in (params.items() if isinstance(params, dict) else params)
+                        if value is not None]
+        query = urllib.parse.urlencode(sorted(query))
+        return self.redact(urllib.parse.urlunsplit((parts.scheme.lower(), netloc, parts.path or "/", query, "")))
+
+    def make_key(self, method: str, url: str, params = None, payload = None) -> tuple:
+        """
+        计算缓存的键
+
+        Returns:
+            tuple: (键, 规范化的请求描述)
+        """
+        request = {"method": method.upper(), "url": self.normalize_url(url, params)}
+        if payload is not None:
+            request["payload"] = json.loads(self.redact(json.dumps(payload, sort_keys = True, ensure_ascii = False)))
+        key = hashlib.sha256(json.dumps(request, sort_keys = True, ensure_ascii = False).encode('UTF-8')).hexdigest()
+        return key, request
+
+    def get_path(self, namespace: str, key: str) -> Path:
+        return self.cache_path / (namespace or "default") / key[:2] / f"{key}.gz"
+
+    def load(self, namespace: str, key: str):
+        """
+        读取缓存的响应
+
+        Returns:
+            Cached_Response: 缓存的响应，不存在、过期或者 refresh 模式下返回 None
+        """
+        if self.mode == "refresh":
+            return None
+        file_path = self.get_path(namespace, key)
+        try:
+            with gzip.open(file_path, 'rb') as file:
+                header = json.loads(file.readline())
+                content = file.read()
+        except (OSError, EOFError, ValueError):
+            # 不存在或者写入中断的缓存文件都按没有缓存处理
+            return None
+        if self.mode != "replay" and time.time() - header["time"] > self.ttl:
+            return None
+        return Cached_Response(header["request"]["url"], header["status"], header["headers"], content)
+
+    def store(self, namespace: str, key: str, request: dict, response) -> None:
+        """保存状态码为 200 的响应，先写临时文件再改名，读取的进程不会读到一半的文件"""
+        if response.status_code != 200:
+            return
+        file_path = self.get_path(namespace, key)
+        fio.check_dir(file_path.parent)
+        header = {"request": request,
+                    "status": response.status_code,
+                    "headers": {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+                    "time": time.time()}
+        temp_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+        try:
+            with gzip.open(temp_path, 'wb', compresslevel = 6) as file:
+                file.write(json.dumps(header, ensure_ascii = False).encode('UTF-8') + b"\n")
+                file.write(response.content)
+            os.replace(temp_path, file_path)
+        except OSError:
+            if temp_path.exists():
+                temp_path.unlink()
+            raise
+
+    def fetch(self, namespace: str, method: str, url: str, send, params = None, payload = None, cacheable = None):
+        """
+        先读缓存，没有时调用 send() 发出请求并写入缓存
+
+        Args:
+            namespace (str): 平台名称，不同平台的缓存分开保存
+            method (str): 请求方法
+            url (str): 请求链接
+            send (callable): 没有参数，发出请求并返回响应
+            params (dict): 查询参数
+            payload: json 请求体
+            cacheable (callable): 参数为响应，返回 False 时不写入缓存，例如带有出错调用的 JSON-RPC batch 响应
+
+        Returns:
+            tuple: (响应, 是否来自缓存)
+        """
+        key, request = self.make_key(method, url, params, payload)
+        if (cached := self.load(namespace, key)) is not None:
+            return cached, True
+        if self.mode == "replay":
+            raise Cache_Miss_Error(f"{namespace} {request['method']} {request['url']} is not in the response cache.")
+        response = send()
+        if cacheable is None or cacheable(response):
+            self.store(namespace, key, request, response)
+        return response, False
+
+
+def load_secrets() -> list:
+    """读取 api_keys.json 中的所有密钥，用于从缓存的键中去掉密钥"""
+    if not ENV.API_KEYS_PATH.exists():
+        return []
+    secrets = []
+
+    def collect(value):
+        if isinstance(value, str):
+            if "://" in value:
+                # RPC 节点地址的路径和参数中带有密钥，例如 https://eth-mainnet.g.alchemy.com/v2/{密钥}
+                parts = urllib.parse.urlsplit(value)
+                candidates = parts.path.split("/") + [item for _, item in urllib.parse.parse_qsl(parts.query)]
+            else:
+                candidates = [value]
+            # 较短的配置不是密钥
+            secrets.extend(item for item in candidates if len(item) >= 16)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    collect(fio.load_json(ENV.API_KEYS_PATH))
+    # 先替换较长的密钥，避免一个密钥是另一个密钥的一部分时只替换一半
+    return sorted(set(secrets), key = len, reverse = True)
+
+
+_CACHE = None
+
+
+def get_cache():
+    """
+    获取当前配置的响应缓存
+
+    Returns:
+        Response_Cache: 没有开启缓存时返回 None
+    """
+    global _CACHE
+    mode = get_mode()
+    if mode == "off":
+        return None
+    ttl = float(os.environ.get(CACHE_TTL_ENV, DEFAULT_TTL))
+    if _CACHE is None or _CACHE.mode != mode or _CACHE.ttl != ttl:
+        _CACHE = Response_Cache(mode = mode, ttl = ttl)
+    return _CACHE
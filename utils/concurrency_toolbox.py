@@ -0,0 +1,307 @@
+"""
+按主机自适应调整并发数的 AIMD 控制器
+
+吞吐量持续提升并且错误率、延迟保持平稳时，每个观察窗口把并发上限加一；
+遇到 429、超时或者延迟突增时，把并发上限乘以一个小于 1 的系数。
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+# 被视为拥塞信号的状态码
+CONGESTION_STATUS = {408, 429, 502, 503, 504}
+
+# 超过这个时间（秒）没有更新的快照文件属于已经退出的进程，会被删除
+STALE_SECONDS = 60
+
+
+def get_host(url: str) -> str:
+    """获取链接中的主机名"""
+    return urlparse(url).netloc or url
+
+
+def is_congestion_error(error) -> bool:
+    """根据异常信息判断是否是限流或超时"""
+    message = str(error).lower()
+    return "429" in message or "timed out" in message or "timeout" in message or "too many requests" in message
+
+
+class Host_State(object):
+    """单个主机的并发状态"""
+
+    def __init__(self, initial_limit: float):
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.latency = None            # 延迟的指数加权平均值（秒）
+        self.base_latency = None       # 观察到的最低平均延迟，作为延迟是否突增的基准
+        self.window_start = time.monotonic()
+        self.window_done = 0
+        self.window_errors = 0
+        self.window_bytes = 0
+        self.last_throughput = 0.0     # 上一个窗口的吞吐量（次/秒）
+        self.last_decrease = 0.0
+        self.total_done = 0
+        self.total_errors = 0
+        self.total_bytes = 0
+
+
+class AIMD_Controller(object):
+    """
+    按主机区分的 AIMD 并发控制器，同一进程内的所有下载线程共用
+    """
+
+    def __init__(self,
+                initial_limit = 4,
+                min_limit = 1,
+                max_limit = 64,
+                decrease_factor = 0.5,
+                latency_factor = 2.0,
+                window = 2.0):
+        """
+        Args:
+            initial_limit (int): 每个主机的初始并发数
+            min_limit (int): 最小并发数
+            max_limit (int): 最大并发数
+            decrease_factor (float): 遇到拥塞时的乘性减小系数
+            latency_factor (float): 平均延迟超过基准延迟的多少倍视为延迟突增
+            window (float): 观察窗口长度（秒）
+        """
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.window = window
+        self.hosts = {}
+        self.condition = threading.Condition()
+        self.last_dump = 0.0
+        # 写入快照文件的进程，fork 出的子进程会写入自己的文件
+        self.dump_pid = None
+
+    def _state(self, host: str) -> Host_State:
+        if host not in self.hosts:
+            self.hosts[host] = Host_State(self.initial_limit)
+        return self.hosts[host]
+
+    def acquire(self, host: str) -> None:
+        """等待主机的并发数低于上限后占用一个并发位置"""
+        with self.condition:
+            state = self._state(host)
+            while state.in_flight >= int(state.limit):
+                self.condition.wait()
+            state.in_flight += 1
+
+    def release(self, host: str, success: bool, latency: float, congested = False, nbytes = 0) -> None:
+        """
+        释放并发位置，并根据本次请求的结果调整并发上限
+
+        Args:
+            host (str): 主机名
+            success (bool): 请求是否成功
+            latency (float): 收到响应头的耗时（秒）
+            congested (bool): 是否遇到 429、超时等拥塞信号
+            nbytes (int): 接收的字节数
+        """
+        with self.condition:
+            state = self._state(host)
+            state.in_flight -= 1
+            now = time.monotonic()
+
+            if success:
+                state.window_done += 1
+                state.window_bytes += nbytes
+                state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+                if state.base_latency is None or state.latency < state.base_latency:
+                    state.base_latency = state.latency
+            else:
+                state.window_errors += 1
+
+            latency_spike = (state.latency is not None and state.base_latency is not None
+                            and state.latency > state.base_latency * self.latency_factor)
+
+            # 乘性减小，同一个窗口内最多减小一次，避免一批同时失败的请求把并发数降到最低
+            if (congested or latency_spike) and now - state.last_decrease >= self.window:
+                state.limit = max(self.min_limit, state.limit * self.decrease_factor)
+                state.last_decrease = now
+                if latency_spike:
+                    # 以新的并发数重新测量基准延迟
+                    state.base_latency = state.latency
+
+            # 每个窗口结束时评估一次：吞吐量提升、没有错误、延迟平稳并且并发已经用满时加性增加
+            if now - state.window_start >= self.window:
+                throughput = state.window_done / (now - state.window_start)
+                saturated = state.in_flight + 1 >= int(state.limit)
+                if (state.window_errors == 0 and saturated and not latency_spike and not congested
+                        and throughput >= state.last_throughput * 1.05):
+                    state.limit = min(self.max_limit, state.limit + 1)
+                self._close_window(state, throughput, now)
+
+            self.condition.notify_all()
+
+        self.dump_snapshot()
+
+    def _close_window(self, state: Host_State, throughput: float, now: float) -> None:
+        state.last_throughput = throughput
+        state.total_done += state.window_done
+        state.total_errors += state.window_errors
+        state.total_bytes += state.window_bytes
+        state.window_start = now
+        state.window_done = 0
+        state.window_errors = 0
+        state.window_bytes = 0
+
+    @contextmanager
+    def slot(self, url: str):
+        """
+        占用目标主机的一个并发位置，使用方式：
+
+            with controller.slot(url) as slot:
+                ...
+                slot["nbytes"] = len(content)
+
+        代码块内抛出异常视为失败，slot["congested"] 可以手动标记拥塞。
+        slot["latency"] 记录收到响应头的耗时（秒），没有设置时使用整个代码块的耗时，
+        大文件的传输时间和带宽控制的等待不应该被当成延迟突增
+        """
+        host = get_host(url)
+        slot = {"success": True, "congested": False, "nbytes": 0, "latency": None}
+        self.acquire(host)
+        begin = time.monotonic()
+        try:
+            yield slot
+        except Exception as e:
+            slot["success"] = False
+            slot["congested"] = slot["congested"] or is_congestion_error(e)
+            raise
+        finally:
+            latency = slot["latency"] if slot["latency"] is not None else time.monotonic() - begin
+            self.release(host, slot["success"], latency, slot["congested"], slot["nbytes"])
+
+    def current_limit(self) -> int:
+        """所有主机当前并发上限之和，不超过最大并发数，还没有请求过任何主机时为初始并发数"""
+        with self.condition:
+            total = sum(int(state.limit) for state in self.hosts.values())
+            return min(self.max_limit, max(self.initial_limit, total))
+
+    def set_max_limit(self, max_limit: int) -> None:
+        """运行时修改最大并发数"""
+        with self.condition:
+            self.max_limit = max_limit
+            for state in self.hosts.values():
+                state.limit = min(state.limit, max_limit)
+            self.condition.notify_all()
+
+    def snapshot(self) -> dict:
+        """
+        当前各个主机的并发数和吞吐量
+
+        Returns:
+            dict: key 为主机名，value 为并发上限、正在进行的请求数、上一个窗口的吞吐量、平均延迟和累计数据
+        """
+        with self.condition:
+            return {host: {"limit": int(state.limit),
+                            "in_flight": state.in_flight,
+                            "throughput": round(state.last_throughput, 2),
+                            "latency_ms": round(state.latency * 1000, 1) if state.latency is not None else None,
+                            "done": state.total_done + state.window_done,
+                            "errors": state.total_errors + state.window_errors,
+                            "bytes": state.total_bytes + state.window_bytes}
+                    for host, state in self.hosts.items()}
+
+    def dump_snapshot(self, interval = 2.0) -> None:
+        """
+        每隔 interval 秒把当前进程的快照写入日志目录，供其他进程或界面观察。
+        进程第一次写入时删除已经退出的进程留下的快照，并登记退出时删除自己的快照
+        """
+        now = time.monotonic()
+        if now - self.last_dump < interval:
+            return
+        self.last_dump = now
+        file_path = ENV.CONCURRENCY_LOGGING_PATH / f"{os.getpid()}.json"
+        try:
+            with open(file_path, 'w', encoding='UTF-8') as file:
+                json.dump({"time": time.time(), "hosts": self.snapshot()}, file)
+        except OSError:
+            return
+        if self.dump_pid != os.getpid():
+            self.dump_pid = os.getpid()
+            atexit.register(self.remove_snapshot)
+            sweep_snapshots()
+
+    def remove_snapshot(self) -> None:
+        """进程退出时删除自己的快照，fork 出的子进程不删除父进程的文件"""
+        if self.dump_pid != os.getpid():
+            return
+        try:
+            (ENV.CONCURRENCY_LOGGING_PATH / f"{os.getpid()}.json").unlink()
+        except OSError:
+            pass
+
+
+_CONTROLLER = None
+_CONTROLLER_LOCK = threading.Lock()
+
+
+def get_controller(initial_limit = 4) -> AIMD_Controller:
+    """获取当前进程共用的并发控制器，initial_limit 只在第一次创建时生效"""
+    global _CONTROLLER
+    with _CONTROLLER_LOCK:
+        if _CONTROLLER is None:
+            _CONTROLLER = AIMD_Controller(initial_limit = initial_limit)
+        return _CONTROLLER
+
+
+def sweep_snapshots(max_age = STALE_SECONDS) -> int:
+    """
+    删除超过 max_age 秒没有更新的快照文件。mp.Pool 结束子进程时不会执行退出函数，由之后的进程删除它们留下的文件
+
+    Returns:
+        int: 删除的文件数量
+    """
+    removed = 0
+    deadline = time.time() - max_age
+    for file_path in ENV.CONCURRENCY_LOGGING_PATH.glob("*.json"):
+        try:
+            if file_path.stat().st_mtime < deadline:
+                file_path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def load_snapshots(max_age = 10.0) -> dict:
+    """
+    汇总所有进程最近写入的快照
+
+    Args:
+        max_age (float): 超过这个时间（秒）没有更新的快照会被忽略
+
+    Returns:
+        dict: key 为主机名，value 为所有进程合计的并发数和吞吐量
+    """
+    result = {}
+    for file_path in ENV.CONCURRENCY_LOGGING_PATH.glob("*.json"):
+        try:
+            with open(file_path, 'r', encoding='UTF-8') as file:
+                snapshot = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if time.time() - snapshot.get("time", 0) > max_age:
+            continue
+        for host, state in snapshot["hosts"].items():
+            merged = result.setdefault(host, {"limit": 0, "in_flight": 0, "throughput": 0.0, "done": 0, "errors": 0, "bytes": 0})
+            for key in merged:
+                merged[key] += state.get(key) or 0
+    return result
@@ -0,0 +1,148 @@
+"""
+后台任务的实时吞吐量面板
+
+定期从进程内的 任务管理器、指标登记表、并发控制器和带宽控制器 采样，用最近 WINDOW 秒内的变化量计算：
+    1. 每个任务的 tokens/s、MB/s、正在进行的下载数和预计剩余时间
+    2. 每个主机的并发上限、正在进行的请求数和错误率
+    3. 每个平台的请求速率和额度余量（相对 platform_info.json 中的 requests_per_second），以及 429 次数
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.bandwidth_toolbox as bwt
+import utils.concurrency_toolbox as cct
+import utils.job_toolbox as jtb
+import utils.metrics_toolbox as mtb
+import utils.spider_toolbox as stb
+
+
+# 计算速率使用的时间窗口（秒）
+WINDOW = 15.0
+
+
+class Dashboard(object):
+    """
+    保存最近一段时间的采样，计算各项速率
+    """
+
+    def __init__(self, job_manager: jtb.Job_Manager, window = WINDOW):
+        """
+        Args:
+            job_manager (Job_Manager): 需要观察的任务管理器
+            window (float): 计算速率的时间窗口（秒）
+        """
+        self.job_manager = job_manager
+        self.window = window
+        self.history = deque()
+        self.lock = threading.Lock()
+
+    def sample(self) -> dict:
+        """读取当前的累计数据"""
+        jobs = bwt.get_governor().job_snapshot()
+        values = {"jobs": {}, "hosts": {}, "providers": {}}
+        for job in list(self.job_manager.jobs.values()):
+            job_stats = jobs.get(job.name, {})
+            values["jobs"][job.job_id] = (len(job.completed), job_stats.get("bytes", 0))
+
+        for name, labels, value in mtb.get_registry().snapshot()["counters"]:
+            # 写盘和解析等本地阶段不属于任何主机
+            if labels.get("host") == "local":
+                continue
+            if name == "nft_requests_total":
+                host = values["hosts"].setdefault(labels["host"], [0, 0])
+                host[0] += value
+                if labels["stage"] == "page_fetch":
+                    provider = values["providers"].setdefault(labels["provider"], [0, 0])
+                    provider[0] += value
+            elif name == "nft_errors_total":
+                values["hosts"].setdefault(labels["host"], [0, 0])[1] += value
+                if labels["stage"] == "page_fetch" and labels["status"] == "429":
+                    values["providers"].setdefault(labels["provider"], [0, 0])[1] += value
+        return values
+
+    def collect(self) -> dict:
+        """
+        采样一次，返回面板需要的三张表
+
+        Returns:
+            dict: {"jobs": [...], "hosts": [...], "providers": [...]}
+        """
+        now = time.monotonic()
+        values = self.sample()
+        with self.lock:
+            self.history.append((now, values))
+            while len(self.history) > 2 and now - self.history[1][0] >= self.window:
+                self.history.popleft()
+            begin, old = self.history[0]
+        elapsed = now - begin
+
+        def rate(new, previous):
+            return (new - previous) / elapsed if elapsed > 0 else 0.0
+
+        streams = bwt.get_governor().job_snapshot()
+        job_list = []
+        for job in sorted(list(self.job_manager.jobs.values()), key = lambda job: job.job_id):
+            if job.status in jtb.TERMINAL_STATES or job.job_id not in values["jobs"]:
+                continue
+            tokens, nbytes = values["jobs"][job.job_id]
+            old_tokens, old_bytes = old["jobs"].get(job.job_id, (tokens, nbytes))
+            tokens_per_second = rate(tokens, old_tokens)
+            remaining = max(job.size - tokens, 0)
+            job_list.append({"job_id": job.job_id,
+                            "name": job.name,
+                            "status": job.status,
+                            "tokens": tokens,
+                            "total": job.size,
+                            "tokens_per_second": tokens_per_second,
+                            "mb_per_second": rate(nbytes, old_bytes) / 1e6,
+                            "in_flight": streams.get(job.name, {}).get("streams", 0),
+                            "max_workers": job.max_workers,
+                            "bandwidth_limit": bwt.get_governor().get_job_limit(job.name),
+                            "eta": remaining / tokens_per_second if tokens_per_second > 0 else None})
+
+        controller = cct.get_controller().snapshot()
+        host_list = []
+        for host, (requests, errors) in values["hosts"].items():
+            old_requests, old_errors = old["hosts"].get(host, (0, 0))
+            recent = requests - old_requests
+            state = controller.get(host, {})
+            host_list.append({"host": host,
+                                "limit": state.get("limit"),
+                                "in_flight": state.get("in_flight", 0),
+                                "requests_per_second": rate(requests, old_requests),
+                                "error_rate": (errors - old_errors) / recent if recent else 0.0,
+                                "errors": errors})
+
+        provider_list = []
+        for provider, (requests, throttled) in values["providers"].items():
+            old_requests, old_throttled = old["providers"].get(provider, (0, 0))
+            limit = stb.get_platform_info().get(provider, {}).get("requests_per_second")
+            used = rate(requests, old_requests)
+            provider_list.append({"provider": provider,
+                                    "requests_per_second": used,
+                                    "limit": limit,
+                                    "headroom": max(0.0, 1 - used / limit) if limit else None,
+                                    "throttled": throttled - old_throttled})
+
+        return {"jobs": job_list,
+                "hosts": sorted(host_list, key = lambda item: -item["in_flight"] - item["requests_per_second"]),
+                "providers": provider_list}
+
+
+_DASHBOARD = None
+_DASHBOARD_LOCK = threading.Lock()
+
+
+def get_dashboard(job_manager = None) -> Dashboard:
+    """获取当前进程共用的面板，默认观察 get_job_manager() 返回的任务管理器"""
+    global _DASHBOARD
+    with _DASHBOARD_LOCK:
+        if _DASHBOARD is None:
+            _DASHBOARD = Dashboard(job_manager or jtb.get_job_manager())
+        return _DASHBOARD
@@ -0,0 +1,170 @@
+"""
+面向揭示（reveal）场景的差异同步
+
+为每个 token 记录图片链接和 metadata 的哈希值，重新抓取 metadata 页面时只重新下载发生变化的 token，
+没有变化的 token 既不会重新下载，也不会重写文件。
+索引中还没有记录的 token 以磁盘上已经保存的metadata文件为基准，图片链接取自 metadata 的 image 字段。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+# 每个进程只加载一次索引文件
+_INDEX_CACHE = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def hash_metadata(record) -> str:
+    """
+    计算 metadata 的哈希值，raw 为空时使用 tokenUri 计算
+
+    Args:
+        record (Token_Record): token记录
+
+    Returns:
+        str: sha1 哈希值
+    """
+    content = record.raw if record.raw is not None else record.token_uri
+    if record.raw is not None:
+        # 按键排序后再计算，哈希值与字段顺序无关
+        try:
+            content = json.dumps(json.loads(record.raw), sort_keys=True, ensure_ascii=False)
+        except json.JSONDecodeError:
+            pass
+    return hashlib.sha1(str(content).encode("utf-8")).hexdigest()
+
+
+def hash_content(metadata) -> str:
+    """计算已经展开的 metadata 的哈希值，与 hash_metadata 对同样内容的计算结果一致"""
+    return hashlib.sha1(json.dumps(metadata, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def get_metadata_image(metadata):
+    """metadata 中的图片链接，字段顺序与 RPC 下载器解析媒体资源时一致"""
+    if isinstance(metadata, dict):
+        for field in ("image", "image_url", "animation_url"):
+            if isinstance(metadata.get(field), str) and metadata[field]:
+                return metadata[field]
+    return None
+
+
+def get_image_uri(record):
+    """
+    获取token的图片链接，优先使用 metadata 中的图片字段。
+    平台给出的第一个链接通常是它自己的 CDN 缓存地址（例如 Alchemy 的 cachedUrl），图片没有变化时也可能改变
+    """
+    try:
+        image = get_metadata_image(record.metadata)
+    except json.JSONDecodeError:
+        image = None
+    return image or (record.sources[0] if record.sources else None)
+
+
+def load_stored_entry(file_path):
+    """
+    从已经保存的metadata文件生成索引记录，第一次差异同步时作为之前下载结果的基准
+
+    Returns:
+        dict: {"hash": str, "image": str}，文件不存在或无法解析时返回 None
+    """
+    try:
+        with open(file_path, 'r', encoding='UTF-8') as file:
+            metadata = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return {"hash": hash_content(metadata), "image": get_metadata_image(metadata)}
+
+
+class Diff_Index(object):
+    """
+    保存在项目目录下的差异索引，格式为 jsonl，后写入的记录覆盖先写入的记录，多个进程可以同时追加写入
+    """
+
+    def __init__(self, collection_path):
+        """
+        Args:
+            collection_path (Path): 项目的保存目录，即 img 和 metadata 的上一级目录
+        """
+        self.index_path = Path(collection_path).joinpath("diff_index.jsonl")
+
+    @property
+    def entries(self) -> dict:
+        """key 为 tokenId，value 为 {"hash": str, "image": str}"""
+        key = str(self.index_path)
+        with _INDEX_LOCK:
+            if key not in _INDEX_CACHE:
+                entries = {}
+                if self.index_path.exists():
+                    with open(self.index_path, 'r', encoding='UTF-8') as file:
+                        for line in file:
+                            try:
+                                record = json.loads(line)
+                            except json.JSONDecodeError:
+                                # 进程中断时最后一行可能不完整
+                                continue
+                            entries.update(record)
+                _INDEX_CACHE[key] = entries
+            return _INDEX_CACHE[key]
+
+    def filter_changed(self, record_list: list, media_file, metadata_file) -> tuple:
+        """
+        过滤出发生变化的 token，索引中没有记录哈希值或图片链接（上次下载失败）的 token 也视为变化
+
+        Args:
+            record_list (list): Token_Record 列表
+            media_file (callable): 参数为 (tokenId, 媒体格式)，返回媒体文件的保存路径，用于检查之前的下载是否成功
+            metadata_file (callable): 参数为 tokenId，返回metadata文件的保存路径，用于检查之前的下载是否成功
+
+        Returns:
+            tuple: (metadata变化的记录, 媒体资源变化的记录, 本次计算出的索引记录)
+        """
+        entries = self.entries
+        changed_metadata = []
+        changed_media = []
+        records = {}
+        for record in record_list:
+            key = str(record.token_id)
+            file_path = metadata_file(record.token_id)
+            old = entries.get(key)
+            if old is None:
+                # 索引中没有记录时使用磁盘上已有的metadata，开启差异同步之前下载的token不会全部重新下载
+                old = load_stored_entry(file_path) or {}
+            new = {"hash": hash_metadata(record), "image": old.get("image")}
+
+            if new["hash"] != old.get("hash") or not file_path.exists():
+                changed_metadata.append(record)
+
+            if record.has_media:
+                new["image"] = get_image_uri(record)
+                file_path = media_file(record.token_id, record.format)
+                # 旧版本的索引记录的是平台给出的第一个链接，同样视为没有变化；下载失败的图片没有记录链接
+                unchanged = old.get("image") is not None and old["image"] in (new["image"], record.sources[0] if record.sources else None)
+                if not unchanged or not file_path.exists():
+                    changed_media.append(record)
+
+            records[key] = new
+
+        return changed_metadata, changed_media, records
+
+    def record(self, records: dict) -> None:
+        """
+        将新的索引记录追加到索引文件中
+
+        Args:
+            records (dict): key 为 tokenId，value 为 {"hash": str, "image": str}
+        """
+        if not records:
+            return
+        line = json.dumps(records, ensure_ascii=False) + "\n"
+        with _INDEX_LOCK:
+            # 一次 write 写入一整行，多进程追加写入时不会交错
+            with open(self.index_path, 'a', encoding='UTF-8') as file:
+                file.write(line)
+        self.entries.update(records)
@@ -0,0 +1,360 @@
+"""
+tokenId 空间探测
+
+通过批量探测找出项目真实的tokenId布局：起始编号、最大编号、中间缺失的编号，
+以及编号是超大 uint256（例如哈希值）时的完整编号列表，最终生成一份准确的下载任务计划。
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.file_io as fio
+import utils.log_toolbox as ltb
+import utils.rpc_toolbox as rpc
+import utils.spider_toolbox as stb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+OWNER_OF_SELECTOR = "0x6352211e"      # ownerOf(uint256)
+TOTAL_SUPPLY_SELECTOR = "0x18160ddd"  # totalSupply()
+
+# 保存在项目信息文件中的字段，区间列表和缺失编号保存在单独的文件中
+TOKEN_SPACE_SUMMARY_KEYS = ("start_index", "end_index", "total_supply", "token_count", "sparse")
+
+
+class RPC_Probe(object):
+    """
+    使用 JSON-RPC 批量调用 ownerOf 判断token是否存在，适用于 ERC721
+    """
+
+    def __init__(self, contract_address: str, rpc_url = None, chain_type = "ethereum", batch_size = 500):
+        self.contract_address = contract_address
+        self.rpc_url = rpc_url or rpc.get_rpc_url(chain_type)
+        if self.rpc_url is None:
+            raise ValueError(f"No JSON-RPC endpoint configured for {chain_type}!")
+        self.batch_size = batch_size
+        self.session = requests.Session()
+
+    def exists(self, token_ids: list) -> dict:
+        """
+        批量判断token是否存在
+
+        Args:
+            token_ids (list): tokenId 列表
+
+        Returns:
+            dict: key 为tokenId（int），value 为是否存在
+        """
+        result_dict = {}
+        for i in range(0, len(token_ids), self.batch_size):
+            chunk = token_ids[i:i + self.batch_size]
+            calls = [("eth_call", [{"to": self.contract_address, "data": rpc.encode_call(OWNER_OF_SELECTOR, token_id)}, "latest"])
+                    for token_id in chunk]
+            results = rpc.send_rpc_batch(self.rpc_url, calls, session = self.session)
+            for token_id, result in zip(chunk, results):
+                # 不存在的token会 revert，或者返回零地址
+                result_dict[token_id] = bool(result) and result != "0x" and int(result, 16) != 0
+        return result_dict
+
+    def total_supply(self):
+        """读取合约的 totalSupply()，合约没有实现时返回 None"""
+        result = rpc.send_rpc_batch(self.rpc_url, [("eth_call", [{"to": self.contract_address, "data": TOTAL_SUPPLY_SELECTOR}, "latest"])],
+                                    session = self.session)[0]
+        if not result or result == "0x":
+            return None
+        return int(result, 16)
+
+
+class Alchemy_Probe(object):
+    """
+    使用 Alchemy getNFTMetadataBatch 判断token是否存在，ERC1155 或者没有配置 JSON-RPC 节点时使用
+    """
+
+    def __init__(self, contract_address: str, chain_type = "ethereum", batch_size = None):
+        self.contract_address = contract_address
+        self.chain_type = chain_type
+        self.batch_size = batch_size or stb.get_platform_profile("Alchemy")["max_batch_size"]
+        self.session = requests.Session()
+
+    def exists(self, token_ids: list) -> dict:
+        result_dict = {}
+        for i in range(0, len(token_ids), self.batch_size):
+            chunk = token_ids[i:i + self.batch_size]
+            stb.get_rate_limiter("Alchemy").acquire()
+            url = stb.get_endpoint("Alchemy", self.chain_type, "batch")
+            payload = {"tokens": [{"contractAddress": self.contract_address, "tokenId": str(token_id)} for token_id in chunk],
+                        "refreshCache": False}
+            response = self.session.post(url, json=payload, headers=stb.get_headers())
+            response.raise_for_status()
+            for token_id, NFT_item in zip(chunk, response.json()["nfts"]):
+                result_dict[token_id] = (NFT_item.get("raw") or {}).get("error") is None
+        return result_dict
+
+    def total_supply(self):
+        return None
+
+    def enumerate_token_ids(self, page_size = None) -> list:
+        """
+        沿着 pageKey 枚举项目的全部tokenId，只请求tokenId不请求metadata，用于编号为超大 uint256 的项目
+
+        Returns:
+            list: 升序排列的tokenId（int）
+        """
+        page_size = page_size or stb.get_platform_profile("Alchemy")["max_page_size"]
+        token_ids = []
+        page_key = None
+        while True:
+            url = (stb.get_endpoint("Alchemy", self.chain_type, "page")
+                    + f"?contractAddress={self.contract_address}&withMetadata=false&limit={page_size}")
+            if page_key:
+                url += f"&startToken={page_key}"
+            stb.get_rate_limiter("Alchemy").acquire()
+            response = self.session.get(url, headers=stb.get_headers())
+            response.raise_for_status()
+            body = response.json()
+            token_ids.extend(stb.parse_token_id(NFT_item["tokenId"]) for NFT_item in body.get("nfts", []))
+            if not (page_key := body.get("pageKey")):
+                break
+        return sorted(token_ids)
+
+
+def compress_ranges(token_ids: list) -> list:
+    """
+    将有序的tokenId列表压缩成闭区间列表
+
+    Args:
+        token_ids (list): 升序排列的tokenId
+
+    Returns:
+        list: [[start, end], ...]
+    """
+    ranges = []
+    for token_id in token_ids:
+        if ranges and token_id == ranges[-1][1] + 1:
+            ranges[-1][1] = token_id
+        else:
+            ranges.append([token_id, token_id])
+    return ranges
+
+
+class Token_Space_Discovery(object):
+    """
+    tokenId 空间探测器
+    """
+
+    def __init__(self, probe, window = 16, max_exponent = 64, scan_gaps = True):
+        """
+        Args:
+            probe (RPC_Probe | Alchemy_Probe): 批量探测器
+            window (int): 每个探测点连续检查的token数量，用来跨过少量被销毁的token
+            max_exponent (int): 指数搜索的最大指数
+            scan_gaps (bool): 是否逐个扫描起止编号之间缺失的token
+        """
+        self.probe = probe
+        self.window = window
+        self.max_exponent = max_exponent
+        self.scan_gaps = scan_gaps
+
+    def alive(self, points: list) -> dict:
+        """
+        一次批量请求判断多个探测点是否存活，探测点之后 window 个token中任意一个存在即认为存活
+
+        Returns:
+            dict: key 为探测点，value 为是否存活
+        """
+        token_ids = sorted({point + offset for point in points for offset in range(self.window)})
+        exists = self.probe.exists(token_ids)
+        return {point: any(exists.get(point + offset) for offset in range(self.window)) for point in points}
+
+    def find_start_index(self):
+        """
+        在 [0, window) 中查找最小的存在的tokenId
+
+        Returns:
+            int: 起始编号，小编号中不存在token时返回 None
+        """
+        exists = self.probe.exists(list(range(self.window)))
+        existing = [token_id for token_id, flag in exists.items() if flag]
+        return min(existing) if existing else None
+
+    def find_end_index(self, start_index: int) -> int:
+        """
+        先指数搜索找到上界，再二分搜索找到最大的存活编号。指数搜索的所有探测点在一次批量请求中完成。
+
+        Returns:
+            int: 最大的存在的tokenId
+        """
+        points = [start_index + (1 << k) for k in range(self.max_exponent)]
+        alive = self.alive(points)
+        low = start_index
+        high = None
+        for point in points:
+            if alive[point]:
+                low = point
+            else:
+                high = point
+                break
+        if high is None:
+            raise ValueError("Token ids exceed the exponential search range.")
+
+        # 每轮在 (low, high) 之间均匀放置多个探测点，减少请求轮数
+        while high - low > self.window:
+            step = max(1, (high - low) // 16)
+            points = list(range(low + step, high, step))
+            alive = self.alive(points)
+            for point in points:
+                if alive[point]:
+                    low = point
+                else:
+                    high = point
+                    break
+
+        exists = self.probe.exists(list(range(low, high + self.window)))
+        return max(token_id for token_id, flag in exists.items() if flag)
+
+    def find_missing_ids(self, start_index: int, end_index: int) -> list:
+        """扫描 [start_index, end_index] 中不存在的tokenId"""
+        exists = self.probe.exists(list(range(start_index, end_index + 1)))
+        return [token_id for token_id, flag in sorted(exists.items()) if not flag]
+
+    def discover(self) -> dict:
+        """
+        探测tokenId空间，生成下载任务计划
+
+        Returns:
+            dict: {
+                "start_index": 起始编号,
+                "end_index": 最大编号,
+                "total_supply": 从 start_index 开始需要覆盖的编号数量,
+                "token_count": 实际存在的token数量,
+                "missing_ids": 缺失的编号,
+                "ranges": 实际存在的编号区间 [[start, end], ...],
+                "sparse": 是否为稀疏编号
+            }
+        """
+        start_index = self.find_start_index()
+
+        if start_index is None:
+            # 编号不是从小整数开始，例如以哈希值作为tokenId的项目，只能枚举全部编号
+            if not hasattr(self.probe, "enumerate_token_ids"):
+                raise ValueError("Token ids are not sequential, enumeration requires the Alchemy probe.")
+            token_ids = self.probe.enumerate_token_ids()
+            if not token_ids:
+                return None
+            ranges = compress_ranges(token_ids)
+            return {"start_index": token_ids[0],
+                    "end_index": token_ids[-1],
+                    "total_supply": len(token_ids),
+                    "token_count": len(token_ids),
+                    "missing_ids": [],
+                    "ranges": ranges,
+                    "sparse": True}
+
+        end_index = self.find_end_index(start_index)
+        missing_ids = self.find_missing_ids(start_index, end_index) if self.scan_gaps else []
+        token_count = end_index - start_index + 1 - len(missing_ids)
+
+        onchain_supply = self.probe.total_supply()
+        if onchain_supply is not None and onchain_supply > token_count:
+            ltb.get_logger().warning(f"totalSupply() is {onchain_supply} but only {token_count} tokens were found, "
+                                    f"some tokens may be beyond a gap larger than {self.window}.")
+
+        missing_set = set(missing_ids)
+        ranges = compress_ranges([token_id for token_id in range(start_index, end_index + 1) if token_id not in missing_set])
+        return {"start_index": start_index,
+                "end_index": end_index,
+                "total_supply": end_index - start_index + 1,
+                "token_count": token_count,
+                "missing_ids": missing_ids,
+                "ranges": ranges,
+                "sparse": len(ranges) > 1}
+
+
+def create_probe(contract_address: str, chain_type = "ethereum", token_type = "ERC721"):
+    """优先使用 JSON-RPC 探测，ERC1155 或没有配置节点时使用 Alchemy 探测"""
+    if token_type != "ERC1155" and rpc.get_rpc_url(chain_type):
+        return RPC_Probe(contract_address, chain_type = chain_type)
+    return Alchemy_Probe(contract_address, chain_type = chain_type)
+
+
+def discover_token_space(contract_address: str, chain_type = "ethereum", token_type = "ERC721", scan_gaps = True) -> dict:
+    """
+    探测项目的tokenId空间，参见 Token_Space_Discovery.discover
+
+    Args:
+        contract_address (str): 合约地址
+        chain_type (str): 区块链类型
+        token_type (str): ERC721 或 ERC1155
+        scan_gaps (bool): 是否扫描缺失的编号
+
+    Returns:
+        dict: 下载任务计划
+    """
+    probe = create_probe(contract_address, chain_type, token_type)
+    return Token_Space_Discovery(probe, scan_gaps = scan_gaps).discover()
+
+
+def get_token_space_path(chain_type: str, contract_address: str) -> Path:
+    return ENV.TOKEN_SPACE_PATH / f"{chain_type.lower()}_{contract_address}.json"
+
+
+def save_token_space(chain_type: str, contract_address: str, token_space: dict) -> dict:
+    """
+    把完整的探测结果保存到项目自己的文件中。
+    稀疏或者哈希编号的项目有大量区间和缺失编号，放在共用的项目信息文件中会让每次读取项目信息都变慢
+
+    Returns:
+        dict: 保存在项目信息文件中的摘要
+    """
+    fio.check_dir(ENV.TOKEN_SPACE_PATH)
+    fio.save_json(get_token_space_path(chain_type, contract_address), token_space)
+    return {key: token_space[key] for key in TOKEN_SPACE_SUMMARY_KEYS if key in token_space}
+
+
+def load_token_space(collection_info: dict):
+    """
+    读取项目的完整探测结果
+
+    Args:
+        collection_info (dict): 项目信息
+
+    Returns:
+        dict: discover_token_space 的返回值，没有探测结果时返回 None
+    """
+    token_space = collection_info.get("token_space")
+    if not token_space:
+        return None
+    # 旧的项目信息文件中直接保存了完整的探测结果
+    if "ranges" in token_space:
+        return token_space
+    token_space_path = get_token_space_path(collection_info["chain_type"], collection_info["contract_address"])
+    return fio.load_json(token_space_path) if token_space_path.exists() else None
+
+
+def create_task_plan(plan: dict, interval_length = 100) -> list:
+    """
+    将探测结果转换成只包含存在的token的下载任务列表
+
+    Args:
+        plan (dict): discover_token_space 的返回值
+        interval_length (int): 每个任务包含的token数量
+
+    Returns:
+        list: [[tokenId, tokenId, ...], ...]
+    """
+    tasks = []
+    current = []
+    for start, end in plan["ranges"]:
+        for token_id in range(start, end + 1):
+            current.append(token_id)
+            if len(current) == interval_length:
+                tasks.append(current)
+                current = []
+    if current:
+        tasks.append(current)
+    return tasks
@@ -1,19 +1,33 @@
+import functools
 import multiprocessing as mp
 import os
-import random
+import queue
 import sys
+import threading
 import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 import urllib
 from abc import ABC, abstractmethod
 from pathlib import Path
 import re
 
-import requests
+import utils.bandwidth_toolbox as bwt
+import utils.cache_toolbox as cht
+import utils.concurrency_toolbox as cct
+import utils.diff_toolbox as dft
+import utils.discovery_toolbox as dst
 import utils.file_io as fio
+import utils.layout_toolbox as lyt
+import utils.log_toolbox as ltb
+import utils.metrics_toolbox as mtb
+import utils.profile_toolbox as ptb
+import utils.record_toolbox as rtb
+import utils.rpc_toolbox as rpc
 import utils.spider_toolbox as stb
-from internetdownloadmanager import Downloader
-from tqdm import tqdm
+import utils.trace_toolbox as ttb
+import utils.verify_toolbox as vtb
+import utils.webdataset_toolbox as wdt
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -115,6 +129,8 @@ class NFT_Downloader(ABC):
         # 创建保存media和metadata的文件夹
         fio.check_dir(self.base_media_path)
         fio.check_dir(self.base_metadata_path)
+        # 项目选择过分层的目录结构时沿用，否则为平铺结构
+        self.layout = lyt.load_layout(self.base_path.joinpath(f"{self.chain_type}/{self.NFT_name}"))
 
 
     # 生成payload的抽象方法，生成不同平台的payload
@@ -131,7 +147,7 @@ class NFT_Downloader(ABC):
 
     # 定义解析响应的抽象方法
     @abstractmethod
-    def parse_response(self, response) -> dict:
+    def parse_response(self, response) -> list:
         pass
 
     # 定义下载media资源的抽象方法，因为不同平台的media资源下载方式不同
@@ -159,6 +175,8 @@ class NFT_Downloader(ABC):
 
 # 定义下载整个NFT项目的下载器类，继承自NFT_Downloader类，本质上还是个抽象类
 class NFT_Downloader_for_Whole_Collection(NFT_Downloader):
+    # 对应 platform_info.json 中的平台名称，不依赖平台的下载器为 None
+    platform = None
     
     def __init__(self,
                 chain_type: str,
@@ -174,88 +192,352 @@ class NFT_Downloader_for_Whole_Collection(NFT_Downloader):
 
         super().__init__(chain_type, NFT_name, contract_address, candidate_format, save_path, process_num, thread_num, total_supply)
         self.start_index = start_index
+        # 平台下载器使用 platform_info.json 中该平台允许的最大分页大小和批量大小，请求越少越大越划算
+        if self.platform is not None:
+            profile = stb.get_platform_profile(self.platform)
+            interval_length = interval_length or profile["max_page_size"]
+            self.max_batch_size = profile["max_batch_size"]
         self.interval_length = interval_length
+        # 差异同步的索引，为 None 时表示完整下载
+        self.diff_index = None
+        # 每页下载线程数的上限，为 None 时使用并发控制器的最大并发数，后台任务运行中可以修改，下一页生效
+        self.max_workers = None
+        # tar 分片输出，为 None 时按文件保存在 img 和 metadata 文件夹中
+        self.sink = None
+
+    def wait_for_rate_limit(self, share: float = 1.0) -> None:
+        """
+        按照平台配置的请求速率等待，同一个进程内的所有下载器共用一个限速器
+
+        Args:
+            share (float): 当前进程分到的速率比例
+        """
+        # 离线回放不会请求平台接口
+        if cht.is_replay():
+            return
+        stb.get_rate_limiter(self.platform, share).acquire()
+
+    def request_page(self, method: str, url: str, **kwargs):
+        """
+        请求平台的分页或批量接口，记录 page_fetch 阶段的指标，开启响应缓存时先读缓存，见 cache_toolbox
+
+        Args:
+            method (str): "get" 或 "post"
+            url (str): 请求链接
+            **kwargs: 传给 requests 的参数
+
+        Returns:
+            Parsed_Response: 只解码一次的响应
+        """
+        def send():
+            with mtb.get_registry().timer("page_fetch", self.platform, cct.get_host(url)) as sample, \
+                    ttb.get_tracer().span("page_fetch", provider = self.platform, host = cct.get_host(url)) as span:
+                response = getattr(stb.get_session(), method)(url, **kwargs)
+                sample["status"] = span["status"] = response.status_code
+                sample["nbytes"] = span["bytes"] = len(response.content)
+            return response
+
+        cache = cht.get_cache()
+        if cache is None:
+            return Parsed_Response(send())
+        response, cached = cache.fetch(self.platform, method, url, send, params = kwargs.get("params"), payload = kwargs.get("json"))
+        if cached:
+            # 命中缓存时没有网络请求，记为本地阶段，不计入主机和平台的请求速率
+            mtb.get_registry().record("page_cache", self.platform, "local", "hit", 0.0, len(response.content))
+        return Parsed_Response(response)
+
+    def parse_page(self, response) -> list:
+        """解析一页响应，记录 parse 阶段的指标，并开始这一页中每个token的追踪"""
+        with mtb.get_registry().timer("parse", self.platform):
+            response_data = self.parse_response(response)
+        ttb.get_tracer().listed((record.token_id for record in response_data), provider = self.platform)
+        return response_data
+
+    def enable_diff_mode(self) -> None:
+        """
+        开启差异同步模式：重新抓取metadata页面，只重新下载图片链接或metadata发生变化的token
+        """
+        if self.sink is not None:
+            raise ValueError("Diff mode compares the files under img and metadata, it can not be used with tar shards.")
+        self.diff_index = dft.Diff_Index(self.base_path.joinpath(f"{self.chain_type}/{self.NFT_name}"))
+
+    def enable_tar_output(self, shard_size = wdt.DEFAULT_SHARD_SIZE) -> None:
+        """
+        把media和metadata写入 WebDataset 格式的 tar 分片，代替 img 和 metadata 文件夹中的单个文件，
+        img 文件夹只作为下载中的临时位置
+
+        Args:
+            shard_size (int): 单个分片的大小上限（字节）
+        """
+        if self.diff_index is not None:
+            raise ValueError("Diff mode compares the files under img and metadata, it can not be used with tar shards.")
+        self.sink = wdt.Tar_Sink(self.base_path.joinpath(f"{self.chain_type}/{self.NFT_name}/shards"), self.NFT_name, shard_size)
+
+    def set_layout(self, scheme: str) -> None:
+        """
+        修改项目的目录结构并保存到 layout.json，之后的下载都使用新的结构，已有的文件不会被移动
+
+        Args:
+            scheme (str): flat、id 或 hash，见 layout_toolbox
+        """
+        self.layout = lyt.Layout(self.base_path.joinpath(f"{self.chain_type}/{self.NFT_name}"), scheme)
+        self.layout.save()
+
+    def media_file(self, token_id: int, media_format: str) -> Path:
+        return self.layout.path("img", token_id, media_format)
+
+    def metadata_file(self, token_id: int) -> Path:
+        return self.layout.path("metadata", token_id, ".json")
 
-    def media_downloader(self, media_source) -> None:
-        # 启用多线程下载图片
-        with ThreadPoolExecutor(max_workers=self.thread_num) as executor:
-            executor.map(self.media_downloader_worker, media_source.items())
+    def flush_output(self) -> None:
+        """每页结束后调用，写出分片索引和 manifest，进程被直接结束时已经写入的token也不会丢失"""
+        if self.sink is not None:
+            self.sink.flush()
+        self.layout.flush()
+
+    def save_metadata(self, token_id: int, file_path: Path, metadata) -> None:
+        """保存一个token的metadata，开启分片输出时写入分片"""
+        if self.sink is not None:
+            self.sink.add_json(token_id, metadata)
+        else:
+            fio.save_json(file_path, metadata)
+            self.layout.record(token_id, "metadata", file_path)
+
+    def process_response_data(self, response_data) -> set:
+        """
+        下载一页解析后的数据，差异同步模式下先过滤掉没有变化的token
+
+        Args:
+            response_data (list): parse_response 返回的 Token_Record 列表
+
+        Returns:
+            set: metadata和媒体文件都已经保存的tokenId，差异同步模式下包括没有变化的token
+        """
+        if self.diff_index is None:
+            metadata_records = media_records = response_data
+        else:
+            metadata_records, media_records, entries = self.diff_index.filter_changed(response_data, self.media_file, self.metadata_file)
+        metadata_results = self.metadata_downloader(metadata_records)
+        media_results = self.media_downloader(media_records)
+        # 没有媒体资源的token只需要保存metadata
+        failed = {record.token_id for record, success in zip(metadata_records, metadata_results) if not success}
+        failed.update(record.token_id for record, success in zip(media_records, media_results) if record.has_media and not success)
+
+        if self.diff_index is not None:
+            self.record_diff(entries, metadata_records, metadata_results, media_records, media_results)
+        self.flush_output()
+        mtb.get_registry().dump_snapshot()
+        ttb.get_tracer().flush()
+        ptb.checkpoint()
+        return {record.token_id for record in response_data} - failed
+
+    def record_diff(self, entries: dict, metadata_records, metadata_results, media_records, media_results) -> None:
+        """
+        把一页的差异索引记录写入索引文件。
+        没有保存成功的metadata不记录哈希值，没有保存成功的媒体文件不记录图片链接，下次同步时这些token会被重新下载
+
+        Args:
+            entries (dict): filter_changed 计算出的索引记录，会被原地修改
+            metadata_records (list): 重新下载metadata的记录
+            metadata_results (list): 与 metadata_records 对应的是否保存成功
+            media_records (list): 重新下载媒体资源的记录
+            media_results (list): 与 media_records 对应的是否保存成功
+        """
+        for record, success in zip(metadata_records, metadata_results):
+            if not success:
+                entries[str(record.token_id)]["hash"] = None
+        for record, success in zip(media_records, media_results):
+            if not success:
+                entries[str(record.token_id)]["image"] = None
+        self.diff_index.record(entries)
+        ltb.get_logger().info(f"{self.NFT_name} diff: {len(metadata_records)} metadata and {len(media_records)} media changed in {len(entries)} tokens.")
+
+    def iter_pages(self):
+        """
+        依次抓取并解析每一页数据，每次返回一页 parse_response 的结果，
+        批量下载时按页在多个项目之间轮流调度
+
+        Yields:
+            list: Token_Record 列表
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support page iteration.")
+
+    def download_media_and_metadata(self):
+        """依次下载每一页的media和metadata资源"""
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Start downloading... **********")
+        with ltb.progress(self.NFT_name, self.total_supply):
+            try:
+                for response_data in self.iter_pages():
+                    self.process_response_data(response_data)
+            except Exception as e:
+                ltb.get_logger().error(f"Error downloading: {self.NFT_name} Process startup failed: {e}")
+                return False
+
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Download successfully! **********")
+        return True
+
+    def get_worker_num(self, task_num: int) -> int:
+        """
+        每页下载线程池的大小：后台任务设置了上限时使用上限，否则使用 AIMD 控制器当前的并发数，
+        而不是最大并发数，避免每一页都创建用不上的空闲线程
+
+        Args:
+            task_num (int): 这一页的下载任务数
+        """
+        limit = self.max_workers or cct.get_controller(self.thread_num).current_limit()
+        return max(1, min(limit, task_num))
+
+    def media_downloader(self, record_list) -> list:
+        # 启用多线程下载图片，实际的并发数由每个主机的 AIMD 控制器决定，thread_num 为初始并发数
+        with ThreadPoolExecutor(max_workers=self.get_worker_num(len(record_list))) as executor:
+            results = list(executor.map(self.media_downloader_worker, record_list))
             # 等待所有线程完成
             executor.shutdown(wait=True)
+        return results
 
-    def media_downloader_worker(self, source_item) -> None:
+    def media_downloader_worker(self, record) -> bool:
         """
-        启用idm下载图片
+        以数据块为单位下载图片，下载速度受全局带宽控制
 
         Args:
-            source_item (dict): 图片的资源字典, key 为 tokenId, value 为 url资源字典
-        """
+            record (Token_Record): token记录，没有媒体资源的记录直接跳过
 
-        key, value = source_item
+        Returns:
+            bool: 是否下载成功
+        """
+        tracer = ttb.get_tracer()
+        if not record.has_media:
+            with tracer.token(record.token_id):
+                return False
 
+        key = record.token_id
         download_success = False  # 用于标记是否成功下载
-
-        # 遍历source_list中的所有链接，下载成功一次即退出
-        for source_url in value["source_list"]:
-            if source_url is not None:
-                file_path = self.base_media_path.joinpath(f"{key}{value['format']}")
-                # 如果是IPFS资源，则使用IPFS专用的下载方法 
-                if CID := is_ipfs_cid(source_url):
-                    download_success = download_from_IPFS(CID, file_path)
-                    if download_success:
-                        break
-                # 如果是http资源，则使用普通的下载方法
-                else:
-                    downloader = Downloader()
-                    try:
-                        downloader.download(url=source_url, path=file_path)
-                        print(f"{self.NFT_name} {file_path.name} downloaded successfully.")
-                        download_success = True
-                        break  # 如果成功，则退出方法
-                    except Exception as e:
-                        print(f"Error downloading image {key} from {source_url}: {e}")
+        file_path = self.media_file(key, record.format)
+        registry = mtb.get_registry()
+        # 下载完成后快速检查文件头和结尾，HTML 错误页和截断的文件视为失败，继续尝试下一个链接
+        validate = functools.partial(vtb.check_file, deep = False)
+
+        # 当前线程记录的下载尝试和写盘事件都属于这个token
+        with tracer.token(key) as lifecycle:
+            # 遍历所有链接，下载成功一次即退出
+            for attempt, source_url in enumerate(record.sources):
+                if source_url is not None:
+                    # 第一个链接之后的尝试都记为重试
+                    if attempt > 0:
+                        registry.retry("media_fetch", self.platform, cct.get_host(source_url))
+                    # 如果是IPFS资源，则使用IPFS专用的下载方法 
+                    if CID := is_ipfs_cid(source_url):
+                        download_success = download_from_IPFS(CID, file_path, job = self.NFT_name, provider = self.platform, validate = validate)
+                        if download_success:
+                            break
+                    # 如果是http资源，则使用普通的下载方法
+                    else:
+                        try:
+                            with cct.get_controller(self.thread_num).slot(source_url) as slot, \
+                                    registry.timer("media_fetch", self.platform, cct.get_host(source_url)) as sample, \
+                                    tracer.span("media_attempt", host = cct.get_host(source_url), url = source_url) as span:
+                                slot["nbytes"] = sample["nbytes"] = span["bytes"] = bwt.stream_download(source_url, file_path, job = self.NFT_name, session = stb.get_session(), validate = validate, slot = slot)
+                                sample["status"] = span["status"] = 200
+                            ltb.log_success(f"{self.NFT_name} {file_path.name} downloaded successfully.", token = key)
+                            download_success = True
+                            break  # 如果成功，则退出方法
+                        except Exception as e:
+                            ltb.get_logger().warning(f"Error downloading image {key} from {source_url}: {e}", extra = {"token": key})
+            # 开启分片输出时，下载完成的文件移动到分片中
+            if download_success and self.sink is not None:
+                try:
+                    with tracer.span("shard_write", token = key):
+                        self.sink.add_file(key, record.format, file_path)
+                except OSError as e:
+                    ltb.get_logger().warning(f"Error writing {file_path.name} to tar shard: {e}", extra = {"token": key})
+                    download_success = False
+            elif download_success:
+                self.layout.record(key, "img", file_path)
+            lifecycle["success"] = download_success
 
         if not download_success:
-            print(f"None exits valid media source for {file_path.name}.")
-
-    def metadata_downloader(self, metadata_source) -> None:
-        # 启用多线程下载metadata
-        with ThreadPoolExecutor(max_workers=self.thread_num) as executor:
-            executor.map(self.metadata_downloader_worker, metadata_source.items())
+            ltb.get_logger().warning(f"None exits valid media source for {file_path.name}.", extra = {"token": key})
+        registry.token_done(self.platform, download_success)
+        ltb.update_progress(download_success)
+        return download_success
+
+    def metadata_downloader(self, record_list) -> list:
+        # 启用多线程下载metadata，实际并发数由 AIMD 控制器决定
+        with ThreadPoolExecutor(max_workers=self.get_worker_num(len(record_list))) as executor:
+            results = list(executor.map(self.metadata_downloader_worker, record_list))
             # 等待所有线程完成
             executor.shutdown(wait=True)
+        return results
 
-    def metadata_downloader_worker(self, source_item) -> None:
+    def metadata_downloader_worker(self, record) -> bool:
         """下载metadata文件
 
         Args:
-            source_item (dict): metadata资源字典, key 为 tokenId, value 为 json文件和 url资源字典
+            record (Token_Record): token记录
 
         Returns:
-            None:
+            bool: 是否保存成功
         """
-        key, value = source_item
-        file_path = self.base_metadata_path.joinpath(f"{key}.json")
+        key = record.token_id
+        file_path = self.metadata_file(key)
+
+        registry = mtb.get_registry()
+        tracer = ttb.get_tracer()
 
         # 如果raw字段里存在metadata，直接保存
-        if metadata := value.get('raw', None):
+        if metadata := record.raw:
             # 将数据格式化成json格式保存
-            fio.save_json(file_path, metadata)
-            print(f"{self.NFT_name} {file_path.name} saved successfully.")
+            try:
+                with registry.timer("metadata_write", self.platform), tracer.span("metadata_write", token = key):
+                    self.save_metadata(key, file_path, metadata)
+            except Exception as e:
+                ltb.get_logger().warning(f"Error saving metadata {key}: {e}", extra = {"token": key})
+                return False
+            ltb.log_success(f"{self.NFT_name} {file_path.name} saved successfully.", token = key)
+            return True
 
         # 如果tokenUri字段不为空，下载tokenUri指向的json文件
-        elif value["tokenUri"] is not None:
+        elif record.token_uri is not None:
+            if (metadata := self.fetch_metadata(record)) is None:
+                return False
             try:
-                response = requests.get(value["tokenUri"])
-                if response.status_code == 200:
-                    fio.save_json(file_path, response.json())
-                    print(f"{self.NFT_name} Metadata {file_path.name} saved successfully.")
-                else:
-                    print(f"Failed to download metadata {key} from {value['tokenUri']}. Status code: {response.status_code}")
+                with registry.timer("metadata_write", self.platform), tracer.span("metadata_write", token = key):
+                    self.save_metadata(key, file_path, metadata)
             except Exception as e:
-                print(f"Error downloading metadata {key} from {value['tokenUri']}: {e}")
+                ltb.get_logger().warning(f"Error saving metadata {key}: {e}", extra = {"token": key})
+                return False
+            ltb.log_success(f"{self.NFT_name} Metadata {file_path.name} saved successfully.", token = key)
+            return True
         else:
-            print(f"None exits valid metadata for {file_path.name}.")
+            ltb.get_logger().warning(f"None exits valid metadata for {file_path.name}.", extra = {"token": key})
+        return False
+
+    def fetch_metadata(self, record):
+        """下载tokenUri指向的json文件
+
+        Args:
+            record (Token_Record): token记录
+
+        Returns:
+            dict: 解析后的metadata，下载或解析失败时返回 None
+        """
+        key = record.token_id
+        try:
+            with cct.get_controller(self.thread_num).slot(record.token_uri) as slot, \
+                    mtb.get_registry().timer("metadata_fetch", self.platform, cct.get_host(record.token_uri)) as sample, \
+                    ttb.get_tracer().span("metadata_fetch", token = key, host = cct.get_host(record.token_uri), url = record.token_uri) as span:
+                response = stb.get_session().get(record.token_uri)
+                slot["latency"] = response.elapsed.total_seconds()
+                slot["success"] = response.status_code == 200
+                slot["congested"] = response.status_code in cct.CONGESTION_STATUS
+                slot["nbytes"] = sample["nbytes"] = span["bytes"] = len(response.content)
+                sample["status"] = span["status"] = response.status_code
+            if response.status_code == 200:
+                return response.json()
+            ltb.get_logger().warning(f"Failed to download metadata {key} from {record.token_uri}. Status code: {response.status_code}", extra = {"token": key})
+        except Exception as e:
+            ltb.get_logger().warning(f"Error downloading metadata {key} from {record.token_uri}: {e}", extra = {"token": key})
+        return None
 
 
 # 基于Alchemy V3 API的NFT下载器类
@@ -266,6 +548,10 @@ class NFT_Downloader_for_Whole_Collection_Alchemy(NFT_Downloader_for_Whole_Colle
 
     """
 
+    platform = "Alchemy"
+    # 开启请求缓存时，每个固定分段包含的页数
+    cache_segment_pages = 10
+
     def __init__(self,
                 chain_type: str,
                 NFT_name: str,
@@ -276,76 +562,238 @@ class NFT_Downloader_for_Whole_Collection_Alchemy(NFT_Downloader_for_Whole_Colle
                 thread_num = 10,
                 total_supply = 10000,
                 start_index = 0,
-                interval_length = 80):
+                interval_length = None):
 
         super().__init__(chain_type, NFT_name, contract_address, candidate_format, save_path, process_num, thread_num, total_supply, start_index, interval_length)
-        # 生成下载资源payload list
-        self.generate_payload(candidate_format = candidate_format,
-                            start_index = start_index,
-                            total_supply = total_supply)
+        # 生成初始的tokenId分段，每个分段沿着自己的 pageKey 游标链向后抓取
+        self.segment_list = self.generate_payload()
 
     def generate_payload(self, *args, **kwargs):
         """
-        生成下载资源payload list
+        按照 total_supply 把tokenId空间切分成 process_num 个分段。
+        total_supply 只是一个估计值，最后一个分段没有上界，一直跟随 pageKey 直到没有下一页，
+        因此估计错误时也不会漏掉token。
+
+        Returns:
+            list: [{"cursor": 起始tokenId, "end": 结束tokenId（不包含）或 None}, ...]
+        """
+        segment_num = max(1, self.process_num)
+        self.segment_size = max(self.interval_length, -(-self.total_supply // segment_num))
+        segment_list = []
+        for i in range(segment_num):
+            cursor = self.start_index + i * self.segment_size
+            end = cursor + self.segment_size if i < segment_num - 1 else None
+            segment_list.append({"cursor": cursor, "end": end})
+        return segment_list
+
+    def load_task_plan(self, plan: dict) -> None:
+        """
+        使用 discovery_toolbox 探测出的tokenId布局替换按 total_supply 估计的分段，每个连续编号区间对应一个有上界的分段
+
+        Args:
+            plan (dict): discover_token_space 的返回值
+        """
+        self.segment_list = [{"cursor": start, "end": end + 1} for start, end in plan["ranges"]]
+
+    def split_segment(self, segment: dict):
+        """
+        将一个分段剩余的范围对半切分，用于让空闲的进程从忙碌的分段中分走一半任务
 
         Args:
-            *args: 可变参数
-            **kwargs: 关键字参数
+            segment (dict): 待切分的分段，会被原地修改
 
+        Returns:
+            dict: 切分出的新分段，剩余范围太小时返回 None
+        """
+        cursor, end = segment["cursor"], segment["end"]
+        if end is None:
+            # 没有上界的分段进行推测性切分：后半段如果没有token，只会浪费一次请求
+            middle = cursor + self.segment_size
+        elif end - cursor >= 2 * self.interval_length:
+            middle = (cursor + end) // 2
+        else:
+            return None
+        segment["end"] = middle
+        return {"cursor": middle, "end": end}
+
+    def get_segments(self) -> list:
         """
-        # 实例化PayloadFactory
-        payloadfactory = PayloadFactory(candidate_format = self.candidate_format,
-                                        start = self.start_index,
-                                        interval_length = self.interval_length,
-                                        total_supply = self.total_supply)
+        返回本次下载使用的分段。
+        开启请求缓存时，pageKey 链上每一页的起点取决于分段边界，而动态切分的边界又取决于进程数和各请求的完成时间，
+        回放时会因为请求参数对不上而未命中缓存。因此把相邻的分段合并后，重新按照从 start_index 开始、
+        长度为 interval_length * cache_segment_pages 的固定网格切分，且下载过程中不再动态切分，
+        这样每一页的请求参数只由 start_index、total_supply 和探测出的分段计划决定。
 
-        self.payload_list = payloadfactory.create_interval_tuples_with_start_len()
+        Returns:
+            list: [{"cursor": 起始tokenId, "end": 结束tokenId（不包含）或 None}, ...]
+        """
+        if not cht.is_enabled():
+            return self.segment_list
+
+        # 合并首尾相接的分段，得到与进程数无关的连续区间
+        merged = []
+        for segment in sorted(self.segment_list, key=lambda item: item["cursor"]):
+            if merged and merged[-1]["end"] == segment["cursor"]:
+                merged[-1]["end"] = segment["end"]
+            else:
+                merged.append(dict(segment))
+
+        grid = self.interval_length * self.cache_segment_pages
+        segment_list = []
+        for segment in merged:
+            cursor, end = segment["cursor"], segment["end"]
+            # 没有上界的区间只按 total_supply 估计的范围切分，剩余部分保持没有上界
+            limit = end if end is not None else max(cursor, self.start_index + self.total_supply)
+            while cursor < limit:
+                boundary = min(limit, self.start_index + ((cursor - self.start_index) // grid + 1) * grid)
+                segment_list.append({"cursor": cursor, "end": boundary})
+                cursor = boundary
+            if end is None:
+                segment_list.append({"cursor": cursor, "end": None})
+        return segment_list
 
     # 下载全部的media和metadata资源
     def download_media_and_metadata(self):
 
-        print(f"\n**********  ## {self.NFT_name} ## Start downloading... **********\n")
-        # 启用进程池多进程下载
-        try:
-            with mp.Pool(processes = self.process_num) as pool:
-                pool.map(self.single_process_worker, self.payload_list)
-            pool.close()
-            pool.join()
-        except Exception as e:
-            print(f"\nError downloading: {self.NFT_name} Process startup failed: {e}\n")
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Start downloading... **********")
+        # 主进程负责调度分段，每个任务只抓取一个分段的一页数据，空闲的进程通过切分其他分段获取任务
+        pending = deque(dict(segment, retry=0) for segment in self.get_segments())
+        in_flight = {}
+        # 超过重试次数被放弃的分段，存在时整个项目按下载失败处理
+        abandoned = []
+        results = queue.Queue()
+        segment_id = 0
+        # 进度计数器必须在创建进程池之前建立，子进程 fork 后共用
+        with ltb.progress(self.NFT_name, self.total_supply):
+            try:
+                with mp.Pool(processes = self.process_num) as pool:
+                    while pending or in_flight:
+                        while pending and len(in_flight) < self.process_num:
+                            segment = pending.popleft()
+                            segment_id += 1
+                            in_flight[segment_id] = segment
+                            pool.apply_async(self.single_process_worker,
+                                            ((segment_id, segment["cursor"], segment["end"]),),
+                                            callback = results.put,
+                                            error_callback = lambda e, sid=segment_id: results.put((sid, e)))
+
+                        finished_id, next_cursor = results.get()
+                        segment = in_flight.pop(finished_id)
+
+                        if isinstance(next_cursor, Exception):
+                            # 出错的页面重新排队，超过重试次数后放弃这个分段
+                            segment["retry"] += 1
+                            mtb.get_registry().retry("page_fetch", self.platform, cct.get_host(stb.get_endpoint(self.platform, self.chain_type, "page")))
+                            if segment["retry"] <= 3:
+                                pending.append(segment)
+                            else:
+                                abandoned.append(segment)
+                                ltb.get_logger().error(f"{self.NFT_name} Segment from {segment['cursor']} failed: {next_cursor}")
+                            continue
+
+                        if next_cursor is None or (segment["end"] is not None and next_cursor >= segment["end"]):
+                            continue
+                        segment["cursor"] = next_cursor
+                        segment["retry"] = 0
+                        pending.append(segment)
+
+                        # 有进程空闲时，切分刚刚返回的分段；开启缓存时分段边界固定，不再切分
+                        while not cht.is_enabled() and len(pending) + len(in_flight) < self.process_num:
+                            new_segment = self.split_segment(segment)
+                            if new_segment is None:
+                                break
+                            pending.append(dict(new_segment, retry=0))
+                pool.close()
+                pool.join()
+            except Exception as e:
+                ltb.get_logger().error(f"Error downloading: {self.NFT_name} Process startup failed: {e}")
+                return False
+
+        if abandoned:
+            missing = ", ".join(f"[{segment['cursor']}, {segment['end'] if segment['end'] is not None else 'end'})" for segment in abandoned)
+            ltb.get_logger().error(f"**********  ## {self.NFT_name} ## Download incomplete, {len(abandoned)} segments failed: {missing} **********")
             return False
 
-        print(f"\n**********  ## {self.NFT_name}## Download successfully! **********\n")
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Download successfully! **********")
         return True
 
+    def fetch_page(self, start: int, end = None, share: float = 1.0) -> tuple:
+        """
+        从 start 开始抓取一页数据
+
+        Args:
+            start (int): 起始tokenId
+            end (int): 分段结束tokenId（不包含），为 None 时没有上界
+            share (float): 当前进程分到的请求速率比例
+
+        Returns:
+            tuple: (解析后的数据, 下一页的起始tokenId)，没有下一页时为 None
+        """
+        limit = self.interval_length if end is None else min(self.interval_length, end - start)
+
+        # 发送请求，链接模板中的api会随机选择
+        url = stb.get_endpoint(self.platform, self.chain_type, "page")
+        params = {"contractAddress": self.contract_address, "withMetadata": "true", "startToken": start, "limit": limit}
+        headers = stb.get_headers()
+        self.wait_for_rate_limit(share = share)
+        response = self.request_page("get", url, headers=headers, params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"{self.NFT_name} Error: {response.status_code}")
+
+        # 解析数据，只保留属于这个分段的token
+        response_data = self.parse_page(response)
+        if end is not None:
+            response_data = [record for record in response_data if record.token_id < end]
+
+        next_cursor = response.json().get("pageKey")
+        return response_data, stb.parse_token_id(next_cursor) if next_cursor else None
+
+    def iter_pages(self):
+        """依次沿着每个分段的 pageKey 游标链抓取数据"""
+        for segment in self.get_segments():
+            cursor, end = segment["cursor"], segment["end"]
+            while cursor is not None and (end is None or cursor < end):
+                response_data, cursor = self.fetch_page(cursor, end)
+                yield response_data
+
     # 定义单个下载进程的方法
     def single_process_worker(self, payload):
-        # 1. 获取请求参数
-        start, interval_length = payload
+        """
+        抓取分段中的一页数据并下载
 
-        time.sleep(random.randint(1, 3))  # 增加请求间隔
-        try:
-            # 发送请求
-            # 随机选择一个api
-            api = stb.get_api("Alchemy")
+        Args:
+            payload (tuple): (分段编号, 起始tokenId, 分段结束tokenId)
 
-            url = f"https://eth-mainnet.g.alchemy.com/nft/v3/{api}/getNFTsForContract?contractAddress={self.contract_address}&withMetadata=true&startToken={start}&limit={interval_length}"
-            headers = stb.get_headers()
-            response = requests.get(url, headers=headers)
-        except Exception as e:
-            print(f" {self.NFT_name} Error encountered: {e}")
-        else:
-            # 4. 解析数据
-            if response.status_code == 200:
-                response_data = self.parse_response(response)
-                # 启动多进程同时进行两个任务
-                metadata_source = response_data["metadata_source"]
-                media_source = response_data["media_source"]
-                self.metadata_downloader(metadata_source = metadata_source)
-                self.media_downloader(media_source = media_source)
+        Returns:
+            tuple: (分段编号, 下一页的起始tokenId)，没有下一页时为 None
+        """
+        segment_id, start, end = payload
+        response_data, next_cursor = self.fetch_page(start, end, share = 1 / self.process_num)
+        self.process_response_data(response_data)
+        # 进程池退出时会直接结束子进程，每页结束后都写入一次指标和性能分析数据
+        mtb.get_registry().dump_snapshot(force = True)
+        ttb.get_tracer().flush()
+        ptb.checkpoint(force = True)
+        ltb.flush()
+        return segment_id, next_cursor
+
+    def fetch_token_batch(self, token_ids: list) -> list:
+        """
+        通过 getNFTMetadataBatch 按tokenId批量获取数据，供多平台聚合下载器使用
 
-            else:
-                print(f"{self.NFT_name} Error: {response.status_code}")
+        Args:
+            token_ids (list): tokenId 列表，不超过 max_batch_size 个
+
+        Returns:
+            list: Token_Record 列表
+        """
+        url = stb.get_endpoint(self.platform, self.chain_type, "batch")
+        payload = {"tokens": [{"contractAddress": self.contract_address, "tokenId": str(tokenId)} for tokenId in token_ids],
+                    "refreshCache": False}
+        self.wait_for_rate_limit()
+        response = self.request_page("post", url, json=payload, headers=stb.get_headers())
+        check_response(response)
+        return self.parse_NFT_list(response.json()["nfts"])
 
     def parse_response(self, response):
         """
@@ -355,85 +803,43 @@ class NFT_Downloader_for_Whole_Collection_Alchemy(NFT_Downloader_for_Whole_Colle
             response (Http response): HTTP响应数据
 
         Returns:
-            dict: 返回解析后的数据，包括metadata资源和media资源
+            list: Token_Record 列表
         """
-        metadata_dict = {}
-        metadata_source = {}
-        media_source = {}
+        return self.parse_NFT_list(response.json()["nfts"])
 
-        NFT_list = response.json()["nfts"]
-        for NFT_item in NFT_list:
-            try:
-                tokenId = NFT_item.get("tokenId")
-
-                # 解析metadata资源
-                """
-                {
-                    "tokenId_1": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    "tokenId_2": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    ……
-                }
-                
-                
-                """
-                metadata_source[tokenId] = {
-                    "raw" : NFT_item["raw"].get("metadata", None),
-                    "tokenUri" : NFT_item.get("tokenUri", None)
-                    }
-
-                # 解析media资源
-                if NFT_item.get("image", None):
-                    image = NFT_item.get("image")
-                else:
-                    # 如果没有image字段，跳过这个NFT
-                    continue
+    def parse_NFT_list(self, NFT_list):
+        """
+        将平台返回的NFT列表统一成 Token_Record 列表，分页接口和批量接口共用
 
-                # 将媒体资源统一成一种通用的表达方式
-                """
-                {
-                    "tokenId_1": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                    "tokenId_2": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                ……
-
-                }
-                
+        Args:
+            NFT_list (list): NFT列表
 
-                """
+        Returns:
+            list: Token_Record 列表
+        """
+        record_list = []
+        for NFT_item in NFT_list:
+            try:
+                # 解析media资源，没有image字段的NFT只有metadata资源
                 source_list = []
-                for source_item in ["cachedUrl", "pngUrl", "originalUrl", "thumbnailUrl"]:
-                    # 如果字段不为空，添加到source_list中
-                    link = image.get(source_item, None)
-                    if link:
-                        source_list.append(link)
-                
-                # 解析文件格式
-                temp_format = image.get("contentType", None)
-                media_format = parse_file_format(temp_format, self.candidate_format)
-
-
-                media_source[tokenId] = {"source_list": source_list,
-                                        "format": media_format}
-
+                media_format = None
+                if image := NFT_item.get("image", None):
+                    for source_item in ["cachedUrl", "pngUrl", "originalUrl", "thumbnailUrl"]:
+                        source_list.append(image.get(source_item, None))
+                    # 解析文件格式
+                    media_format = parse_file_format(image.get("contentType", None), self.candidate_format)
+
+                record_list.append(rtb.Token_Record(NFT_item.get("tokenId"),
+                                                    raw = NFT_item["raw"].get("metadata", None),
+                                                    token_uri = NFT_item.get("tokenUri", None),
+                                                    sources = source_list,
+                                                    format = media_format))
             except Exception as e:
                 # 抛出异常，跳过这个NFT
-                print(f"Response parsing exception: {e}. Skipping")
+                ltb.get_logger().warning(f"Response parsing exception: {e}. Skipping")
                 continue
 
-        metadata_dict["metadata_source"] = metadata_source
-        metadata_dict["media_source"] = media_source
-        return metadata_dict
+        return record_list
 
 
 # 基于MFTScan API的NFT下载器类
@@ -443,6 +849,8 @@ class NFT_Downloader_for_Whole_Collection_NFTScan(NFT_Downloader_for_Whole_Colle
     细节参考链接：https://docs.nftscan.com/reference/evm/get-nfts-by-contract
 
     """
+    platform = "NFTScan"
+
     def __init__(self,
                 chain_type: str,
                 NFT_name: str,
@@ -453,7 +861,7 @@ class NFT_Downloader_for_Whole_Collection_NFTScan(NFT_Downloader_for_Whole_Colle
                 thread_num = 5,
                 total_supply = 10000,
                 start_index = 0,
-                interval_length = 80):
+                interval_length = None):
 
         super().__init__(chain_type, NFT_name, contract_address, candidate_format, save_path, process_num, thread_num, total_supply, start_index, interval_length)
 
@@ -462,49 +870,47 @@ class NFT_Downloader_for_Whole_Collection_NFTScan(NFT_Downloader_for_Whole_Colle
                                 'show_attribute': 'true',
                                 'sort_field': '',
                                 'sort_direction': '',
-                                'limit': str(interval_length),
+                                'limit': str(self.interval_length),
                             }
 
-    def download_media_and_metadata(self):
+    def iter_pages(self):
 
-        if self.chain_type == "ethereum":
-            url = f"https://restapi.nftscan.com/api/v2/assets/{self.contract_address}"
-        else:
-            url = f"https://{self.chain_type}api.nftscan.com/api/v2/assets/{self.contract_address}"
-        
+        url = stb.get_endpoint(self.platform, self.chain_type, "page", contract_address = self.contract_address)
         headers = stb.get_headers()
         headers.update({"X-API-KEY": stb.get_api("NFTScan")})
-        print(f"\n**********  ## {self.NFT_name} ## Start downloading... **********\n")
+        params = dict(self.params_template)
 
-        response = requests.get(url, headers=headers, params=self.params_template)
-        # 循环下载，停止的标志是游标不为空
-        """
-        Python 3.8 中引入的赋值表达式，通常被称为“海象运算符”（:=）。
-        这种表达式允许你在表达式内部进行变量赋值，并且可以直接在条件表达式中使用新赋值的变量。
-        代码中，next_cursor := response.json()["data"].get("next")
-        在 while 循环的条件判断中直接赋值并判断 next_cursor 是否为非空。
+        # 先处理当前页，再根据游标判断是否还有下一页，最后一页同样会被下载
+        while True:
+            self.wait_for_rate_limit()
+            response = self.request_page("get", url, headers=headers, params=params)
+            check_response(response)
+            yield self.parse_page(response)
+
+            if not (next_cursor := response.json()["data"].get("next")):
+                break
+            params.update({"cursor": next_cursor})
+
+    def fetch_token_batch(self, token_ids: list) -> list:
         """
-        try:
-            while(next_cursor := response.json()["data"].get("next")):
-                # 解析数据
-                response_data = self.parse_response(response)
-                # 启动多进程同时进行两个任务
-                metadata_source = response_data["metadata_source"]
-                media_source = response_data["media_source"]
-                self.metadata_downloader(metadata_source = metadata_source)
-                self.media_downloader(media_source = media_source)
-
-                # 更新游标
-                self.params_template.update({"cursor": next_cursor})
-                response = requests.get(url, headers=headers, params=self.params_template)
-
-            print(f"\n**********  ## {self.NFT_name} ## Download successfully! **********\n")
-            return True
+        通过批量查询接口按tokenId获取数据，供多平台聚合下载器使用
 
-        except Exception as e:
-            print(f"Error downloading: {self.NFT_name} Process startup failed: {e}\n")
-            return False
+        Args:
+            token_ids (list): tokenId 列表，不超过 max_batch_size 个
 
+        Returns:
+            list: Token_Record 列表
+        """
+        url = stb.get_endpoint(self.platform, self.chain_type, "batch")
+        headers = stb.get_headers()
+        headers.update({"X-API-KEY": stb.get_api("NFTScan")})
+        payload = {'show_attribute': 'true',
+                    'contract_address_with_token_id_list': [{'contract_address': self.contract_address, 'token_id': str(tokenId)}
+                                                            for tokenId in token_ids]}
+        self.wait_for_rate_limit()
+        response = self.request_page("post", url, json=payload, headers=headers)
+        check_response(response)
+        return self.parse_NFT_list(response.json().get("data") or [])
 
     def parse_response(self, response):
         """
@@ -514,76 +920,41 @@ class NFT_Downloader_for_Whole_Collection_NFTScan(NFT_Downloader_for_Whole_Colle
             response (Http response): HTTP响应数据
 
         Returns:
-            dict: 返回解析后的数据，包括metadata资源和media资源
+            list: Token_Record 列表
         """
-        metadata_dict = {}
-        metadata_source = {}
-        media_source = {}
-
-        NFT_list = response.json()["data"].get("content", [])
-        for NFT_item in NFT_list:
-            try:
-                tokenId = NFT_item.get("token_id")
-
-                # 解析metadata资源
-                """
-                {
-                    "tokenId_1": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    "tokenId_2": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    ……
-                }
-                
-                
-                """
-                metadata_source[tokenId] = {
-                    "raw" : NFT_item.get("metadata_json", None),
-                    "tokenUri" : NFT_item.get("token_uri", None)
-                    }
+        return self.parse_NFT_list(response.json()["data"].get("content", []))
 
-                # 解析media资源
-                # 将媒体资源统一成一种通用的表达方式
-                """
-                {
-                    "tokenId_1": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                    "tokenId_2": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                ……
-
-                }
-                
+    def parse_NFT_list(self, NFT_list):
+        """
+        将平台返回的NFT列表统一成 Token_Record 列表，分页接口和批量接口共用
 
-                """
-                source_list = []
-                source_list.append(NFT_item.get("content_uri", None))
-                source_list.append(NFT_item.get("image_uri", None))
-                source_list.append(NFT_item.get("nftscan_uri", None))
-                source_list.append(NFT_item.get("small_nftscan_uri", None))
+        Args:
+            NFT_list (list): NFT列表
 
+        Returns:
+            list: Token_Record 列表
+        """
+        record_list = []
+        for NFT_item in NFT_list:
+            try:
+                source_list = [NFT_item.get("content_uri", None),
+                                NFT_item.get("image_uri", None),
+                                NFT_item.get("nftscan_uri", None),
+                                NFT_item.get("small_nftscan_uri", None)]
                 # 解析文件格式
-                temp_format = NFT_item.get("content_type", None)
-                media_format = parse_file_format(temp_format, self.candidate_format)
-                media_source[tokenId] = {"source_list": source_list,
-                                        "format": media_format}
+                media_format = parse_file_format(NFT_item.get("content_type", None), self.candidate_format)
 
+                record_list.append(rtb.Token_Record(NFT_item.get("token_id"),
+                                                    raw = NFT_item.get("metadata_json", None),
+                                                    token_uri = NFT_item.get("token_uri", None),
+                                                    sources = source_list,
+                                                    format = media_format))
             except Exception as e:
                 # 抛出异常，跳过这个NFT
-                print(f"Response parsing exception: {e}. Skipping")
+                ltb.get_logger().warning(f"Response parsing exception: {e}. Skipping")
                 continue
 
-        metadata_dict["metadata_source"] = metadata_source
-        metadata_dict["media_source"] = media_source
-        return metadata_dict
+        return record_list
 
 
 class NFT_Downloader_for_Whole_Collection_NFTGo(NFT_Downloader_for_Whole_Collection):
@@ -592,6 +963,8 @@ class NFT_Downloader_for_Whole_Collection_NFTGo(NFT_Downloader_for_Whole_Collect
     详细细节参考：https://docs.nftgo.io/v2.0/reference/get_nfts_by_contract__chain__v1_collection__contract_address__nfts_get
     """
 
+    platform = "NFTGo"
+
     def __init__(self,
                 chain_type: str,
                 NFT_name: str,
@@ -602,48 +975,60 @@ class NFT_Downloader_for_Whole_Collection_NFTGo(NFT_Downloader_for_Whole_Collect
                 thread_num = 5,
                 total_supply = 10000,
                 start_index = 0,
-                interval_length = 50):
+                interval_length = None):
 
         super().__init__(chain_type, NFT_name, contract_address, candidate_format, save_path, process_num, thread_num, total_supply, start_index, interval_length)
 
-        # 设置请求参数模板
-        self.url_template = f"https://data-api.nftgo.io/{chain_type}/v1/collection/{contract_address}/nfts?limit={interval_length}"
+        # 设置请求链接和参数模板
+        self.url_template = stb.get_endpoint(self.platform, chain_type, "page", contract_address = contract_address)
+        self.params_template = {"limit": self.interval_length}
 
-    def download_media_and_metadata(self):
+    def iter_pages(self):
 
         headers = stb.get_headers()
         headers.update({"X-API-KEY": stb.get_api("NFTGo")})
-        print(f"\n**********  ## {self.NFT_name} ## Start downloading... **********\n")
-
-        response = requests.get(self.url_template, headers=headers)
-        # 因为openSea的响应数据中不存在文件格式，为了保证opensea数据格式的一致性，需要做文件格式的更新
-        demo_img_url = response.json()["nfts"][0].get("image", None)
+        params = dict(self.params_template)
+
+        self.wait_for_rate_limit()
+        response = self.request_page("get", self.url_template, headers=headers, params=params)
+        check_response(response)
+        # 因为NFTGo的响应数据中不存在文件格式，为了保证数据格式的一致性，需要做文件格式的更新
+        NFT_list = response.json().get("nfts") or []
+        demo_img_url = NFT_list[0].get("image", None) if NFT_list else None
         if demo_img_url:
             fmt = stb.get_media_format(demo_img_url)
             if fmt:
                 self.candidate_format = fmt
-        try:
-            while(next_cursor := response.json().get("next_cursor")):
-                # 解析数据
-                response_data = self.parse_response(response)
-                # 启动多进程同时进行两个任务
-                metadata_source = response_data["metadata_source"]
-                media_source = response_data["media_source"]
-                self.metadata_downloader(metadata_source = metadata_source)
-                self.media_downloader(media_source = media_source)
-
-                # 更新游标
-                # 在链接模版的“nfts?后面插入cursor参数
-                url = re.sub(r"(nfts\?)", r"\1cursor={}&".format(next_cursor), self.url_template)
-                response = requests.get(url, headers = headers)
-
-            print(f"\n**********  ## {self.NFT_name} ## Download successfully! **********\n")
-            return True
 
-        except Exception as e:
-            print(f"Error downloading: {self.NFT_name} Process startup failed: {e}\n")
-            return False
+        # 先处理当前页，再根据游标判断是否还有下一页，最后一页同样会被下载
+        while True:
+            yield self.parse_page(response)
+
+            if not (next_cursor := response.json().get("next_cursor")):
+                break
+            params.update({"cursor": next_cursor})
+            self.wait_for_rate_limit()
+            response = self.request_page("get", self.url_template, headers = headers, params = params)
+            check_response(response)
+
+    def fetch_token_batch(self, token_ids: list) -> list:
+        """
+        通过 nft/infos 接口按tokenId批量获取数据，供多平台聚合下载器使用
+
+        Args:
+            token_ids (list): tokenId 列表，不超过 max_batch_size 个
 
+        Returns:
+            list: Token_Record 列表
+        """
+        url = stb.get_endpoint(self.platform, self.chain_type, "batch")
+        headers = stb.get_headers()
+        headers.update({"X-API-KEY": stb.get_api("NFTGo")})
+        payload = {"params": [{"contract_address": self.contract_address, "token_id": str(tokenId)} for tokenId in token_ids]}
+        self.wait_for_rate_limit()
+        response = self.request_page("post", url, json=payload, headers=headers)
+        check_response(response)
+        return self.parse_NFT_list(response.json())
 
     def parse_response(self, response):
         """
@@ -653,36 +1038,24 @@ class NFT_Downloader_for_Whole_Collection_NFTGo(NFT_Downloader_for_Whole_Collect
             response (Http response): HTTP响应数据
 
         Returns:
-            dict: 返回解析后的数据，包括metadata资源和media资源
+            list: Token_Record 列表
+        """
+        return self.parse_NFT_list(response.json().get("nfts", []))
+
+    def parse_NFT_list(self, NFT_list):
         """
-        metadata_dict = {}
-        metadata_source = {}
-        media_source = {}
+        将平台返回的NFT列表统一成 Token_Record 列表，分页接口和批量接口共用
+
+        Args:
+            NFT_list (list): NFT列表
 
-        NFT_list = response.json().get("nfts", [])
+        Returns:
+            list: Token_Record 列表
+        """
+        record_list = []
         for NFT_item in NFT_list:
-            # 转换成字典
             try:
-                tokenId = NFT_item.get("token_id")
-
-                # 解析metadata资源
-                """
-                {
-                    "tokenId_1": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    "tokenId_2": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    ……
-                }
-                
-                
-                """
                 # 构造一个人造的metadata资源
-
                 """
                 一点学习心得：
 
@@ -696,47 +1069,23 @@ class NFT_Downloader_for_Whole_Collection_NFTGo(NFT_Downloader_for_Whole_Collect
                     在这种情况下，b 被定义在 if 语句的外部，使得它在 if 块之外也是可见的。
                 
                 """
-
                 if attributes := NFT_item.get("traits", None):
                         attributes = {"attributes": attributes}
-                metadata_source[tokenId] = {
-                    "raw" : attributes,
-                    "tokenUri" : NFT_item.get("metadata_url", None)
-                    }
 
-                # 解析media资源
-                # 将媒体资源统一成一种通用的表达方式
-                """
-                {
-                    "tokenId_1": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                    "tokenId_2": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                ……
-
-                }
-                
-
-                """
-                source_list = [NFT_item.get("image", None)]
                 # 解析文件格式
-                temp_format = NFT_item.get("content_type", None)
-                media_format = parse_file_format(temp_format, self.candidate_format)
-                media_source[tokenId] = {"source_list": source_list,
-                                        "format": media_format}
+                media_format = parse_file_format(NFT_item.get("content_type", None), self.candidate_format)
 
+                record_list.append(rtb.Token_Record(NFT_item.get("token_id"),
+                                                    raw = attributes,
+                                                    token_uri = NFT_item.get("metadata_url", None),
+                                                    sources = [NFT_item.get("image", None)],
+                                                    format = media_format))
             except Exception as e:
                 # 抛出异常，跳过这个NFT
-                print(f"Response parsing exception: {e}. Skipping")
+                ltb.get_logger().warning(f"Response parsing exception: {e}. Skipping")
                 continue
 
-        metadata_dict["metadata_source"] = metadata_source
-        metadata_dict["media_source"] = media_source
-        return metadata_dict
+        return record_list
 
 
 class NFT_Downloader_for_Whole_Collection_OpenSea(NFT_Downloader_for_Whole_Collection):
@@ -745,6 +1094,8 @@ class NFT_Downloader_for_Whole_Collection_OpenSea(NFT_Downloader_for_Whole_Colle
     基于OpenSea API的NFT下载器类，完整下载一整个NFT项目
     详细细节参考：https://docs.opensea.io/reference/list_nfts_by_contract
     """
+    platform = "OpenSea"
+
     def __init__(self,
                 chain_type: str,
                 NFT_name: str,
@@ -755,49 +1106,64 @@ class NFT_Downloader_for_Whole_Collection_OpenSea(NFT_Downloader_for_Whole_Colle
                 thread_num = 5,
                 total_supply = 10000,
                 start_index = 0,
-                interval_length = 80):
+                interval_length = None):
 
         super().__init__(chain_type, NFT_name, contract_address, candidate_format, save_path, process_num, thread_num, total_supply, start_index, interval_length)
 
         # 设置请求参数模板
-        self.url_template = f"https://api.opensea.io/api/v2/chain/{self.chain_type}/contract/{contract_address}/nfts?limit={interval_length}"
+        self.url_template = stb.get_endpoint(self.platform, chain_type, "page", contract_address = contract_address) + f"?limit={self.interval_length}"
 
-    def download_media_and_metadata(self):
+    def iter_pages(self):
 
         headers = stb.get_headers()
         headers.update({"x-api-key": stb.get_api("OpenSea")})
-        print(f"\n**********  ## {self.NFT_name} ## Start downloading... **********\n")
 
-        response = requests.get(self.url_template, headers=headers)
+        self.wait_for_rate_limit()
+        response = self.request_page("get", self.url_template, headers=headers)
+        check_response(response)
         # 因为openSea的响应数据中不存在文件格式，为了保证opensea数据格式的一致性，需要做文件格式的更新
-        demo_img_url = response.json()["nfts"][0].get("image_url", None)
+        NFT_list = response.json().get("nfts") or []
+        demo_img_url = NFT_list[0].get("image_url", None) if NFT_list else None
         if demo_img_url:
             fmt = stb.get_media_format(demo_img_url)
             if fmt:
                 self.candidate_format = fmt
-        try:
-            while(next_cursor := response.json().get("next")):
-                # 解析数据
-                response_data = self.parse_response(response)
-                # 启动多进程同时进行两个任务
-                metadata_source = response_data["metadata_source"]
-                media_source = response_data["media_source"]
-                self.metadata_downloader(metadata_source = metadata_source)
-                self.media_downloader(media_source = media_source)
-
-                # 更新游标
-                # 将 Base64 编码的字符串转换为 URL 编码的字符串
-                next_cursor = urllib.parse.quote(next_cursor)
-                url = self.url_template + f"&next={next_cursor}"
-                response = requests.get(url, headers = headers)
-
-            print(f"\n**********  ## {self.NFT_name} ## Download successfully! **********\n")
-            return True
 
-        except Exception as e:
-            print(f"Error downloading: {self.NFT_name} Process startup failed: {e}\n")
-            return False
+        # 先处理当前页，再根据游标判断是否还有下一页，最后一页同样会被下载
+        while True:
+            yield self.parse_page(response)
 
+            if not (next_cursor := response.json().get("next")):
+                break
+            # 将 Base64 编码的字符串转换为 URL 编码的字符串
+            next_cursor = urllib.parse.quote(next_cursor)
+            url = self.url_template + f"&next={next_cursor}"
+            self.wait_for_rate_limit()
+            response = self.request_page("get", url, headers = headers)
+            check_response(response)
+
+    def fetch_token_batch(self, token_ids: list) -> list:
+        """
+        OpenSea 没有批量接口，逐个获取tokenId对应的数据，供多平台聚合下载器使用
+
+        Args:
+            token_ids (list): tokenId 列表
+
+        Returns:
+            list: Token_Record 列表
+        """
+        headers = stb.get_headers()
+        headers.update({"x-api-key": stb.get_api("OpenSea")})
+        NFT_list = []
+        for tokenId in token_ids:
+            url = stb.get_endpoint(self.platform, self.chain_type, "batch", contract_address = self.contract_address, token_id = tokenId)
+            self.wait_for_rate_limit()
+            response = self.request_page("get", url, headers=headers)
+            if response.status_code == 404:
+                continue
+            check_response(response)
+            NFT_list.append(response.json()["nft"])
+        return self.parse_NFT_list(NFT_list)
 
     def parse_response(self, response):
         """
@@ -807,81 +1173,513 @@ class NFT_Downloader_for_Whole_Collection_OpenSea(NFT_Downloader_for_Whole_Colle
             response (Http response): HTTP响应数据
 
         Returns:
-            dict: 返回解析后的数据，包括metadata资源和media资源
+            list: Token_Record 列表
+        """
+        return self.parse_NFT_list(response.json().get("nfts", []))
+
+    def parse_NFT_list(self, NFT_list):
         """
-        metadata_dict = {}
-        metadata_source = {}
-        media_source = {}
+        将平台返回的NFT列表统一成 Token_Record 列表，分页接口和批量接口共用
 
-        NFT_list = response.json().get("nfts", [])
+        Args:
+            NFT_list (list): NFT列表
+
+        Returns:
+            list: Token_Record 列表
+        """
+        record_list = []
         for NFT_item in NFT_list:
-            # 转换成字典
             try:
-                tokenId = NFT_item.get("identifier")
+                source_list = [NFT_item.get("image_url", None),
+                                NFT_item.get("display_image_url", None)]
+                # 解析文件格式
+                media_format = parse_file_format(NFT_item.get("content_type", None), self.candidate_format)
 
-                # 解析metadata资源
-                """
-                {
-                    "tokenId_1": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    "tokenId_2": {
-                        "raw": metadata,
-                        "tokenUri": tokenUri
-                    },
-                    ……
-                }
-                
-                
-                """
-                metadata_source[tokenId] = {
-                    "raw" : NFT_item.get("metadata", None),
-                    "tokenUri" : NFT_item.get("metadata_url", None)
-                    }
+                record_list.append(rtb.Token_Record(NFT_item.get("identifier"),
+                                                    raw = NFT_item.get("metadata", None),
+                                                    token_uri = NFT_item.get("metadata_url", None),
+                                                    sources = source_list,
+                                                    format = media_format))
+            except Exception as e:
+                # 抛出异常，跳过这个NFT
+                ltb.get_logger().warning(f"Response parsing exception: {e}. Skipping")
+                continue
 
-                # 解析media资源
-                # 将媒体资源统一成一种通用的表达方式
-                """
-                {
-                    "tokenId_1": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                    "tokenId_2": {
-                        "source_list": [url1, url2, url3, ...],
-                        "format": ".png"
-                },
-                ……
-
-                }
-                
+        return record_list
 
-                """
-                source_list = []
-                source_list.append(NFT_item.get("image_url", None))
-                source_list.append(NFT_item.get("display_image_url", None))
+class NFT_Downloader_for_Whole_Collection_RPC(NFT_Downloader_for_Whole_Collection):
 
-                # 解析文件格式
-                temp_format = NFT_item.get("content_type", None)
-                media_format = parse_file_format(temp_format, self.candidate_format)
-                media_source[tokenId] = {"source_list": source_list,
-                                        "format": media_format}
+    """
+    直接通过 JSON-RPC 节点调用 tokenURI/uri 的NFT下载器类，不依赖任何NFT索引平台
+    tokenURI 指向的 metadata 下载完成后，再从 metadata 中解析出媒体资源链接
+    """
+    def __init__(self,
+                chain_type: str,
+                NFT_name: str,
+                contract_address: str,
+                candidate_format: str,
+                save_path: str,
+                process_num = 4,
+                thread_num = 10,
+                total_supply = 10000,
+                start_index = 0,
+                interval_length = 1000,
+                rpc_url = None,
+                token_type = "ERC721",
+                use_multicall = False):
+
+        super().__init__(chain_type, NFT_name, contract_address, candidate_format, save_path, process_num, thread_num, total_supply, start_index, interval_length)
+        self.rpc_url = rpc_url or rpc.get_rpc_url(chain_type)
+        if self.rpc_url is None:
+            raise ValueError(f"No JSON-RPC endpoint configured for {chain_type}!")
+        self.token_type = token_type
+        self.use_multicall = use_multicall
+        self.payload_list = self.generate_payload()
+
+    def generate_payload(self, *args, **kwargs):
+        """
+        按 interval_length 将tokenId切分成若干个任务，每个任务对应一次 batch 读取
+
+        Returns:
+            list: [[tokenId, tokenId, ...], ...]
+        """
+        token_ids = list(range(self.start_index, self.start_index + self.total_supply))
+        return [token_ids[i:i + self.interval_length] for i in range(0, len(token_ids), self.interval_length)]
+
+    def load_task_plan(self, plan: dict) -> None:
+        """
+        使用 discovery_toolbox 探测出的tokenId布局生成任务，跳过不存在的token
 
+        Args:
+            plan (dict): discover_token_space 的返回值
+        """
+        self.payload_list = dst.create_task_plan(plan, self.interval_length)
+
+    def download_media_and_metadata(self, token_ids = None):
+        """
+        下载全部的media和metadata资源
+
+        Args:
+            token_ids (list, optional): 只下载指定的tokenId，默认下载整个项目
+        """
+        if token_ids is not None:
+            token_ids = list(token_ids)
+            payload_list = [token_ids[i:i + self.interval_length] for i in range(0, len(token_ids), self.interval_length)]
+        else:
+            payload_list = self.payload_list
+
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Start downloading... **********")
+        with ltb.progress(self.NFT_name, sum(len(payload) for payload in payload_list)):
+            try:
+                with mp.Pool(processes = self.process_num) as pool:
+                    failed = set().union(*pool.map(self.single_process_worker, payload_list))
+                pool.close()
+                pool.join()
             except Exception as e:
-                # 抛出异常，跳过这个NFT
-                print(f"Response parsing exception: {e}. Skipping")
+                ltb.get_logger().error(f"Error downloading: {self.NFT_name} Process startup failed: {e}")
+                return False
+
+        if failed:
+            ltb.get_logger().error(f"Error downloading: {self.NFT_name} {len(failed)} tokens failed, e.g. {sorted(failed)[:10]}")
+            return False
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Download successfully! **********")
+        return True
+
+    def read_page(self, token_ids) -> list:
+        """读取一组token的 tokenURI 并解析成 Token_Record 列表"""
+        reader = rpc.RPC_TokenURI_Reader(rpc_url = self.rpc_url,
+                                        contract_address = self.contract_address,
+                                        token_type = self.token_type,
+                                        use_multicall = self.use_multicall)
+        with ttb.get_tracer().span("page_fetch", provider = "RPC", host = cct.get_host(self.rpc_url)) as span:
+            token_uris = reader.read_token_uris(token_ids)
+            span["status"] = 200
+        ttb.get_tracer().listed(token_uris, provider = "RPC")
+        return self.parse_response(token_uris)
+
+    def iter_pages(self):
+        for token_ids in self.payload_list:
+            yield self.read_page(token_ids)
+
+    def process_response_data(self, response_data) -> set:
+        """
+        下载一页 tokenURI 对应的 metadata，再从 metadata 中解析并下载媒体资源。
+        差异同步模式下先下载全部 metadata，只重写内容变化的 metadata，以及重新下载图片字段变化的媒体资源
+
+        Returns:
+            set: metadata和媒体文件都已经保存的tokenId
+        """
+        token_ids = [record.token_id for record in response_data]
+        failed = set()
+        if self.diff_index is None:
+            metadata_records = response_data
+            metadata_results = self.metadata_downloader(metadata_records)
+            # tokenURI 只给出了 metadata 的位置，媒体资源链接需要从下载好的 metadata 中解析
+            media_records = self.parse_media_source(token_ids)
+            media_results = self.media_downloader(media_records)
+        else:
+            # 修改 baseURI 揭示时 tokenURI 不变，只有链接指向的内容变化，因此按下载到的 metadata 内容计算哈希值
+            fetched_records = self.fetch_metadata_records(response_data)
+            # 下载失败的token不写入索引，保留之前的记录，下次同步时重新下载
+            failed.update(record.token_id for record, fetched in zip(response_data, fetched_records) if fetched is None)
+            fetched_records = [record for record in fetched_records if record is not None]
+            metadata_records, _, entries = self.diff_index.filter_changed(fetched_records, self.media_file, self.metadata_file)
+            metadata_results = self.metadata_downloader(metadata_records)
+            # 索引中的图片链接是下载之前的值，与新的 metadata 比较
+            media_records = [record for record in self.parse_media_source(record.token_id for record in fetched_records)
+                                if dft.get_image_uri(record) != entries[str(record.token_id)]["image"]
+                                or not self.media_file(record.token_id, record.format).exists()]
+            media_results = self.media_downloader(media_records)
+            for record in media_records:
+                entries[str(record.token_id)]["image"] = dft.get_image_uri(record)
+            self.record_diff(entries, metadata_records, metadata_results, media_records, media_results)
+        failed.update(record.token_id for record, success in zip(metadata_records, metadata_results) if not success)
+        failed.update(record.token_id for record, success in zip(media_records, media_results) if not success)
+        self.flush_output()
+        mtb.get_registry().dump_snapshot(force = True)
+        ttb.get_tracer().flush()
+        ptb.checkpoint(force = True)
+        ltb.flush()
+        return set(token_ids) - failed
+
+    def fetch_metadata_records(self, record_list) -> list:
+        """
+        下载 tokenURI 指向的 metadata 并放入 raw 中，data: 形式的 tokenURI 已经带有 metadata，保持不变
+
+        Returns:
+            list: 与 record_list 对应的 Token_Record，下载失败的token对应 None
+        """
+        def fetch(record):
+            if record.raw is not None or record.token_uri is None:
+                return record
+            metadata = self.fetch_metadata(record)
+            return None if metadata is None else rtb.Token_Record(record.token_id, raw = metadata, token_uri = record.token_uri)
+
+        with ThreadPoolExecutor(max_workers=self.get_worker_num(len(record_list))) as executor:
+            return list(executor.map(fetch, record_list))
+
+    def single_process_worker(self, token_ids) -> set:
+        """
+        下载一组token
+
+        Returns:
+            set: 下载失败的tokenId，读取 tokenURI 失败时为整组token；合约 revert 的token不存在，不算失败
+        """
+        try:
+            response_data = self.read_page(token_ids)
+        except Exception as e:
+            ltb.get_logger().error(f"{self.NFT_name} Error reading tokenURI of {len(token_ids)} tokens: {e}")
+            return {stb.parse_token_id(token_id) for token_id in token_ids}
+        return {record.token_id for record in response_data} - self.process_response_data(response_data)
+
+    def parse_response(self, response):
+        """
+        将 tokenURI 转换成只包含 metadata 资源的 Token_Record
+
+        Args:
+            response (dict): key 为 tokenId，value 为 tokenURI
+
+        Returns:
+            list: Token_Record 列表
+        """
+        record_list = []
+        gateway = stb.get_api("IPFS_gateways")[0]
+        for tokenId, token_uri in response.items():
+            if token_uri is None:
+                ltb.get_logger().warning(f"{self.NFT_name} tokenURI of {tokenId} not found. Skipping", extra = {"token": tokenId})
                 continue
+            with ttb.get_tracer().span("resolve_uri", token = tokenId):
+                raw, url = rpc.resolve_uri(token_uri, gateway)
+            record_list.append(rtb.Token_Record(tokenId, raw = raw, token_uri = url))
+
+        return record_list
+
+    def parse_media_source(self, token_ids) -> list:
+        """
+        从已经保存的 metadata 文件中解析媒体资源
+
+        Args:
+            token_ids (iterable): tokenId 列表
+
+        Returns:
+            list: 包含媒体资源的 Token_Record 列表
+        """
+        record_list = []
+        for tokenId in token_ids:
+            if self.sink is not None:
+                # 分片中的metadata在本页结束前保留在内存中
+                metadata = self.sink.load_json(tokenId)
+            else:
+                file_path = self.metadata_file(tokenId)
+                if not file_path.exists():
+                    continue
+                metadata = fio.load_json(file_path)
+            if not isinstance(metadata, dict):
+                continue
+            source_list = [metadata.get(field) for field in ["image", "image_url", "animation_url"]
+                            if isinstance(metadata.get(field), str)]
+            if not source_list:
+                continue
+
+            # 链接中带有扩展名时直接使用，否则使用候选格式
+            suffix = Path(urllib.parse.urlparse(source_list[0]).path).suffix
+            media_format = suffix if suffix else self.candidate_format
+            record_list.append(rtb.Token_Record(tokenId, sources = source_list, format = media_format))
+        return record_list
+
+
+class NFT_Downloader_for_Whole_Collection_Aggregator(NFT_Downloader_for_Whole_Collection):
+
+    """
+    多平台聚合下载器：把同一个项目的tokenId范围同时分给所有已配置API密钥的平台，叠加各个平台的额度。
+    每个平台每次领取的token数量由它实测的吞吐量决定，某个平台额度用尽后，剩余的范围会被其他平台领取。
+    所有平台都会解析成相同的 Token_Record 列表，因此数据可以互换。
+    """
+    def __init__(self,
+                chain_type: str,
+                NFT_name: str,
+                contract_address: str,
+                candidate_format: str,
+                save_path: str,
+                process_num = 4,
+                thread_num = 10,
+                total_supply = 10000,
+                start_index = 0,
+                interval_length = 100,
+                platforms = None,
+                target_seconds = 5):
+        """
+        Args:
+            process_num (int): 每个平台同时领取任务的线程数
+            platforms (list, optional): 参与下载的平台，默认使用所有支持该链且配置了API密钥的平台
+            target_seconds (int): 每次领取的任务量大约需要多少秒完成，用于按吞吐量计算领取数量
+        """
+        super().__init__(chain_type, NFT_name, contract_address, candidate_format, save_path, process_num, thread_num, total_supply, start_index, interval_length)
+        platforms = platforms or stb.get_configured_platforms(chain_type)
+        if not platforms:
+            raise ValueError(f"No platform with API keys configured for {chain_type}!")
+        self.target_seconds = target_seconds
+
+        # 各个平台的下载器只用来按tokenId批量获取数据，下载统一由聚合下载器完成
+        self.providers = {}
+        for platform in platforms:
+            self.providers[platform] = PLATFORM_DOWNLOADERS[platform](chain_type = chain_type,
+                                                                        NFT_name = NFT_name,
+                                                                        contract_address = contract_address,
+                                                                        candidate_format = candidate_format,
+                                                                        save_path = save_path,
+                                                                        total_supply = total_supply,
+                                                                        start_index = start_index)
+        # 待领取的tokenId区间 [start, end)
+        self.pending_ranges = deque([[start_index, start_index + total_supply]])
+        # 已经被领取但还没有完成的token数量
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def load_task_plan(self, plan: dict) -> None:
+        """
+        使用 discovery_toolbox 探测出的tokenId布局，只领取存在的token
+
+        Args:
+            plan (dict): discover_token_space 的返回值
+        """
+        self.pending_ranges = deque([start, end + 1] for start, end in plan["ranges"])
+
+    def take_token_ids(self, count: int) -> list:
+        """从待领取的区间中取出最多 count 个tokenId"""
+        token_ids = []
+        with self.lock:
+            while self.pending_ranges and len(token_ids) < count:
+                token_range = self.pending_ranges[0]
+                take = min(count - len(token_ids), token_range[1] - token_range[0])
+                token_ids.extend(range(token_range[0], token_range[0] + take))
+                token_range[0] += take
+                if token_range[0] >= token_range[1]:
+                    self.pending_ranges.popleft()
+            self.in_flight += len(token_ids)
+        return token_ids
+
+    def return_token_ids(self, token_ids: list) -> None:
+        """将没有完成的tokenId放回待领取区间的最前面，让其他平台优先领取"""
+        with self.lock:
+            for token_range in reversed(dst.compress_ranges(sorted(token_ids))):
+                self.pending_ranges.appendleft([token_range[0], token_range[1] + 1])
+
+    def provider_worker(self, platform: str, stats: dict) -> None:
+        """
+        单个平台的领取线程：按吞吐量领取tokenId，批量获取数据并下载，额度用尽时退出
+
+        Args:
+            platform (str): 平台名称
+            stats (dict): 平台的统计信息，多个线程共享
+        """
+        provider = self.providers[platform]
+        while not stats["retired"]:
+            # 吞吐量未知时先领取一个批次，之后按 吞吐量 × target_seconds 领取
+            count = max(provider.max_batch_size, int(stats["throughput"] * self.target_seconds))
+            count = min(count, provider.max_batch_size * 20)
+            if cht.is_enabled():
+                # 使用缓存时每次只领取一个批次，批次的边界和录制时一致，replay 才能命中缓存
+                count = provider.max_batch_size
+            token_ids = self.take_token_ids(count)
+            if not token_ids:
+                # 其他平台失败时会放回tokenId，全部完成之前不能退出
+                if self.in_flight == 0:
+                    return
+                time.sleep(1)
+                continue
+
+            begin = time.time()
+            done = []
+            try:
+                for i in range(0, len(token_ids), provider.max_batch_size):
+                    batch = token_ids[i:i + provider.max_batch_size]
+                    response_data = provider.fetch_token_batch(batch)
+                    ttb.get_tracer().listed((record.token_id for record in response_data), provider = platform)
+                    self.process_response_data(response_data)
+                    done.extend(batch)
+            except Quota_Exceeded_Error as e:
+                self.return_token_ids(token_ids[len(done):])
+                with self.lock:
+                    stats["quota_errors"] += 1
+                    # 连续多次被限流，认为额度已经用尽，剩余任务交给其他平台
+                    if stats["quota_errors"] >= 3:
+                        stats["retired"] = True
+                        ltb.get_logger().warning(f"{self.NFT_name} {platform} quota exceeded, handing its ranges to other platforms: {e}")
+                time.sleep(2 ** stats["quota_errors"])
+            except Exception as e:
+                ltb.get_logger().error(f"{self.NFT_name} {platform} Error encountered: {e}")
+                self.return_token_ids(token_ids[len(done):])
+                with self.lock:
+                    stats["errors"] += 1
+                    if stats["errors"] >= 10:
+                        stats["retired"] = True
+            else:
+                with self.lock:
+                    stats["quota_errors"] = 0
+            finally:
+                elapsed = max(time.time() - begin, 1e-3)
+                with self.lock:
+                    self.in_flight -= len(token_ids)
+                    stats["tokens"] += len(done)
+                    # 指数加权平均的吞吐量（token/秒）
+                    rate = len(done) / elapsed
+                    stats["throughput"] = rate if stats["throughput"] == 0 else 0.7 * stats["throughput"] + 0.3 * rate
+
+    def iter_pages(self):
+        """
+        按页轮流使用各个平台的批量接口，每页领取一个批次，供批量下载和后台任务按页调度。
+        某个平台连续 3 次额度不足时不再使用，它没有完成的tokenId交给其他平台
+        """
+        platforms = deque(self.providers)
+        quota_errors = dict.fromkeys(self.providers, 0)
+        while platforms and (token_ids := self.take_token_ids(self.providers[platforms[0]].max_batch_size)):
+            platform = platforms[0]
+            platforms.rotate(-1)
+            try:
+                response_data = self.providers[platform].fetch_token_batch(token_ids)
+            except Quota_Exceeded_Error as e:
+                self.return_token_ids(token_ids)
+                quota_errors[platform] += 1
+                if quota_errors[platform] >= 3:
+                    platforms.remove(platform)
+                    ltb.get_logger().warning(f"{self.NFT_name} {platform} quota exceeded, handing its ranges to other platforms: {e}")
+                continue
+            except Exception:
+                # 其他错误交给调用方处理，领取的tokenId放回计划中，重新迭代或者其他任务还可以领取
+                self.return_token_ids(token_ids)
+                raise
+            finally:
+                with self.lock:
+                    self.in_flight -= len(token_ids)
+            quota_errors[platform] = 0
+            ttb.get_tracer().listed((record.token_id for record in response_data), provider = platform)
+            yield response_data
+        if self.pending_ranges:
+            raise RuntimeError(f"{self.NFT_name} all platforms stopped, remaining ranges: {list(self.pending_ranges)}")
+
+    def download_media_and_metadata(self):
+
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Start downloading with {', '.join(self.providers)}... **********")
+        stats_dict = {platform: {"tokens": 0, "throughput": 0.0, "quota_errors": 0, "errors": 0, "retired": False}
+                    for platform in self.providers}
+        with ltb.progress(self.NFT_name, self.total_supply):
+            with ThreadPoolExecutor(max_workers = len(self.providers) * self.process_num) as executor:
+                for platform in self.providers:
+                    for _ in range(self.process_num):
+                        executor.submit(self.provider_worker, platform, stats_dict[platform])
+                executor.shutdown(wait=True)
+
+        for platform, stats in stats_dict.items():
+            ltb.get_logger().info(f"{platform}: {stats['tokens']} tokens, {stats['throughput']:.1f} tokens/s{' (quota exceeded)' if stats['retired'] else ''}")
+
+        if self.pending_ranges:
+            ltb.get_logger().error(f"Error downloading: {self.NFT_name} all platforms stopped, remaining ranges: {list(self.pending_ranges)}")
+            return False
+        ltb.get_logger().info(f"**********  ## {self.NFT_name} ## Download successfully! **********")
+        return True
+
+    def parse_response(self, response):
+        raise NotImplementedError("The aggregator parses responses through each platform's downloader.")
+
+
+# 平台名称与下载器类的对应关系，与 platform_info.json 中的平台名称一致
+PLATFORM_DOWNLOADERS = {
+    "Alchemy": NFT_Downloader_for_Whole_Collection_Alchemy,
+    "NFTScan": NFT_Downloader_for_Whole_Collection_NFTScan,
+    "NFTGo": NFT_Downloader_for_Whole_Collection_NFTGo,
+    "OpenSea": NFT_Downloader_for_Whole_Collection_OpenSea,
+}
 
-        metadata_dict["metadata_source"] = metadata_source
-        metadata_dict["media_source"] = media_source
-        return metadata_dict
 
 def NFT_Downloader_for_Whole_Collection_IPFS():
     # 使用终端命令下载整个collection中的所有图片
     pass
 
-# 解析文件格式
+class Parsed_Response(object):
+    """
+    只解码一次的响应：分页循环中 parse_response 和读取游标都会调用 json()，解码结果会被缓存，
+    其他属性直接转发给原始响应
+    """
+
+    __slots__ = ("response", "body")
+
+    def __init__(self, response):
+        self.response = response
+        self.body = None
+
+    def json(self):
+        if self.body is None:
+            self.body = self.response.json()
+        return self.body
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+
+class Quota_Exceeded_Error(Exception):
+    """平台返回限流或者额度用尽"""
+    pass
+
+
+def check_response(response) -> None:
+    """
+    检查平台接口的响应状态
+
+    Args:
+        response (Http response): HTTP响应数据
+
+    Raises:
+        Quota_Exceeded_Error: 被限流或额度用尽
+        RuntimeError: 其他错误
+    """
+    if response.status_code in (402, 429):
+        raise Quota_Exceeded_Error(f"{response.url} Error: {response.status_code}")
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.url} Error: {response.status_code}")
+
+# 解析文件格式，同一个项目中只有少数几种格式，结果会被缓存
+@functools.lru_cache(maxsize=256)
 def parse_file_format(temp_format: str, candidate_format) -> str:
     """
     解析文件格式
@@ -901,7 +1699,18 @@ def parse_file_format(temp_format: str, candidate_format) -> str:
         media_format = ".svg"
     else:
         media_format = f".{temp_format.split('/')[-1]}"
-    return media_format
+    return sys.intern(media_format)
+
+
+# CID v0 的格式是一个 base58 编码的 SHA-256 hash, 长度是 46 个字符, 以 "Qm" 开头
+CID_V0_PATTERN = re.compile(r'^Qm[1-9A-HJ-NP-Za-km-z]{44}$')
+
+# CID v1 是 base32 编码，前缀是 'b'，通常是 59 个字符
+CID_V1_PATTERN = re.compile(r'^b[2-7a-z]{58}$')
+
+# CID v1 也可能是 base58 编码，前缀可以是 'z'，'Z'，'m'，'M' 等等，具体长度和前缀依赖于编码
+# 简单的匹配 base58 编码，通常 CID v1 base58 编码的长度在 32 到 59 之间
+CID_V1_BASE58_PATTERN = re.compile(r'^[123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz]{32,59}$')
 
 
 def is_ipfs_cid(uri: str):
@@ -923,38 +1732,33 @@ def is_ipfs_cid(uri: str):
         else:
             CID = uri.split("ipfs/")[1]
     else:
-        # CID v0 的格式是一个 base58 编码的 SHA-256 hash, 长度是 46 个字符, 以 "Qm" 开头
-        cid_v0_pattern = re.compile(r'^Qm[1-9A-HJ-NP-Za-km-z]{44}$')
-        
-        # CID v1 是 base32 编码，前缀是 'b'，通常是 59 个字符
-        cid_v1_pattern = re.compile(r'^b[2-7a-z]{58}$')
-        
-        # CID v1 也可能是 base58 编码，前缀可以是 'z'，'Z'，'m'，'M' 等等，具体长度和前缀依赖于编码
-        # 简单的匹配 base58 编码，通常 CID v1 base58 编码的长度在 32 到 59 之间
-        cid_v1_base58_pattern = re.compile(r'^[123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz]{32,59}$')
-    
         # 判断是否是有效的 CID
-        if bool(cid_v0_pattern.match(uri) or cid_v1_pattern.match(uri) or cid_v1_base58_pattern.match(uri)):
+        if bool(CID_V0_PATTERN.match(uri) or CID_V1_PATTERN.match(uri) or CID_V1_BASE58_PATTERN.match(uri)):
             CID = uri
     
     return CID
 
-def download_from_IPFS(CID, file_path):
+def download_from_IPFS(CID, file_path, job = None, provider = None, validate = None):
 
     IPFS_gateways = stb.get_api("IPFS_gateways")
-    # 使用IDM下载器下载图片
-    # 将CID拼接到IPFS网关上，依次尝试下载，直到成功
-    for gateway in IPFS_gateways:
+    registry = mtb.get_registry()
+    # 将CID拼接到IPFS网关上，依次尝试下载，直到成功，下载经过全局带宽控制
+    for attempt, gateway in enumerate(IPFS_gateways):
         try:
             url = f"{gateway}{CID}"
-            print(f"Downloading from IPFS: {url}")
-            downloader = Downloader()
-            downloader.download(url=url, path=file_path)
-            print(f"{file_path.name} downloaded successfully.")
+            if attempt > 0:
+                registry.retry("media_fetch", provider, cct.get_host(url))
+            ltb.get_logger().debug(f"Downloading from IPFS: {url}")
+            with cct.get_controller().slot(url) as slot, \
+                    registry.timer("media_fetch", provider, cct.get_host(url)) as sample, \
+                    ttb.get_tracer().span("media_attempt", host = cct.get_host(url), url = url) as span:
+                slot["nbytes"] = sample["nbytes"] = span["bytes"] = bwt.stream_download(url, file_path, job = job, session = stb.get_session(), validate = validate, slot = slot)
+                sample["status"] = span["status"] = 200
+            ltb.log_success(f"{file_path.name} downloaded successfully.")
             return True
         except Exception as e:
-            print(f"Error downloading {url}: {e}")
-    print(f"Failed to download {CID} after trying all URLs.")
+            ltb.get_logger().warning(f"Error downloading {url}: {e}")
+    ltb.get_logger().warning(f"Failed to download {CID} after trying all URLs.")
     return False
 
 
@@ -971,6 +1775,9 @@ def download_NFT_collection_from_IPFS(metadata_path, img_path, delimiter="/"):
         None:
 
     """
+    # 只有这个辅助函数使用进度条，导入下载模块时不再加载 tqdm
+    from tqdm import tqdm
+
     with ipfshttpclient.connect() as client:
         file_list = os.listdir(metadata_path)
         for file in tqdm(file_list, desc="Downloading images", unit="file", ncols=150, leave=False):
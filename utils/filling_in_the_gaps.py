@@ -14,10 +14,10 @@ import re
 
 
 import requests
+import utils.bandwidth_toolbox as bwt
 import utils.file_io as fio
+import utils.layout_toolbox as lyt
 import utils.spider_toolbox as stb
-from internetdownloadmanager import Downloader
-from tqdm import tqdm
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -28,6 +28,9 @@ from source.CONST_ENV import CONST_ENV as ENV
 class Add_Unreleased_NFT(object):
     """下载单元类，用于多线程下载
     """
+    # 文件保存在项目文件夹下的这个子文件夹中
+    folder = "img"
+
     def __init__(self,thread_num, NFT_name, save_path, base_url, NFT_list, candidate_format):
         self.thread_num = thread_num
         self.NFT_name = NFT_name
@@ -35,6 +38,23 @@ class Add_Unreleased_NFT(object):
         self.base_url = base_url
         self.NFT_list = NFT_list
         self.candidate_format = candidate_format
+        self.base_path = os.path.join(self.save_path, f"{self.NFT_name}/{self.folder}")
+        # 项目选择过分层的目录结构时，以tokenId命名的文件保存到对应的子文件夹中
+        self.layout = lyt.load_layout(os.path.join(self.save_path, self.NFT_name))
+
+    def get_file_path(self, url) -> str:
+        """根据链接中的文件名获取保存路径"""
+        file_name = url.split("/")[-1]
+        stem, suffix = os.path.splitext(file_name)
+        if stem.isdigit():
+            return str(self.layout.path(self.folder, int(stem), suffix))
+        return os.path.join(self.base_path, file_name)
+
+    def record_file(self, file_path) -> None:
+        """下载成功后把路径记录到 manifest"""
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        if stem.isdigit():
+            self.layout.record(int(stem), self.folder, file_path)
 
     def payload_generator(self, NFT_list):
         """
@@ -55,6 +75,8 @@ class Add_Unreleased_NFT(object):
         """
         payload_list = self.payload_generator(self.NFT_list)
         print("Start download...")
+        # 文件夹在开始下载前创建一次，不在每个下载线程中重复检查
+        fio.check_dir(self.base_path)
         # 启用多线程下载图片
         with ThreadPoolExecutor(max_workers = self.thread_num) as executor:
             # 使用 functools.partial 应用额外的参数
@@ -62,12 +84,13 @@ class Add_Unreleased_NFT(object):
             executor.map(partial_worker, payload_list)
             # 等待所有线程完成
             executor.shutdown(wait=True)
+        self.layout.flush()
 
     # https://ipfs.io/ipfs/bafybeib6rkqikdf7czbrtzjphk5k6cdi44smd5ewwc3ysihwr3g2onpwl4/3.png
 
     def single_worker(self, url) -> None:
         """
-        启用idm下载图片
+        以数据块为单位下载图片，下载速度受全局带宽控制
 
         Args:
             url (dict): 资源链接
@@ -75,18 +98,14 @@ class Add_Unreleased_NFT(object):
             save_path (str): 文件的保存路径
         """
 
-        base_path = os.path.join(self.save_path, f"{self.NFT_name}/img")
         img_name = url.split("/")[-1]
         # 只取名字中的数字
         # img_name = url.split("/")[-1] + self.candidate_format
-        file_path = os.path.join(base_path, img_name)
-        # 先检查文件夹是否存在，不存在则创建
-        fio.check_dir(base_path)
+        file_path = self.get_file_path(url)
 
-        downloader = Downloader()              
         try:
-
-            downloader.download(url = url, path= file_path)
+            bwt.stream_download(url, file_path, job = self.NFT_name)
+            self.record_file(file_path)
             print(f"{self.NFT_name} Image{img_name} downloaded successfully.")
         except Exception as e:
             print(f"Error downloading image {img_name}: {e}, retrying...")
@@ -94,6 +113,8 @@ class Add_Unreleased_NFT(object):
 class Add_Unreleased_NFT_metadata(Add_Unreleased_NFT):
     """下载单元类，用于多线程下载
     """
+    folder = "metadata"
+
     def __init__(self,thread_num, NFT_name, save_path, base_url, NFT_list, candidate_format):
         super().__init__(thread_num, NFT_name, save_path, base_url, NFT_list, candidate_format)
 
@@ -120,13 +141,10 @@ class Add_Unreleased_NFT_metadata(Add_Unreleased_NFT):
             save_path (str): 文件的保存路径
         """
 
-        base_path = os.path.join(self.save_path, f"{self.NFT_name}/metadata")
         json_name = url.split("/")[-1]
 
-        file_path = os.path.join(base_path, json_name)
+        file_path = self.get_file_path(url)
         # file_path = os.path.join(base_path, json_name + self.candidate_format)
-        # 先检查文件夹是否存在，不存在则创建
-        fio.check_dir(base_path)
         # 发送HTTP GET请求到指定的URL
         response = requests.get(url)
 
@@ -135,6 +153,7 @@ class Add_Unreleased_NFT_metadata(Add_Unreleased_NFT):
             # 如果成功，将响应内容写入文件
             with open(file_path, 'wb') as file:
                 file.write(response.content)
+            self.record_file(file_path)
             print(f"Download {json_name}{self.candidate_format} successfully.")
         else:
             print(f"Failed to download. Status code: {response.status_code}")
@@ -250,6 +269,9 @@ def add_missing_NFT_from_IPFS(task_range, metadata_path, img_path, delimiter="/"
         None:
 
     """
+    # 进度条只在这里使用，按需导入
+    from tqdm import tqdm
+
     with ipfshttpclient.connect() as client:
         begin, end = task_range
         for index in tqdm(range(begin, end+1), desc="Downloading images", unit="file", ncols=150, leave=False):
@@ -0,0 +1,292 @@
+"""
+后台下载任务管理
+
+图形界面的点击事件只负责提交任务和读取进度，下载在后台工作线程中进行：
+    1. 和 batch_toolbox 一样按页调度，所有任务共用同一组页面工作线程、连接池、限速器、并发控制器和带宽控制器，
+       多个任务可以同时下载，一个十万级别的任务不会独占全部资源
+    2. 停止任务时只设置取消标记，工作线程在页与页之间检查标记，当前页下载完成后保存检查点再退出
+    3. 检查点记录metadata和媒体文件都已经保存的tokenId，保存在 ENV.JOB_STATE_PATH，再次提交同一个项目时跳过这些token，
+       下载失败的token不记录，恢复任务时重新下载；所有页都下载完但有token失败的任务状态为 partial，再次提交时只重新下载失败的token
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.batch_toolbox as btb
+import utils.file_io as fio
+import utils.log_toolbox as ltb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+CANCELLED = "cancelled"
+FINISHED = "finished"
+# 所有页都已经下载，但有token下载失败
+PARTIAL = "partial"
+FAILED = "failed"
+TERMINAL_STATES = (CANCELLED, FINISHED, PARTIAL, FAILED)
+
+# 两次保存检查点之间的最短间隔（秒）
+CHECKPOINT_INTERVAL = 30
+
+
+class Download_Job(btb.Batch_Job):
+    """
+    后台下载的单个项目，在 Batch_Job 的基础上增加状态、取消标记和检查点
+    """
+
+    def __init__(self, job_id: int, chain_type: str, contract_address: str, platform = None, save_path = ENV.DATASET_PATH, thread_num = 4):
+        super().__init__(chain_type, contract_address, platform)
+        self.job_id = job_id
+        self.save_path = Path(save_path)
+        self.thread_num = thread_num
+        self.status = QUEUED
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.completed = set()
+        self.resumed = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.last_checkpoint = 0.0
+        self.max_workers = None
+
+    @property
+    def name(self) -> str:
+        if self.collection_info is not None:
+            return self.collection_info["NFT_name"]
+        return self.contract_address
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return ENV.JOB_STATE_PATH / f"{self.chain_type}_{self.contract_address}.json"
+
+    def load_checkpoint(self) -> None:
+        """读取上一次没有完成的任务的检查点，全部下载成功（finished）的任务重新提交时重新下载整个项目"""
+        if not self.checkpoint_path.exists():
+            return
+        checkpoint = fio.load_json(self.checkpoint_path) or {}
+        if checkpoint.get("status") != FINISHED:
+            self.completed = set(checkpoint.get("completed", []))
+            self.resumed = len(self.completed)
+
+    def save_checkpoint(self, force = False) -> None:
+        """保存已经下载完成的tokenId，force 为 False 时最多每 CHECKPOINT_INTERVAL 秒保存一次"""
+        now = time.monotonic()
+        if not force and now - self.last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        self.last_checkpoint = now
+        fio.save_json(self.checkpoint_path, {"chain_type": self.chain_type,
+                                            "contract_address": self.contract_address,
+                                            "platform": self.platform,
+                                            "status": self.status,
+                                            "pages": self.page_count,
+                                            "completed": sorted(self.completed),
+                                            "updated": time.time()})
+
+    def start(self, save_path, thread_num: int) -> None:
+        super().start(save_path, thread_num)
+        self.downloader.max_workers = self.max_workers
+        self.load_checkpoint()
+
+    def set_concurrency(self, max_workers) -> None:
+        """修改每页的下载线程数上限，为 None 时由并发控制器决定，下一页生效"""
+        self.max_workers = max_workers
+        if self.downloader is not None:
+            self.downloader.max_workers = max_workers
+
+    def run_page(self) -> bool:
+        """
+        下载一页数据，跳过检查点中已经下载完成的token
+
+        Returns:
+            bool: 是否还有下一页
+        """
+        if self.pages is None:
+            self.start(self.save_path, self.thread_num)
+            ltb.get_logger().info(f"**********  ## {self.name} ## Start downloading... job {self.job_id}, {self.resumed} tokens resumed **********")
+        try:
+            response_data = next(self.pages)
+        except StopIteration:
+            return False
+        response_data = [record for record in response_data if record.token_id not in self.completed]
+        saved = self.downloader.process_response_data(response_data) if response_data else set()
+        # 只记录文件确实保存下来的token，下载失败的token在恢复任务时重新下载
+        self.completed.update(saved)
+        self.record_page(response_data, saved)
+        self.save_checkpoint()
+        return True
+
+    def progress(self) -> dict:
+        """当前进度，tokens 包括从检查点恢复的token"""
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        tokens = len(self.completed)
+        rate = (tokens - self.resumed) / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.size - tokens, 0)
+        return {"job_id": self.job_id,
+                "name": self.name,
+                "contract_address": self.contract_address,
+                "chain_type": self.chain_type,
+                "platform": self.platform or "auto",
+                "status": self.status,
+                "pages": self.page_count,
+                "tokens": tokens,
+                "failed": len(self.failed),
+                "total": self.size,
+                "tokens_per_second": rate,
+                "elapsed": elapsed,
+                "eta": remaining / rate if rate > 0 and self.status == RUNNING else None,
+                "error": self.error}
+
+
+class Job_Manager(object):
+    """
+    后台任务管理器
+
+    工作线程每次从就绪队列取出一个任务，只下载它的一页，然后把它放回队尾，
+    同一个任务同一时刻只会被一个线程处理。
+    """
+
+    def __init__(self, worker_num = 8):
+        """
+        Args:
+            worker_num (int): 页面工作线程数，所有任务共用
+        """
+        self.pid = os.getpid()
+        self.worker_num = worker_num
+        self.jobs = {}
+        self.ready = deque()
+        self.condition = threading.Condition()
+        self.job_ids = itertools.count(1)
+        self.threads = []
+        fio.check_dir(ENV.JOB_STATE_PATH)
+
+    def start(self) -> None:
+        with self.condition:
+            if self.threads:
+                return
+            self.threads = [threading.Thread(target = self.worker, name = f"job-worker-{i}", daemon = True) for i in range(self.worker_num)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, chain_type: str, contract_address: str, platform = None, save_path = ENV.DATASET_PATH, thread_num = 4) -> Download_Job:
+        """
+        提交一个下载任务，同一个项目正在下载时返回已有的任务
+
+        Args:
+            chain_type (str): 区块链类型
+            contract_address (str): 合约地址
+            platform (str): 平台名称，为 None 时自动选择
+            save_path (Path): 数据保存路径
+            thread_num (int): 每页media和metadata下载的初始并发数
+
+        Returns:
+            Download_Job: 任务
+        """
+        chain_type, contract_address = chain_type.lower(), contract_address.strip()
+        with self.condition:
+            for job in self.jobs.values():
+                if job.chain_type == chain_type and job.contract_address == contract_address and job.status not in TERMINAL_STATES:
+                    return job
+            job = Download_Job(next(self.job_ids), chain_type, contract_address, platform, save_path, thread_num)
+            self.jobs[job.job_id] = job
+            self.ready.append(job)
+            self.condition.notify()
+        self.start()
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        取消任务，正在下载的页完成后才会真正停止
+
+        Returns:
+            bool: 任务是否存在并且还没有结束
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.status in TERMINAL_STATES:
+            return False
+        job.cancel_event.set()
+        with self.condition:
+            if job.status == QUEUED and job in self.ready:
+                # 还没有开始的任务直接结束
+                self.ready.remove(job)
+                job.status = CANCELLED
+                job.finished = time.time()
+            else:
+                job.status = CANCELLING
+        return True
+
+    def get(self, job_id: int):
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> list:
+        return [job.progress() for job in sorted(self.jobs.values(), key = lambda job: job.job_id)]
+
+    def next_job(self) -> Download_Job:
+        with self.condition:
+            while not self.ready:
+                self.condition.wait()
+            job = self.ready.popleft()
+            if job.status == QUEUED:
+                job.status = RUNNING
+                job.started = time.time()
+            return job
+
+    def finish_turn(self, job: Download_Job, status = None) -> None:
+        with self.condition:
+            if status is None:
+                self.ready.append(job)
+                self.condition.notify()
+                return
+            job.status = status
+            job.finished = time.time()
+        try:
+            job.save_checkpoint(force = True)
+        except Exception as e:
+            ltb.get_logger().error(f"Failed to save checkpoint of job {job.job_id}: {e}")
+        ltb.get_logger().info(f"**********  ## {job.name} ## job {job.job_id} {status}: {len(job.completed)} tokens, {job.page_count} pages **********")
+
+    def worker(self) -> None:
+        while True:
+            job = self.next_job()
+            if job.cancel_event.is_set():
+                self.finish_turn(job, CANCELLED)
+                continue
+            try:
+                has_next = job.run_page()
+            except Exception as e:
+                job.error = str(e)
+                ltb.get_logger().error(f"Error downloading: {job.contract_address} on {job.chain_type}: {e}")
+                self.finish_turn(job, FAILED)
+                continue
+            if not has_next:
+                if job.failed:
+                    job.error = f"{len(job.failed)} tokens failed, e.g. {sorted(job.failed)[:10]}"
+                self.finish_turn(job, PARTIAL if job.failed else FINISHED)
+            elif job.cancel_event.is_set():
+                self.finish_turn(job, CANCELLED)
+            else:
+                self.finish_turn(job)
+
+
+_MANAGER = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_job_manager(worker_num = 8) -> Job_Manager:
+    """获取当前进程共用的任务管理器，worker_num 只在第一次调用时生效"""
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if _MANAGER is None or _MANAGER.pid != os.getpid():
+            _MANAGER = Job_Manager(worker_num)
+        return _MANAGER
@@ -0,0 +1,158 @@
+"""
+项目文件夹的目录结构
+
+默认所有文件平铺在 img 和 metadata 两个文件夹中，百万级别的 ERC1155 项目会让单个文件夹中的文件过多，
+列目录和创建文件都会变慢。可以为项目选择分层的目录结构：
+    flat    img/1234.png（默认）
+    id      img/00/12/1234.png，按tokenId十进制的倒数第 6~3 位分两层，每层最多 100 个子文件夹
+    hash    img/81/dc/1234.png，按tokenId的 md5 前 4 位分两层，tokenId 不连续时分布更均匀
+
+选择的结构保存在项目文件夹的 layout.json 中，之后的下载（包括 gaps 补下载）自动沿用；已有的文件不会被移动。
+分层结构下，每页结束后把本页写入的文件路径追加到 manifest.jsonl，下游可以直接按tokenId找到文件。
+子文件夹在每个进程中只创建一次，不会在每个下载线程中重复检查。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+LAYOUTS = ("flat", "id", "hash")
+
+# 当前进程已经创建过的文件夹，以及还没有写入 manifest 的记录，fork 出的子进程重新开始
+_CREATED_DIRS = set()
+_PENDING = {}
+_STATE_PID = None
+_STATE_LOCK = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _PENDING, _STATE_PID
+    if _STATE_PID != os.getpid():
+        # 父进程创建的文件夹依然存在，只需要丢弃父进程还没有写出的记录
+        _PENDING = {}
+        _STATE_PID = os.getpid()
+
+
+def ensure_dir(dir_path) -> None:
+    """创建文件夹，同一个进程中同一个文件夹只创建一次"""
+    key = str(dir_path)
+    if key in _CREATED_DIRS:
+        return
+    Path(dir_path).mkdir(parents = True, exist_ok = True)
+    with _STATE_LOCK:
+        _CREATED_DIRS.add(key)
+
+
+class Layout(object):
+    """
+    单个项目的目录结构，对象本身只保存配置，可以随下载器传给子进程
+    """
+
+    def __init__(self, collection_path, scheme = "flat"):
+        """
+        Args:
+            collection_path (Path): 项目文件夹，即 img 和 metadata 的上一级目录
+            scheme (str): flat、id 或 hash
+        """
+        if scheme not in LAYOUTS:
+            raise ValueError(f"Unknown layout {scheme}, expected one of {', '.join(LAYOUTS)}.")
+        self.collection_path = Path(collection_path)
+        self.scheme = scheme
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.collection_path / "manifest.jsonl"
+
+    def subdir(self, token_id: int) -> str:
+        """tokenId所在的子文件夹，flat 结构为空字符串"""
+        if self.scheme == "id":
+            digits = f"{token_id:06d}"
+            return f"{digits[-6:-4]}/{digits[-4:-2]}"
+        if self.scheme == "hash":
+            digest = hashlib.md5(str(token_id).encode()).hexdigest()
+            return f"{digest[:2]}/{digest[2:4]}"
+        return ""
+
+    def path(self, folder: str, token_id: int, suffix: str) -> Path:
+        """
+        获取文件的保存路径，分层结构下同时创建所在的子文件夹
+
+        Args:
+            folder (str): "img" 或 "metadata"
+            token_id (int): tokenId
+            suffix (str): 扩展名，如 ".json"、".png"
+
+        Returns:
+            Path: 文件路径
+        """
+        if self.scheme == "flat":
+            return self.collection_path / folder / f"{token_id}{suffix}"
+        dir_path = self.collection_path / folder / self.subdir(token_id)
+        ensure_dir(dir_path)
+        return dir_path / f"{token_id}{suffix}"
+
+    def record(self, token_id: int, folder: str, file_path) -> None:
+        """记录一个已经写入的文件，flat 结构的路径可以直接计算，不需要记录"""
+        if self.scheme == "flat":
+            return
+        relative = Path(file_path).relative_to(self.collection_path).as_posix()
+        with _STATE_LOCK:
+            _reset_after_fork()
+            _PENDING.setdefault(str(self.manifest_path), {}).setdefault(str(token_id), {})[folder] = relative
+
+    def flush(self) -> None:
+        """把本页记录的路径追加到 manifest.jsonl，每页结束后调用"""
+        if self.scheme == "flat":
+            return
+        with _STATE_LOCK:
+            _reset_after_fork()
+            records = _PENDING.pop(str(self.manifest_path), None)
+            if not records:
+                return
+            # 一次 write 写入一整行，多进程追加写入时不会交错
+            with open(self.manifest_path, 'a', encoding='UTF-8') as file:
+                file.write(json.dumps(records) + "\n")
+
+    def save(self) -> None:
+        """保存到项目文件夹的 layout.json"""
+        ensure_dir(self.collection_path)
+        with open(self.collection_path / "layout.json", 'w', encoding='UTF-8') as file:
+            json.dump({"scheme": self.scheme}, file)
+
+
+def load_layout(collection_path) -> Layout:
+    """读取项目的目录结构，没有 layout.json 时为 flat"""
+    layout_path = Path(collection_path) / "layout.json"
+    if not layout_path.exists():
+        return Layout(collection_path)
+    with open(layout_path, 'r', encoding='UTF-8') as file:
+        return Layout(collection_path, json.load(file).get("scheme", "flat"))
+
+
+def load_manifest(collection_path) -> dict:
+    """
+    读取 tokenId 到文件路径的映射，flat 结构没有 manifest
+
+    Returns:
+        dict: {tokenId: {"img": 相对路径, "metadata": 相对路径}}
+    """
+    manifest = {}
+    manifest_path = Path(collection_path) / "manifest.jsonl"
+    if not manifest_path.exists():
+        return manifest
+    with open(manifest_path, 'r', encoding='UTF-8') as file:
+        for line in file:
+            try:
+                records = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程中断时最后一行可能不完整
+                continue
+            for token_id, paths in records.items():
+                manifest.setdefault(int(token_id), {}).update(paths)
+    return manifest
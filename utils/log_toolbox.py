@@ -0,0 +1,220 @@
+"""
+异步结构化日志和跨进程进度
+
+日志：
+    下载线程只把日志记录放入队列，由每个进程的一个后台线程统一输出，终端 I/O 不再阻塞下载线程。
+    通过环境变量配置，子进程会继承：
+        NFT_DL_LOG_LEVEL     日志级别，默认 INFO，设置为 DEBUG 时输出每个文件的下载记录且不采样
+        NFT_DL_LOG_FORMAT    text（默认）或 json，json 每行一条记录，方便收集和检索
+        NFT_DL_LOG_FILE      同时写入的日志文件路径
+        NFT_DL_LOG_SAMPLE    成功消息的采样间隔，默认每 100 条输出 1 条
+
+进度：
+    整个项目的 完成数 / 失败数 / 字节数 保存在共享内存的计数器中，mp.Pool 的子进程 fork 后共用同一组计数器，
+    由启动下载的进程定期输出一行汇总和预计剩余时间，输出量不再随token数量增长。
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+LOGGER_NAME = "nft_downloader"
+
+
+class Json_Formatter(logging.Formatter):
+    """每条日志输出为一行 json"""
+
+    def format(self, record):
+        item = {"time": round(record.created, 3),
+                "level": record.levelname,
+                "pid": record.process,
+                "thread": record.threadName,
+                "message": record.getMessage()}
+        if record.exc_info:
+            item["exception"] = self.formatException(record.exc_info)
+        for key in ("token", "host", "collection"):
+            if hasattr(record, key):
+                item[key] = getattr(record, key)
+        return json.dumps(item, ensure_ascii=False)
+
+
+class Sampling_Filter(logging.Filter):
+    """带有 sampled 标记的成功消息每 rate 条只保留一条，其他消息不受影响"""
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(1, rate)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        with self.lock:
+            self.count += 1
+            return self.count % self.rate == 1 or self.rate == 1
+
+
+_LOGGER_PID = None
+_LOGGER_LOCK = threading.Lock()
+_LISTENER = None
+_QUEUE = None
+
+
+def get_logger() -> logging.Logger:
+    """
+    获取当前进程的日志记录器，第一次调用时配置队列和输出线程，fork 出的子进程会重新配置
+
+    Returns:
+        logging.Logger: 日志记录器
+    """
+    global _LOGGER_PID, _LISTENER, _QUEUE
+    logger = logging.getLogger(LOGGER_NAME)
+    if _LOGGER_PID == os.getpid():
+        return logger
+    with _LOGGER_LOCK:
+        if _LOGGER_PID == os.getpid():
+            return logger
+        level = getattr(logging, os.environ.get("NFT_DL_LOG_LEVEL", "INFO").upper(), logging.INFO)
+        if os.environ.get("NFT_DL_LOG_FORMAT", "text").lower() == "json":
+            formatter = Json_Formatter()
+        else:
+            formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%H:%M:%S")
+
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if log_file := os.environ.get("NFT_DL_LOG_FILE"):
+            handlers.append(logging.FileHandler(log_file, encoding='UTF-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            # DEBUG 级别用于排查问题，此时不采样
+            if level > logging.DEBUG:
+                handler.addFilter(Sampling_Filter(int(os.environ.get("NFT_DL_LOG_SAMPLE", 100))))
+
+        # 父进程的输出线程不会被 fork 到子进程，子进程需要自己的队列和输出线程
+        _QUEUE = queue.Queue()
+        _LISTENER = logging.handlers.QueueListener(_QUEUE, *handlers, respect_handler_level = False)
+        _LISTENER.start()
+        logger.handlers = [logging.handlers.QueueHandler(_QUEUE)]
+        logger.setLevel(level)
+        logger.propagate = False
+        _LOGGER_PID = os.getpid()
+    return logger
+
+
+def flush() -> None:
+    """等待队列中的日志全部输出，mp.Pool 的子进程会被直接结束，每页结束后调用一次"""
+    if _LOGGER_PID == os.getpid() and _QUEUE is not None:
+        _QUEUE.join()
+
+
+def log_success(message: str, **extra) -> None:
+    """输出成功消息，INFO 级别下按 NFT_DL_LOG_SAMPLE 采样"""
+    get_logger().info(message, extra = dict(extra, sampled = True))
+
+
+@atexit.register
+def _stop_listener() -> None:
+    if _LOGGER_PID == os.getpid() and _LISTENER is not None:
+        _LISTENER.stop()
+
+
+class Progress(object):
+    """
+    共享内存中的下载进度，fork 出的子进程共用同一组计数器
+    """
+
+    def __init__(self, name: str, total: int, interval = 10.0):
+        """
+        Args:
+            name (str): 项目或任务名称
+            total (int): 预计的token数量
+            interval (float): 输出进度的间隔（秒）
+        """
+        self.name = name
+        self.total = total
+        self.interval = interval
+        self.owner = os.getpid()
+        # 完成数、失败数、字节数
+        self.counters = mp.Array('q', 3)
+        self.begin = time.monotonic()
+        self.stop_event = threading.Event()
+        self.reporter = threading.Thread(target = self.report_loop, daemon = True)
+
+    def update(self, success: bool) -> None:
+        with self.counters.get_lock():
+            self.counters[0 if success else 1] += 1
+
+    def add_bytes(self, nbytes: int) -> None:
+        with self.counters.get_lock():
+            self.counters[2] += nbytes
+
+    def summary(self) -> str:
+        with self.counters.get_lock():
+            done, failed, nbytes = self.counters[:]
+        elapsed = max(time.monotonic() - self.begin, 1e-6)
+        rate = (done + failed) / elapsed
+        remaining = max(self.total - done - failed, 0)
+        eta = time.strftime("%H:%M:%S", time.gmtime(remaining / rate)) if rate > 0 else "--:--:--"
+        return (f"{self.name}: {done}/{self.total} done, {failed} failed, {nbytes / 1e6:.1f} MB, "
+                f"{rate:.1f} tokens/s, {nbytes / 1e6 / elapsed:.2f} MB/s, ETA {eta}")
+
+    def report_loop(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            get_logger().info(self.summary())
+
+    def start(self) -> None:
+        self.reporter.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.reporter.join()
+        get_logger().info(self.summary())
+
+
+_PROGRESS = None
+
+
+@contextmanager
+def progress(name: str, total: int, interval = None):
+    """
+    在下载期间定期输出整体进度，已经有进度在运行时（例如批量下载中的单个项目）沿用外层的进度
+
+    Args:
+        name (str): 项目或任务名称
+        total (int): 预计的token数量
+        interval (float): 输出进度的间隔（秒），默认读取环境变量 NFT_DL_PROGRESS_INTERVAL，否则为 10 秒
+    """
+    global _PROGRESS
+    if _PROGRESS is not None and _PROGRESS.owner == os.getpid():
+        yield _PROGRESS
+        return
+    interval = interval or float(os.environ.get("NFT_DL_PROGRESS_INTERVAL", 10))
+    _PROGRESS = Progress(name, total, interval)
+    _PROGRESS.start()
+    try:
+        yield _PROGRESS
+    finally:
+        _PROGRESS.stop()
+        _PROGRESS = None
+
+
+def update_progress(success: bool) -> None:
+    """记录一个token完成或失败，没有正在运行的进度时忽略"""
+    if _PROGRESS is not None:
+        _PROGRESS.update(success)
+
+
+def add_progress_bytes(nbytes: int) -> None:
+    if _PROGRESS is not None:
+        _PROGRESS.add_bytes(nbytes)
@@ -0,0 +1,420 @@
+"""
+下载过程的运行指标
+
+按 平台 × 主机 × 阶段 记录请求数、字节数、按状态码区分的错误数、重试次数和耗时直方图，阶段包括：
+    page_fetch       平台分页或批量接口请求
+    parse            解析平台响应
+    metadata_fetch   下载 tokenURI 指向的 metadata
+    metadata_write   写入 metadata 文件
+    media_fetch      下载媒体文件（包含写盘）
+    disk_write       媒体文件写盘的耗时
+
+每个进程定期把自己的指标写入 ENV.METRICS_LOGGING_PATH / {运行编号} / {进程号}.json，
+同一次运行的所有进程（包括 mp.Pool 的子进程）共用一个运行编号，汇总后可以通过
+Prometheus 文本格式的 /metrics 接口或者 /metrics.json 查看，主进程还会定期写入汇总后的 snapshot.json。
+    NFT_DL_METRICS_PORT         入口脚本启动指标接口的端口，默认不启动，多个下载同时运行时不会争用同一个端口
+    NFT_DL_METRICS_RETENTION    运行目录的保留时间（秒），默认 1 天，每次运行开始时删除超过保留时间没有更新的运行目录
+"""
+
+import atexit
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.log_toolbox as ltb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+# 耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 同一次运行的所有进程通过这个环境变量共用运行编号，子进程会继承
+RUN_ID_ENV = "NFT_DL_METRICS_RUN"
+
+# 吞吐量低于近期平均值的这个比例时输出警告
+ALERT_RATIO = 0.5
+
+METRICS_PORT_ENV = "NFT_DL_METRICS_PORT"
+RETENTION_ENV = "NFT_DL_METRICS_RETENTION"
+DEFAULT_RETENTION = 24 * 3600
+
+
+def get_run_id() -> str:
+    """获取当前运行的编号，第一次调用的进程负责生成"""
+    if RUN_ID_ENV not in os.environ:
+        os.environ[RUN_ID_ENV] = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    return os.environ[RUN_ID_ENV]
+
+
+def get_metrics_port() -> int:
+    """入口脚本启动指标接口的端口，没有设置时为 0，表示不启动"""
+    try:
+        return int(os.environ.get(METRICS_PORT_ENV, 0))
+    except ValueError:
+        return 0
+
+
+def sweep_runs(retention = None) -> int:
+    """
+    删除超过保留时间没有更新的运行目录，正在运行的进程每隔几秒就会写入快照，不会被删除
+
+    Args:
+        retention (float): 保留时间（秒），默认读取 NFT_DL_METRICS_RETENTION
+
+    Returns:
+        int: 删除的运行目录数量
+    """
+    if retention is None:
+        retention = float(os.environ.get(RETENTION_ENV, DEFAULT_RETENTION))
+    removed = 0
+    deadline = time.time() - retention
+    try:
+        entries = list(os.scandir(ENV.METRICS_LOGGING_PATH))
+    except OSError:
+        return removed
+    for entry in entries:
+        try:
+            # 快照先写临时文件再改名，目录的修改时间就是最后一次写入快照的时间
+            if entry.is_dir() and entry.name != get_run_id() and entry.stat().st_mtime < deadline:
+                shutil.rmtree(entry.path, ignore_errors = True)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def get_status(error) -> str:
+    """从异常中取出 HTTP 状态码，没有状态码时使用异常类型"""
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None):
+        return str(response.status_code)
+    return type(error).__name__
+
+
+class Histogram(object):
+    """固定桶的耗时直方图"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Metrics_Registry(object):
+    """
+    进程内共用的指标登记表
+    """
+
+    def __init__(self, dump_interval = 5.0):
+        """
+        Args:
+            dump_interval (float): 写入快照文件的间隔（秒）
+        """
+        self.pid = os.getpid()
+        self.run_id = get_run_id()
+        self.is_main = self.run_id.endswith(f"-{self.pid}")
+        self.run_path = ENV.METRICS_LOGGING_PATH / self.run_id
+        self.run_path.mkdir(parents = True, exist_ok = True)
+        if self.is_main:
+            # 命令行每天可能被调用上千次，每次运行开始时清理一次过期的运行目录
+            sweep_runs()
+        self.dump_interval = dump_interval
+        self.lock = threading.Lock()
+        self.counters = {}       # (指标名, ((标签, 值), ...)) -> 数值
+        self.histograms = {}     # ((标签, 值), ...) -> Histogram
+        self.last_dump = 0.0
+        self.last_tokens = 0
+        self.last_check = time.monotonic()
+        self.average_rate = None
+        self.stop_event = threading.Event()
+        self.reporter = threading.Thread(target = self.report_loop, daemon = True)
+        self.reporter.start()
+        atexit.register(self.close)
+
+    def inc(self, name: str, value = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def record(self, stage: str, provider, host: str, status, seconds: float, nbytes = 0) -> None:
+        """
+        记录一次请求或操作
+
+        Args:
+            stage (str): 阶段名称
+            provider (str): 平台名称，与平台无关的下载为 None
+            host (str): 主机名，本地操作为 "local"
+            status (str | int): 状态码，成功的本地操作为 "ok"
+            seconds (float): 耗时
+            nbytes (int): 传输或写入的字节数
+        """
+        labels = {"provider": provider or "none", "host": host, "stage": stage}
+        status = str(status)
+        self.inc("nft_requests_total", status = status, **labels)
+        if nbytes:
+            self.inc("nft_bytes_total", nbytes, **labels)
+        if status not in ("200", "ok"):
+            self.inc("nft_errors_total", status = status, **labels)
+        self.observe(seconds, **labels)
+
+    def retry(self, stage: str, provider, host: str) -> None:
+        self.inc("nft_retries_total", provider = provider or "none", host = host, stage = stage)
+
+    def token_done(self, provider, success: bool) -> None:
+        self.inc("nft_tokens_total", provider = provider or "none", result = "done" if success else "failed")
+
+    @contextmanager
+    def timer(self, stage: str, provider = None, host = "local"):
+        """
+        记录一段操作的耗时，yield 的字典中可以填入 status 和 nbytes，抛出异常时按异常记录错误
+
+        Example:
+            with registry.timer("page_fetch", "NFTScan", host) as sample:
+                response = session.get(url)
+                sample["status"] = response.status_code
+        """
+        sample = {"status": "ok", "nbytes": 0}
+        begin = time.perf_counter()
+        try:
+            yield sample
+        except Exception as e:
+            sample["status"] = get_status(e)
+            raise
+        finally:
+            self.record(stage, provider, host, sample["status"], time.perf_counter() - begin, sample["nbytes"])
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"time": time.time(),
+                    "pid": self.pid,
+                    "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                    "histograms": [[dict(labels), list(histogram.counts), histogram.sum, histogram.count]
+                                    for labels, histogram in self.histograms.items()]}
+
+    def dump_snapshot(self, force = False) -> None:
+        """写入本进程的快照，force 为 False 时每隔 dump_interval 秒最多写入一次"""
+        now = time.monotonic()
+        if not force and now - self.last_dump < self.dump_interval:
+            return
+        self.last_dump = now
+        file_path = self.run_path / f"{self.pid}.json"
+        temp_path = self.run_path / f"{self.pid}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='UTF-8') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(temp_path, file_path)
+        except OSError:
+            pass
+
+    def check_throughput(self, snapshot: dict) -> None:
+        """完成的token数的速率低于近期平均值的 ALERT_RATIO 时输出警告"""
+        now = time.monotonic()
+        tokens = sum(value for name, labels, value in snapshot["counters"]
+                     if name == "nft_tokens_total" and labels.get("result") == "done")
+        rate = (tokens - self.last_tokens) / max(now - self.last_check, 1e-6)
+        self.last_tokens, self.last_check = tokens, now
+        if self.average_rate is not None and self.average_rate > 1 and rate < self.average_rate * ALERT_RATIO:
+            ltb.get_logger().warning(f"Throughput dropped to {rate:.1f} tokens/s, recent average {self.average_rate:.1f} tokens/s.")
+        if tokens:
+            self.average_rate = rate if self.average_rate is None else 0.8 * self.average_rate + 0.2 * rate
+
+    def report_loop(self) -> None:
+        while not self.stop_event.wait(self.dump_interval):
+            self.dump_snapshot(force = True)
+            # 主进程额外写入所有进程汇总后的快照，并检查吞吐量
+            if self.is_main:
+                merged = load_snapshots(self.run_id)
+                self.check_throughput(merged)
+                try:
+                    with open(self.run_path / "snapshot.json", 'w', encoding='UTF-8') as file:
+                        json.dump(merged, file)
+                except OSError:
+                    pass
+
+    def close(self) -> None:
+        # fork 出的子进程会继承父进程注册的退出函数，只处理自己创建的登记表
+        if self.pid != os.getpid():
+            return
+        self.stop_event.set()
+        self.dump_snapshot(force = True)
+
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry() -> Metrics_Registry:
+    """获取当前进程共用的指标登记表，fork 出的子进程会重新创建，不会重复统计父进程的数据"""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None or _REGISTRY.pid != os.getpid():
+            _REGISTRY = Metrics_Registry()
+        return _REGISTRY
+
+
+def load_snapshots(run_id = None) -> dict:
+    """
+    汇总同一次运行中所有进程写入的快照
+
+    Args:
+        run_id (str): 运行编号，默认为当前运行
+
+    Returns:
+        dict: {"time": float, "processes": int, "counters": [[指标名, 标签, 数值], ...], "histograms": [[标签, 桶计数, 总耗时, 次数], ...]}
+    """
+    run_path = ENV.METRICS_LOGGING_PATH / (run_id or get_run_id())
+    counters = {}
+    histograms = {}
+    processes = 0
+    for file_path in run_path.glob("*.json"):
+        if not file_path.stem.isdigit():
+            continue
+        try:
+            with open(file_path, 'r', encoding='UTF-8') as file:
+                snapshot = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            continue
+        processes += 1
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for labels, counts, total, count in snapshot["histograms"]:
+            key = tuple(sorted(labels.items()))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+    return {"time": time.time(),
+            "processes": processes,
+            "counters": [[name, dict(labels), value] for (name, labels), value in sorted(counters.items())],
+            "histograms": [[dict(labels), counts, total, count] for labels, (counts, total, count) in sorted(histograms.items())]}
+
+
+def format_labels(labels: dict) -> str:
+    items = ",".join(f'{key}="{str(value)}"'.replace("\n", " ") for key, value in sorted(labels.items()))
+    return "{" + items + "}" if items else ""
+
+
+def render_prometheus(snapshot: dict) -> str:
+    """把汇总后的快照转换成 Prometheus 文本格式"""
+    lines = []
+    declared = set()
+    for name, labels, value in snapshot["counters"]:
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{format_labels(labels)} {value}")
+
+    lines.append("# TYPE nft_stage_seconds histogram")
+    for labels, counts, total, count in snapshot["histograms"]:
+        cumulative = 0
+        for bound, bucket_count in zip(list(LATENCY_BUCKETS) + ["+Inf"], counts):
+            cumulative += bucket_count
+            lines.append(f"nft_stage_seconds_bucket{format_labels(dict(labels, le = str(bound)))} {cumulative}")
+        lines.append(f"nft_stage_seconds_sum{format_labels(labels)} {total}")
+        lines.append(f"nft_stage_seconds_count{format_labels(labels)} {count}")
+    lines.append(f"nft_processes {snapshot['processes']}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize_stages(snapshot: dict) -> dict:
+    """
+    按阶段汇总总耗时、次数、错误数和字节数，用于查看一次运行的时间花在哪里
+
+    Returns:
+        dict: key 为阶段名称，value 为 {"seconds", "count", "errors", "bytes"}
+    """
+    result = {}
+    for labels, counts, total, count in snapshot["histograms"]:
+        stage = result.setdefault(labels["stage"], {"seconds": 0.0, "count": 0, "errors": 0, "bytes": 0})
+        stage["seconds"] += total
+        stage["count"] += count
+    for name, labels, value in snapshot["counters"]:
+        stage = result.setdefault(labels.get("stage"), {"seconds": 0.0, "count": 0, "errors": 0, "bytes": 0})
+        if name == "nft_errors_total":
+            stage["errors"] += value
+        elif name == "nft_bytes_total":
+            stage["bytes"] += value
+    result.pop(None, None)
+    return result
+
+
+def print_stage_summary(run_id = None) -> None:
+    """打印当前运行各个阶段的总耗时、次数、错误数和数据量"""
+    get_registry().dump_snapshot(force = True)
+    stages = summarize_stages(load_snapshots(run_id))
+    print(f"{'stage':<16}{'count':>10}{'seconds':>12}{'avg ms':>10}{'errors':>8}{'MB':>10}")
+    for stage, item in sorted(stages.items(), key = lambda item: -item[1]["seconds"]):
+        average = item["seconds"] / item["count"] * 1000 if item["count"] else 0
+        print(f"{stage:<16}{item['count']:>10}{item['seconds']:>12.1f}{average:>10.1f}{item['errors']:>8}{item['bytes'] / 1e6:>10.1f}")
+
+
+class Metrics_Handler(BaseHTTPRequestHandler):
+    """/metrics 返回 Prometheus 文本格式，/metrics.json 返回汇总后的快照"""
+
+    def do_GET(self):
+        snapshot = load_snapshots(self.server.run_id)
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(dict(snapshot, stages = summarize_stages(snapshot))).encode()
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = render_prometheus(snapshot).encode()
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port = 9108, host = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    在后台线程中启动指标接口，汇总当前运行的所有进程
+
+    Args:
+        port (int): 端口
+        host (str): 监听地址
+
+    Returns:
+        ThreadingHTTPServer: 服务器，调用 shutdown() 停止
+    """
+    get_registry()
+    server = ThreadingHTTPServer((host, port), Metrics_Handler)
+    server.daemon_threads = True
+    server.run_id = get_run_id()
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
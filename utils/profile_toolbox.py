@@ -0,0 +1,274 @@
+"""
+内置的性能分析模式
+
+设置环境变量 NFT_DL_PROFILE=1（或者运行脚本时加上 --profile）即可分析真实的下载任务，不需要修改代码：
+    1. 每个进程使用 cProfile，进程内的每个线程（包括每页创建的下载线程池）都有自己的分析器
+    2. 设置 NFT_DL_PROFILE_SAMPLING=1 时，额外启动一个基于 sys._current_frames 的采样线程，
+       按固定间隔记录所有线程的调用栈，开销与函数调用次数无关，适合看墙上时间花在哪里
+    3. mp.Pool 的子进程在 fork 后自动开始分析，每页结束后写出一次数据，进程池直接结束子进程时也不会丢失
+
+每个进程的数据写入 ENV.PROFILE_LOGGING_PATH / {运行编号} / {进程号}.prof（pstats 格式）和 {进程号}.samples.json，
+运行编号与 metrics_toolbox 相同。print_report() 合并所有进程的数据，按 解析 / JSON 读写 / HTTP / 磁盘 / 等待 分组列出热点函数。
+"""
+
+import atexit
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.metrics_toolbox as mtb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+PROFILE_ENV = "NFT_DL_PROFILE"
+SAMPLING_ENV = "NFT_DL_PROFILE_SAMPLING"
+
+# 按文件名或函数名把函数归到子系统，按顺序匹配，第一个匹配的子系统生效
+SUBSYSTEMS = [
+    ("waiting", ("time.sleep", "of '_thread.", "'_queue.", "select.", "threading.py", "queue.py", "selectors.py",
+                "concurrent/futures/", "multiprocessing/pool.py", "multiprocessing/connection.py")),
+    ("http", ("requests/", "urllib3/", "http/client.py", "ssl.py", "socket.py", "_ssl.", "_socket.", "email/", "idna/", "charset_normalizer/")),
+    ("json_io", ("json/", "file_io.py", "json.", "marshal.")),
+    ("disk", ("_io.", "io.open", "posix.", "shutil.py", "pathlib.py", "genericpath.py")),
+    ("parsing", ("record_toolbox.py", "diff_toolbox.py", "parse_", "is_ipfs_cid", "re/", "sre_", "'re.Pattern", "urllib/parse.py")),
+]
+
+
+def is_enabled() -> bool:
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def classify(func: tuple) -> str:
+    """
+    获取函数所属的子系统
+
+    Args:
+        func (tuple): pstats 中的函数键 (文件名, 行号, 函数名)
+
+    Returns:
+        str: parsing、json_io、http、disk、waiting 或 other
+    """
+    filename, _, name = func
+    text = f"{filename.replace(os.sep, '/')}:{name}"
+    for subsystem, patterns in SUBSYSTEMS:
+        if any(pattern in text for pattern in patterns):
+            return subsystem
+    return "other"
+
+
+class Process_Profiler(object):
+    """
+    单个进程的性能分析器
+    """
+
+    def __init__(self, sampling = False, sample_interval = 0.005):
+        """
+        Args:
+            sampling (bool): 是否同时启动采样线程
+            sample_interval (float): 采样间隔（秒）
+        """
+        self.pid = os.getpid()
+        self.run_path = ENV.PROFILE_LOGGING_PATH / mtb.get_run_id()
+        self.run_path.mkdir(parents = True, exist_ok = True)
+        self.lock = threading.Lock()
+        self.profiles = []          # [(线程, cProfile.Profile), ...]
+        self.finished = {}          # 已经结束的线程合并后的统计
+        self.sampling = sampling
+        self.sample_interval = sample_interval
+        self.leaf_samples = Counter()
+        self.stack_samples = Counter()
+        self.sample_count = 0
+        self.stop_event = threading.Event()
+        self.last_dump = 0.0
+
+    def bootstrap(self, frame, event, arg):
+        # 新线程的第一个事件：为这个线程创建独立的 cProfile，enable 之后会替换掉这个函数
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append((threading.current_thread(), profile))
+        profile.enable()
+
+    def start(self) -> None:
+        profile = cProfile.Profile()
+        self.profiles.append((threading.current_thread(), profile))
+        threading.setprofile(self.bootstrap)
+        profile.enable()
+        if self.sampling:
+            threading.Thread(target = self.sample_loop, name = "profile-sampler", daemon = True).start()
+
+    def sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.sample_interval):
+            frames = sys._current_frames()
+            with self.lock:
+                self.sample_count += 1
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    code = frame.f_code
+                    self.leaf_samples[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+                    # 同一个函数在调用栈中只计一次
+                    seen = set()
+                    while frame is not None:
+                        code = frame.f_code
+                        key = (code.co_filename, code.co_firstlineno, code.co_name)
+                        if key not in seen:
+                            seen.add(key)
+                            self.stack_samples[key] += 1
+                        frame = frame.f_back
+
+    def collect(self) -> dict:
+        """合并所有线程的统计，已经结束的线程合并后释放它的分析器"""
+        with self.lock:
+            merged = dict(self.finished)
+            alive = []
+            for thread, profile in self.profiles:
+                profile.snapshot_stats()
+                target = merged if thread.is_alive() else self.finished
+                for func, stat in profile.stats.items():
+                    target[func] = pstats.add_func_stats(target[func], stat) if func in target else stat
+                    if target is self.finished:
+                        merged[func] = self.finished[func]
+                if thread.is_alive():
+                    alive.append((thread, profile))
+            self.profiles = alive
+        return merged
+
+    def dump(self, force = False) -> None:
+        """写出本进程的统计，force 为 False 时每 10 秒最多写入一次"""
+        now = time.monotonic()
+        if not force and now - self.last_dump < 10:
+            return
+        self.last_dump = now
+        stats = self.collect()
+        temp_path = self.run_path / f"{self.pid}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                marshal.dump(stats, file)
+            os.replace(temp_path, self.run_path / f"{self.pid}.prof")
+            if self.sampling:
+                with self.lock:
+                    samples = {"interval": self.sample_interval,
+                                "count": self.sample_count,
+                                "leaf": [[list(key), value] for key, value in self.leaf_samples.items()],
+                                "stack": [[list(key), value] for key, value in self.stack_samples.items()]}
+                with open(self.run_path / f"{self.pid}.samples.json", 'w', encoding='UTF-8') as file:
+                    json.dump(samples, file)
+        except OSError as e:
+            print(f"Failed to write profile of process {self.pid}: {e}")
+
+    def stop(self) -> None:
+        if self.pid != os.getpid():
+            return
+        self.stop_event.set()
+        threading.setprofile(None)
+        self.dump(force = True)
+
+
+_PROFILER = None
+_PROFILER_LOCK = threading.Lock()
+
+
+def start() -> None:
+    """在当前进程开始分析，fork 出的子进程会自动开始自己的分析"""
+    global _PROFILER
+    with _PROFILER_LOCK:
+        if _PROFILER is not None and _PROFILER.pid == os.getpid():
+            return
+        _PROFILER = Process_Profiler(sampling = os.environ.get(SAMPLING_ENV, "") not in ("", "0"))
+        _PROFILER.start()
+    atexit.register(_PROFILER.stop)
+
+
+def enable_profiling(sampling = False) -> None:
+    """开启性能分析，之后启动的子进程也会开启"""
+    os.environ[PROFILE_ENV] = "1"
+    if sampling:
+        os.environ[SAMPLING_ENV] = "1"
+    start()
+
+
+def checkpoint(force = False) -> None:
+    """写出当前进程的统计，没有开启分析时直接返回"""
+    if _PROFILER is not None and _PROFILER.pid == os.getpid():
+        _PROFILER.dump(force = force)
+
+
+def _after_fork_in_child() -> None:
+    global _PROFILER
+    if _PROFILER is not None:
+        # 父进程的线程不会被带到子进程，丢弃继承来的分析器重新开始
+        _PROFILER = None
+        start()
+
+
+def build_report(run_id = None, top = 15) -> str:
+    """
+    合并一次运行中所有进程的统计，生成按子系统分组的报告，同时写入 merged.prof 和 report.txt
+
+    Args:
+        run_id (str): 运行编号，默认为当前运行
+        top (int): 每个子系统列出的函数数量
+
+    Returns:
+        str: 报告文本
+    """
+    checkpoint(force = True)
+    run_path = ENV.PROFILE_LOGGING_PATH / (run_id or mtb.get_run_id())
+    lines = []
+    prof_files = [str(path) for path in sorted(run_path.glob("*.prof")) if path.stem.isdigit()]
+    if prof_files:
+        stats = pstats.Stats(*prof_files)
+        stats.dump_stats(run_path / "merged.prof")
+        groups = {}
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            groups.setdefault(classify(func), []).append((tt, ct, nc, func))
+        total = sum(tt for items in groups.values() for tt, _, _, _ in items) or 1e-9
+        lines.append(f"cProfile: {len(prof_files)} processes, {total:.1f}s of self time across all threads")
+        for subsystem, items in sorted(groups.items(), key = lambda item: -sum(tt for tt, _, _, _ in item[1])):
+            subtotal = sum(tt for tt, _, _, _ in items)
+            lines.append(f"\n[{subsystem}] {subtotal:.2f}s ({subtotal / total:.1%})")
+            for tt, ct, nc, (filename, lineno, name) in sorted(items, key = lambda item: -item[0])[:top]:
+                lines.append(f"    {tt:9.3f}s self {ct:9.3f}s cum {nc:>9} calls  {name}  {os.path.basename(filename)}:{lineno}")
+
+    sample_files = sorted(run_path.glob("*.samples.json"))
+    if sample_files:
+        leaf = Counter()
+        for file_path in sample_files:
+            with open(file_path, 'r', encoding='UTF-8') as file:
+                for key, value in json.load(file)["leaf"]:
+                    leaf[tuple(key)] += value
+        total = sum(leaf.values()) or 1
+        groups = Counter()
+        for func, value in leaf.items():
+            groups[classify(func)] += value
+        lines.append(f"\nSampling: {total} thread samples from {len(sample_files)} processes")
+        for subsystem, value in groups.most_common():
+            lines.append(f"    {subsystem:<10}{value / total:7.1%}")
+        lines.append("  hottest leaf functions:")
+        for (filename, lineno, name), value in leaf.most_common(top):
+            lines.append(f"    {value / total:7.1%}  [{classify((filename, lineno, name))}]  {name}  {os.path.basename(filename)}:{lineno}")
+
+    report = "\n".join(lines) if lines else f"No profile data in {run_path}."
+    if run_path.exists():
+        (run_path / "report.txt").write_text(report, encoding='UTF-8')
+    return report
+
+
+def print_report(run_id = None, top = 15) -> None:
+    print(build_report(run_id, top))
+
+
+os.register_at_fork(after_in_child = _after_fork_in_child)
+
+# 通过环境变量开启时，导入模块即开始分析，不需要修改调用代码
+if is_enabled():
+    start()
@@ -0,0 +1,70 @@
+"""
+紧凑的token记录
+
+所有平台的 parse_response 都解析成 Token_Record 列表，替代原来的 metadata_source/media_source 两层字典：
+    1. 使用 __slots__，不为每个token创建属性字典，也不重复保存 "raw"、"tokenUri"、"source_list"、"format" 等键
+    2. tokenId 保存为整数，媒体链接保存为元组
+    3. 文件格式字符串使用 sys.intern，同一个项目的所有token共用一个字符串对象
+    4. metadata 保存为紧凑的 json 字符串，比嵌套的字典小很多，写入文件时再展开
+因此批量下载或 ERC1155 项目可以在内存中缓存数百万个待下载的token。
+"""
+
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.spider_toolbox as stb
+
+
+def compact_json(raw):
+    """
+    将 metadata 转换成紧凑的 json 字符串，空的 metadata 返回 None
+
+    Args:
+        raw (dict | list | str): 平台返回的 metadata，字符串保持不变
+
+    Returns:
+        str: json 字符串
+    """
+    if not raw:
+        return None
+    if isinstance(raw, str):
+        return raw
+    return json.dumps(raw, ensure_ascii=False, separators=(',', ':'))
+
+
+class Token_Record(object):
+    """
+    单个token的 metadata 资源和媒体资源
+    """
+
+    __slots__ = ("token_id", "raw", "token_uri", "sources", "format")
+
+    def __init__(self, token_id, raw = None, token_uri = None, sources = None, format = None):
+        """
+        Args:
+            token_id (int | str): tokenId，十进制或 0x 开头的十六进制字符串会被转换成整数
+            raw (dict | str): 平台返回的 metadata
+            token_uri (str): metadata 的链接
+            sources (iterable): 媒体资源链接，按优先级排列，空链接会被过滤
+            format (str): 媒体文件格式，为 None 时表示该token没有媒体资源
+        """
+        self.token_id = stb.parse_token_id(token_id)
+        self.raw = compact_json(raw)
+        self.token_uri = token_uri
+        self.sources = tuple(url for url in sources if url) if sources else ()
+        self.format = sys.intern(format) if format else None
+
+    @property
+    def has_media(self) -> bool:
+        return self.format is not None
+
+    @property
+    def metadata(self):
+        """展开后的 metadata"""
+        return json.loads(self.raw) if self.raw else None
+
+    def __repr__(self):
+        return f"Token_Record({self.token_id}, sources={len(self.sources)}, format={self.format})"
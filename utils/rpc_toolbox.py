@@ -0,0 +1,440 @@
+"""
+直接通过以太坊 JSON-RPC 节点读取 NFT 的 tokenURI / uri，绕开 Alchemy、NFTScan 等索引平台的限流。
+
+多个 eth_call 请求会被打包成 JSON-RPC batch 请求，或者打包成 Multicall3 的 aggregate3 调用，
+从而在一次 HTTP 请求里读取成百上千个 token 的元数据地址。
+"""
+
+import base64
+import json
+import os
+import sys
+import urllib.parse
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.cache_toolbox as cht
+import utils.spider_toolbox as stb
+
+
+# 函数选择器
+TOKEN_URI_SELECTOR = "0xc87b56dd"     # tokenURI(uint256)     ERC721
+URI_SELECTOR = "0x0e89341c"           # uri(uint256)          ERC1155
+AGGREGATE3_SELECTOR = "0x82ad56cb"    # aggregate3((address,bool,bytes)[])
+
+# Multicall3 在绝大多数 EVM 链上的部署地址都相同
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+
+class RPC_Error(Exception):
+    """
+    读取 tokenURI 时节点请求失败，例如网络错误、HTTP 错误、限流或者无法解析的返回数据。
+    与合约 revert（token不存在）区分开，出现时这批token应该按下载失败处理，而不是跳过
+    """
+    pass
+
+
+def get_rpc_url(chain_type: str = "ethereum") -> str:
+    """
+    获取指定区块链的 JSON-RPC 节点地址
+
+    Args:
+        chain_type (str): 区块链类型
+
+    Returns:
+        str: JSON-RPC 节点地址，没有配置时返回 None
+    """
+    rpc_urls = stb.get_api("RPC") or {}
+    return rpc_urls.get(chain_type.lower()) or None
+
+
+def encode_uint256(value: int) -> str:
+    """将整数编码成 32 字节的十六进制字符串（不带 0x 前缀）"""
+    return format(int(value), "064x")
+
+
+def encode_call(selector: str, token_id) -> str:
+    """
+    生成只有一个 uint256 参数的合约调用数据
+
+    Args:
+        selector (str): 函数选择器
+        token_id (int | str): tokenId
+
+    Returns:
+        str: 以 0x 开头的 calldata
+    """
+    return selector + encode_uint256(token_id)
+
+
+def hex_to_bytes(data) -> bytes:
+    """
+    将 eth_call 返回的十六进制字符串转换成字节
+
+    Raises:
+        ValueError: 不是合法的十六进制字符串
+    """
+    if isinstance(data, bytes):
+        return data
+    if not isinstance(data, str):
+        raise ValueError(f"eth_call result is not a hex string: {data!r}")
+    return bytes.fromhex(data[2:] if data.startswith("0x") else data)
+
+
+def decode_abi_string(data):
+    """
+    解析 ABI 编码的 string 返回值
+
+    Args:
+        data (str | bytes): eth_call 的返回数据
+
+    Returns:
+        str: 解析出的字符串，数据为空或者格式错误时返回 None
+
+    Raises:
+        ValueError: 返回数据不是合法的十六进制字符串
+    """
+    data = hex_to_bytes(data)
+    if len(data) < 64:
+        return None
+    offset = int.from_bytes(data[0:32], "big")
+    if offset + 32 > len(data):
+        return None
+    length = int.from_bytes(data[offset:offset + 32], "big")
+    raw = data[offset + 32: offset + 32 + length]
+    if len(raw) != length:
+        return None
+    return raw.decode("utf-8", errors="replace")
+
+
+def encode_aggregate3(target: str, call_data_list: list) -> str:
+    """
+    将多个针对同一个合约的调用打包成 Multicall3.aggregate3 的 calldata，单个调用失败不会影响其他调用
+
+    Args:
+        target (str): 被调用的合约地址
+        call_data_list (list): 每个调用的 calldata 列表
+
+    Returns:
+        str: 以 0x 开头的 calldata
+    """
+    address_word = encode_uint256(int(target, 16))
+    elements = []
+    for call_data in call_data_list:
+        payload = bytes.fromhex(call_data[2:])
+        padded = payload.hex() + "00" * ((32 - len(payload) % 32) % 32)
+        # (address target, bool allowFailure, bytes callData)
+        elements.append(address_word
+                        + encode_uint256(1)
+                        + encode_uint256(3 * 32)
+                        + encode_uint256(len(payload))
+                        + padded)
+
+    # 数组元素是动态类型，先写每个元素的偏移量，偏移量从长度字段之后开始计算
+    offsets = []
+    position = 32 * len(elements)
+    for element in elements:
+        offsets.append(encode_uint256(position))
+        position += len(element) // 2
+
+    return (AGGREGATE3_SELECTOR
+            + encode_uint256(32)
+            + encode_uint256(len(elements))
+            + "".join(offsets)
+            + "".join(elements))
+
+
+def decode_aggregate3(data) -> list:
+    """
+    解析 Multicall3.aggregate3 的返回值
+
+    Args:
+        data (str | bytes): eth_call 的返回数据
+
+    Returns:
+        list: [(success, return_data_bytes), ...]
+
+    Raises:
+        ValueError: 返回数据不是合法的十六进制字符串，或者偏移量、长度超出了数据范围，
+                    例如链上没有部署 Multicall3 时返回的空数据
+    """
+    data = hex_to_bytes(data)
+
+    def read_word(position: int) -> int:
+        if position < 0 or position + 32 > len(data):
+            raise ValueError(f"malformed aggregate3 result: offset {position} out of range {len(data)}")
+        return int.from_bytes(data[position:position + 32], "big")
+
+    array_start = read_word(0)
+    count = read_word(array_start)
+    base = array_start + 32
+    # 每个元素至少有偏移量、success、bytes 偏移量和 bytes 长度四个字
+    if count * 32 * 4 > len(data) - base:
+        raise ValueError(f"malformed aggregate3 result: {count} elements in {len(data)} bytes")
+    results = []
+    for i in range(count):
+        element_start = base + read_word(base + 32 * i)
+        success = read_word(element_start) == 1
+        bytes_start = element_start + read_word(element_start + 32)
+        length = read_word(bytes_start)
+        if bytes_start + 32 + length > len(data):
+            raise ValueError(f"malformed aggregate3 result: return data of call {i} out of range")
+        results.append((success, data[bytes_start + 32: bytes_start + 32 + length]))
+    return results
+
+
+def resolve_uri(uri: str, gateway: str = "https://ipfs.io/ipfs/"):
+    """
+    将 tokenURI 统一转换成可以直接下载的形式
+
+    Args:
+        uri (str): 合约返回的 tokenURI
+        gateway (str): 用于 ipfs:// 链接的 IPFS 网关
+
+    Returns:
+        tuple: (raw, url)。data: 形式的 URI 会被直接解析成 metadata 放在 raw 中，其余情况返回可下载的 http 链接
+    """
+    if not uri:
+        return None, None
+    uri = uri.strip()
+
+    # 链上 metadata，例如 data:application/json;base64,eyJuYW1lIjoi...
+    if uri.startswith("data:"):
+        header, _, body = uri.partition(",")
+        try:
+            if header.endswith(";base64"):
+                body = base64.b64decode(body).decode("utf-8")
+            else:
+                body = urllib.parse.unquote(body)
+            return json.loads(body), None
+        except Exception:
+            return None, None
+
+    if uri.startswith("ipfs://"):
+        path = uri[len("ipfs://"):]
+        if path.startswith("ipfs/"):
+            path = path[len("ipfs/"):]
+        return None, f"{gateway}{path}"
+
+    if uri.startswith("ar://"):
+        return None, f"https://arweave.net/{uri[len('ar://'):]}"
+
+    return None, uri
+
+
+def send_rpc_batch(rpc_url: str, calls: list, session = None, timeout = 60) -> list:
+    """
+    发送一个 JSON-RPC batch 请求
+
+    Args:
+        rpc_url (str): JSON-RPC 节点地址
+        calls (list): [(method, params), ...]
+        session (requests.Session, optional): 复用连接的会话
+        timeout (int): 请求超时时间（秒）
+
+    Returns:
+        list: 与 calls 顺序一致的结果列表，出错的调用对应 None
+    """
+    payload = build_rpc_payload(calls)
+    return parse_rpc_results(post_rpc_batch(rpc_url, payload, session, timeout).json(), len(calls))
+
+
+def build_rpc_payload(calls: list) -> list:
+    return [{"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(calls)]
+
+
+def post_rpc_batch(rpc_url: str, payload: list, session = None, timeout = 60):
+    response = (session or requests).post(rpc_url, json=payload, headers={"Content-Type": "application/json"}, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def get_rpc_items(body) -> list:
+    # 有的节点在 batch 只有一个元素时直接返回对象
+    return [body] if isinstance(body, dict) else body
+
+
+def is_revert_error(error) -> bool:
+    """
+    调用的错误是否是合约 revert，例如 tokenURI 查询不存在的token。
+    geth 等节点对 revert 返回 code 3 或者 "execution reverted"，限流、超时等节点错误使用其他的 code
+    """
+    if not isinstance(error, dict):
+        return False
+    return error.get("code") == 3 or "revert" in str(error.get("message", "")).lower()
+
+
+def has_rpc_error(body) -> bool:
+    """
+    batch 响应中是否有节点错误，例如节点限流时 HTTP 状态码为 200，但每个调用都带有 error。
+    合约 revert 是确定的结果，不算节点错误
+    """
+    items = get_rpc_items(body)
+    if not isinstance(items, list):
+        return True
+    return any(not isinstance(item, dict) or ("error" in item and not is_revert_error(item["error"])) for item in items)
+
+
+def parse_rpc_results(body, count: int, raise_errors = False) -> list:
+    """
+    按 id 取出 batch 响应中每个调用的结果
+
+    Args:
+        body (list | dict): 解析后的 batch 响应
+        count (int): batch 中的调用数量
+        raise_errors (bool): 为 True 时节点错误和缺少结果的调用会抛出 RPC_Error，只有合约 revert 对应 None
+
+    Returns:
+        list: 长度为 count 的结果列表，出错的调用对应 None
+    """
+    items = get_rpc_items(body)
+    if not isinstance(items, list):
+        if raise_errors:
+            raise RPC_Error(f"Invalid RPC batch response: {body!r}")
+        items = []
+    results = [None] * count
+    answered = set()
+    for item in items:
+        index = item.get("id") if isinstance(item, dict) else None
+        if not isinstance(index, int) or not 0 <= index < count:
+            continue
+        answered.add(index)
+        if "error" not in item:
+            results[index] = item.get("result")
+        elif raise_errors and not is_revert_error(item["error"]):
+            raise RPC_Error(f"RPC call {index} failed: {item['error']}")
+    if raise_errors and len(answered) < count:
+        raise RPC_Error(f"RPC batch returned {len(answered)} of {count} results")
+    return results
+
+
+class RPC_TokenURI_Reader(object):
+    """
+    通过 JSON-RPC 批量读取 tokenURI 的读取器
+    """
+
+    def __init__(self,
+                rpc_url: str,
+                contract_address: str,
+                token_type = "ERC721",
+                batch_size = 100,
+                use_multicall = False,
+                multicall_size = 200,
+                timeout = 60):
+        """
+        Args:
+            rpc_url (str): JSON-RPC 节点地址，本地的模拟节点也可以
+            contract_address (str): NFT 合约地址
+            token_type (str): ERC721 使用 tokenURI，ERC1155 使用 uri
+            batch_size (int): 每个 JSON-RPC batch 请求中包含的 eth_call 数量
+            use_multicall (bool): 是否使用 Multicall3 合并调用
+            multicall_size (int): 每个 aggregate3 调用中包含的 tokenURI 调用数量
+            timeout (int): 请求超时时间（秒）
+        """
+        self.rpc_url = rpc_url
+        self.contract_address = contract_address
+        self.token_type = token_type
+        self.batch_size = batch_size
+        self.use_multicall = use_multicall
+        self.multicall_size = multicall_size
+        self.timeout = timeout
+        self.selector = URI_SELECTOR if token_type == "ERC1155" else TOKEN_URI_SELECTOR
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json", "accept": "application/json"})
+
+    def send_batch(self, calls: list) -> list:
+        """
+        发送一个 JSON-RPC batch 请求，合约 revert 的调用对应 None。
+        开启响应缓存时 tokenURI 的读取结果也会被缓存，离线回放时不再请求节点；
+        带有节点错误的响应不会被缓存，这些token下次会重新读取
+
+        Raises:
+            RPC_Error: 网络错误、HTTP 错误、无法解析的响应，或者有调用返回了节点错误
+        """
+        payload = build_rpc_payload(calls)
+        cache = cht.get_cache()
+        try:
+            if cache is None:
+                body = post_rpc_batch(self.rpc_url, payload, self.session, self.timeout).json()
+            else:
+                response, _ = cache.fetch("RPC", "post", self.rpc_url,
+                                            lambda: post_rpc_batch(self.rpc_url, payload, self.session, self.timeout),
+                                            payload = payload,
+                                            cacheable = lambda response: not has_rpc_error(response.json()))
+                body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise RPC_Error(f"RPC batch request failed: {e}") from e
+        return parse_rpc_results(body, len(calls), raise_errors = True)
+
+    def eth_call(self, data: str, to = None) -> tuple:
+        """生成一个 eth_call 调用"""
+        return ("eth_call", [{"to": to or self.contract_address, "data": data}, "latest"])
+
+    def read_token_uris(self, token_ids: list) -> dict:
+        """
+        批量读取 tokenURI
+
+        Args:
+            token_ids (list): tokenId 列表
+
+        Returns:
+            dict: key 为 tokenId 字符串，value 为 tokenURI，合约 revert（token不存在）的 token 为 None
+
+        Raises:
+            RPC_Error: 节点请求失败，这批token的结果未知
+        """
+        token_ids = [str(token_id) for token_id in token_ids]
+        if self.use_multicall:
+            uri_dict = self._read_by_multicall(token_ids)
+        else:
+            uri_dict = self._read_by_batch(token_ids)
+
+        # ERC1155 的 uri 中可能包含 {id} 占位符，需要替换成 64 位小写十六进制的 tokenId
+        if self.token_type == "ERC1155":
+            for token_id, uri in uri_dict.items():
+                if uri and "{id}" in uri:
+                    uri_dict[token_id] = uri.replace("{id}", encode_uint256(token_id))
+        return uri_dict
+
+    def _read_by_batch(self, token_ids: list) -> dict:
+        uri_dict = {}
+        for i in range(0, len(token_ids), self.batch_size):
+            chunk = token_ids[i:i + self.batch_size]
+            calls = [self.eth_call(encode_call(self.selector, token_id)) for token_id in chunk]
+            results = self.send_batch(calls)
+            for token_id, result in zip(chunk, results):
+                try:
+                    uri_dict[token_id] = decode_abi_string(result) if result else None
+                except ValueError as e:
+                    raise RPC_Error(f"Invalid tokenURI result of {token_id}: {e}") from e
+        return uri_dict
+
+    def _read_by_multicall(self, token_ids: list) -> dict:
+        uri_dict = {}
+        # 每 multicall_size 个 tokenURI 调用合并成一个 aggregate3 调用，再把多个 aggregate3 调用打包进一个 batch
+        groups = [token_ids[i:i + self.multicall_size] for i in range(0, len(token_ids), self.multicall_size)]
+        for i in range(0, len(groups), self.batch_size):
+            group_chunk = groups[i:i + self.batch_size]
+            calls = []
+            for group in group_chunk:
+                call_data = encode_aggregate3(self.contract_address,
+                                            [encode_call(self.selector, token_id) for token_id in group])
+                calls.append(self.eth_call(call_data, to = MULTICALL3_ADDRESS))
+            results = self.send_batch(calls)
+
+            for group, result in zip(group_chunk, results):
+                # allowFailure 为 true，aggregate3 本身不会因为单个调用 revert 而失败
+                if result is None:
+                    raise RPC_Error(f"aggregate3 call reverted for tokens {group[0]}..{group[-1]}")
+                try:
+                    decoded = decode_aggregate3(result)
+                    if len(decoded) != len(group):
+                        raise ValueError(f"{len(decoded)} results for {len(group)} calls")
+                    for token_id, (success, return_data) in zip(group, decoded):
+                        uri_dict[token_id] = decode_abi_string(return_data) if success else None
+                except ValueError as e:
+                    raise RPC_Error(f"Invalid aggregate3 result: {e}") from e
+        return uri_dict
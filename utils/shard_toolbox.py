@@ -0,0 +1,331 @@
+"""
+多节点分片下载
+
+把下载任务切分成tokenId区间分片或者项目分片，多台机器通过共享文件系统上的租约文件领取分片：
+    ENV.DATASET_PATH / "_leases" / {任务名} /
+        shards.json          分片列表，由第一个启动的节点写入
+        {分片编号}.lease      租约文件，使用 O_EXCL 创建保证只有一个节点领取成功，持有者定期更新修改时间作为心跳
+        {分片编号}.done       分片完成标记
+
+节点宕机后租约文件不再更新，超过有效期后其他节点会接管该分片。
+每个节点在自己领取的分片上运行现有的下载器类，保存路径与单机运行相同，因此最终的目录结构完全一致。
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.batch_toolbox as btb
+import utils.discovery_toolbox as dst
+import utils.file_io as fio
+import utils.log_toolbox as ltb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+def create_range_shards(collection_info: dict, platform = "Alchemy", shard_size = 1000) -> list:
+    """
+    将一个项目按tokenId区间切分成分片，有探测结果时只包含存在的token
+
+    Args:
+        collection_info (dict): 项目信息
+        platform (str): 下载平台，需要支持 load_task_plan，即 Alchemy 或 RPC
+        shard_size (int): 每个分片包含的token数量
+
+    Returns:
+        list: [{"id": str, "type": "range", "chain_type", "contract_address", "platform", "ranges": [[start, end], ...]}, ...]
+    """
+    token_space = dst.load_token_space(collection_info)
+    if token_space:
+        ranges = token_space["ranges"]
+    else:
+        start_index = collection_info["start_index"]
+        ranges = [[start_index, start_index + collection_info["total_supply"] - 1]]
+
+    shard_list = []
+    current = []
+    count = 0
+    for start, end in ranges:
+        while start <= end:
+            stop = min(end, start + shard_size - count - 1)
+            current.append([start, stop])
+            count += stop - start + 1
+            start = stop + 1
+            if count == shard_size:
+                shard_list.append(current)
+                current, count = [], 0
+    if current:
+        shard_list.append(current)
+
+    return [{"id": f"{collection_info['contract_address']}_{shard[0][0]}",
+            "type": "range",
+            "chain_type": collection_info["chain_type"],
+            "contract_address": collection_info["contract_address"],
+            "platform": platform,
+            "ranges": shard}
+            for shard in shard_list]
+
+
+def create_collection_shards(job_list: list) -> list:
+    """
+    每个项目作为一个分片，用于多节点分担批量任务
+
+    Args:
+        job_list (list): batch_toolbox.load_job_list 的返回值
+
+    Returns:
+        list: [{"id": str, "type": "collection", "chain_type", "contract_address", "platform"}, ...]
+    """
+    return [{"id": f"{job['chain_type']}_{job['contract_address']}",
+            "type": "collection",
+            "chain_type": job["chain_type"],
+            "contract_address": job["contract_address"],
+            "platform": job.get("platform")}
+            for job in job_list]
+
+
+class Lease_Manager(object):
+    """
+    共享文件系统上的分片租约管理
+    """
+
+    def __init__(self, name: str, node_id = None, ttl = 120, lease_root = None):
+        """
+        Args:
+            name (str): 任务名，所有节点使用相同的任务名
+            node_id (str): 节点名称，默认为 主机名-进程号
+            ttl (int): 租约有效期（秒），超过有效期没有心跳的租约可以被其他节点接管
+            lease_root (Path): 租约根目录，默认为 ENV.DATASET_PATH / "_leases"
+        """
+        self.lease_path = Path(lease_root or ENV.DATASET_PATH / "_leases").joinpath(name)
+        fio.check_dir(self.lease_path)
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        self.held = set()
+        self.lock = threading.Lock()
+        self.heartbeat_thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.lease_path.joinpath("shards.json")
+
+    def publish(self, shard_list: list) -> list:
+        """
+        写入分片列表，已经有节点写入时使用已有的列表，保证所有节点看到相同的分片
+
+        Returns:
+            list: 实际使用的分片列表
+        """
+        temp_path = self.lease_path.joinpath(f"shards.{self.node_id}.tmp")
+        with open(temp_path, 'w', encoding='UTF-8') as file:
+            json.dump(shard_list, file)
+        try:
+            # link 在目标已存在时失败，写入完整文件后再原子地发布
+            os.link(temp_path, self.manifest_path)
+        except FileExistsError:
+            pass
+        finally:
+            temp_path.unlink()
+        return self.load_shards()
+
+    def load_shards(self) -> list:
+        with open(self.manifest_path, 'r', encoding='UTF-8') as file:
+            return json.load(file)
+
+    def get_lease_file(self, shard_id: str) -> Path:
+        return self.lease_path.joinpath(f"{shard_id}.lease")
+
+    def get_done_file(self, shard_id: str) -> Path:
+        return self.lease_path.joinpath(f"{shard_id}.done")
+
+    def is_done(self, shard_id: str) -> bool:
+        return self.get_done_file(shard_id).exists()
+
+    def read_owner(self, shard_id: str):
+        try:
+            with open(self.get_lease_file(shard_id), 'r', encoding='UTF-8') as file:
+                return json.load(file).get("node")
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def is_expired(self, shard_id: str) -> bool:
+        try:
+            return time.time() - self.get_lease_file(shard_id).stat().st_mtime > self.ttl
+        except FileNotFoundError:
+            return True
+
+    def claim(self, shard_id: str) -> bool:
+        """
+        尝试领取分片，租约已过期时先接管
+
+        Returns:
+            bool: 是否领取成功
+        """
+        if self.is_done(shard_id):
+            return False
+        lease_file = self.get_lease_file(shard_id)
+        if lease_file.exists():
+            if not self.is_expired(shard_id):
+                return False
+            # 接管过期租约：先把旧租约改名，改名只有一个节点能成功，再重新创建
+            stale_file = lease_file.with_name(f"{lease_file.name}.{self.node_id}.stale")
+            try:
+                os.rename(lease_file, stale_file)
+            except FileNotFoundError:
+                return False
+            previous = None
+            try:
+                with open(stale_file, 'r', encoding='UTF-8') as file:
+                    previous = json.load(file).get("node")
+            except (OSError, json.JSONDecodeError):
+                pass
+            stale_file.unlink(missing_ok = True)
+            ltb.get_logger().warning(f"Node {self.node_id} takes over shard {shard_id} from {previous}.")
+        try:
+            fd = os.open(lease_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='UTF-8') as file:
+            json.dump({"node": self.node_id, "claimed_at": time.time()}, file)
+        with self.lock:
+            self.held.add(shard_id)
+        return True
+
+    def renew(self) -> None:
+        """更新所有持有的租约的修改时间，发现租约被其他节点接管时放弃该分片"""
+        with self.lock:
+            held = list(self.held)
+        for shard_id in held:
+            if self.read_owner(shard_id) != self.node_id:
+                ltb.get_logger().warning(f"Node {self.node_id} lost the lease of shard {shard_id}.")
+                with self.lock:
+                    self.held.discard(shard_id)
+                continue
+            try:
+                os.utime(self.get_lease_file(shard_id))
+            except FileNotFoundError:
+                with self.lock:
+                    self.held.discard(shard_id)
+
+    def release(self, shard_id: str, done: bool) -> None:
+        """释放租约，done 为 True 时先写入完成标记"""
+        with self.lock:
+            self.held.discard(shard_id)
+        if self.read_owner(shard_id) != self.node_id:
+            return
+        if done:
+            self.get_done_file(shard_id).write_text(json.dumps({"node": self.node_id, "finished_at": time.time()}))
+        self.get_lease_file(shard_id).unlink(missing_ok = True)
+
+    def start_heartbeat(self) -> None:
+        def heartbeat():
+            while not self.stop_event.wait(self.ttl / 3):
+                self.renew()
+        self.stop_event.clear()
+        self.heartbeat_thread = threading.Thread(target = heartbeat, daemon = True)
+        self.heartbeat_thread.start()
+
+    def stop_heartbeat(self) -> None:
+        self.stop_event.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+
+
+class Shard_Node(object):
+    """
+    分片下载节点：不断领取分片并用现有的下载器下载，直到所有分片完成
+    """
+
+    def __init__(self, manager: Lease_Manager, save_path = ENV.DATASET_PATH, process_num = 4, thread_num = 4, poll_interval = 10):
+        """
+        Args:
+            manager (Lease_Manager): 租约管理器
+            save_path (Path): 数据保存路径，所有节点应指向同一个共享目录
+            process_num (int): 下载器的进程数
+            thread_num (int): 下载器的线程数
+            poll_interval (int): 没有可领取的分片时，等待其他节点的租约过期的轮询间隔（秒）
+        """
+        self.manager = manager
+        self.save_path = Path(save_path)
+        self.process_num = process_num
+        self.thread_num = thread_num
+        self.poll_interval = poll_interval
+
+    def create_downloader(self, shard: dict):
+        collection_info = btb.load_collection_info(shard["contract_address"], shard["chain_type"])
+        if collection_info is None:
+            raise ValueError(f"Collection {shard['contract_address']} not found on {shard['chain_type']}.")
+        downloader_class = btb.get_downloader_class(shard.get("platform"), shard["chain_type"])
+        downloader = downloader_class(chain_type = collection_info["chain_type"],
+                                    NFT_name = collection_info["NFT_name"],
+                                    contract_address = collection_info["contract_address"],
+                                    candidate_format = collection_info["candidate_format"],
+                                    save_path = self.save_path,
+                                    process_num = self.process_num,
+                                    thread_num = self.thread_num,
+                                    total_supply = collection_info["total_supply"],
+                                    start_index = collection_info["start_index"])
+
+        if shard["type"] == "range":
+            if not hasattr(downloader, "load_task_plan"):
+                raise ValueError(f"Platform {shard['platform']} does not support token range shards.")
+            downloader.load_task_plan({"ranges": shard["ranges"]})
+        elif hasattr(downloader, "load_task_plan") and (token_space := dst.load_token_space(collection_info)):
+            downloader.load_task_plan(token_space)
+        return downloader
+
+    def run_shard(self, shard: dict) -> bool:
+        try:
+            downloader = self.create_downloader(shard)
+            return downloader.download_media_and_metadata() is not False
+        except Exception as e:
+            ltb.get_logger().error(f"Shard {shard['id']} failed on node {self.manager.node_id}: {e}")
+            return False
+
+    def run(self, shard_list: list) -> dict:
+        """
+        下载分片直到所有分片完成，本节点失败的分片不再重试，留给其他节点
+
+        Args:
+            shard_list (list): 分片列表，已有其他节点发布时以已发布的列表为准
+
+        Returns:
+            dict: key 为分片编号，value 为本节点是否完成了该分片
+        """
+        shard_list = self.manager.publish(shard_list)
+        result = {}
+        failed = set()
+        self.manager.start_heartbeat()
+        try:
+            while True:
+                claimed = None
+                remaining = [shard for shard in shard_list if not self.manager.is_done(shard["id"]) and shard["id"] not in failed]
+                if not remaining:
+                    break
+                for shard in remaining:
+                    if self.manager.claim(shard["id"]):
+                        claimed = shard
+                        break
+                if claimed is None:
+                    # 剩下的分片都被其他节点持有，等待它们完成或者租约过期
+                    time.sleep(self.poll_interval)
+                    continue
+
+                ltb.get_logger().info(f"Node {self.manager.node_id} downloading shard {claimed['id']}.")
+                success = self.run_shard(claimed)
+                self.manager.release(claimed["id"], done = success)
+                result[claimed["id"]] = success
+                if not success:
+                    failed.add(claimed["id"])
+        finally:
+            self.manager.stop_heartbeat()
+
+        done = sum(self.manager.is_done(shard["id"]) for shard in shard_list)
+        ltb.get_logger().info(f"Node {self.manager.node_id} finished: {done}/{len(shard_list)} shards done.")
+        return result
@@ -2,6 +2,8 @@ import json
 import os
 import random
 import sys
+import threading
+import time
 import requests
 import utils.file_io as fio
 
@@ -31,6 +33,147 @@ def get_api(key_type: str) -> str:
 
 
 
+def get_platform_info() -> dict:
+    """
+    读取 platform_info.json 中各个平台的能力配置，每个进程只读取一次
+
+    Returns:
+        dict: key 为平台名称，value 为能力配置，包括支持的链、最大分页大小、最大批量大小、请求速率和接口模板
+    """
+    global _PLATFORM_INFO
+    if _PLATFORM_INFO is None:
+        _PLATFORM_INFO = fio.load_json(ENV.PLATFORM_INFO_PATH) or {}
+    return _PLATFORM_INFO
+
+_PLATFORM_INFO = None
+
+
+def get_platform_profile(platform: str) -> dict:
+    """获取单个平台的能力配置"""
+    profile = get_platform_info().get(platform)
+    if profile is None:
+        raise ValueError(f"Platform {platform} not found in platform_info.json!")
+    return profile
+
+
+def get_platform_chains(platform: str) -> list:
+    """获取平台支持的区块链名称列表"""
+    return get_platform_info().get(platform, {}).get("chains", [])
+
+
+def get_endpoint(platform: str, chain_type: str, name: str, **kwargs) -> str:
+    """
+    根据平台配置中的接口模板生成请求链接
+
+    Args:
+        platform (str): 平台名称
+        chain_type (str): 区块链类型
+        name (str): 接口名称，例如 "page"、"batch"
+        **kwargs: 模板参数，例如 contract_address、token_id，API密钥会自动填入
+
+    Returns:
+        str: 请求链接
+    """
+    chain_type = chain_type.lower()
+    endpoints = get_platform_profile(platform).get("endpoints", {})
+    templates = endpoints.get(chain_type) or endpoints.get("default")
+    if templates is None or name not in templates:
+        raise ValueError(f"{platform} does not support {name} requests on {chain_type}!")
+    template = templates[name]
+    if "{api}" in template:
+        kwargs["api"] = get_api(platform)
+    return template.format(chain_type = chain_type, **kwargs)
+
+
+class Rate_Limiter(object):
+    """
+    令牌桶限速器，按照平台配置中的 requests_per_second 和 burst_size 限制请求速率
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """获取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+                self.last_time = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(platform: str, share: float = 1.0) -> Rate_Limiter:
+    """
+    获取平台的限速器，同一个进程内的所有下载器共用同一个限速器
+
+    Args:
+        platform (str): 平台名称
+        share (float): 当前进程分到的速率比例，多进程下载时为 1 / 进程数，只在第一次创建时生效
+
+    Returns:
+        Rate_Limiter: 限速器
+    """
+    with _RATE_LIMITERS_LOCK:
+        if platform not in _RATE_LIMITERS:
+            profile = get_platform_profile(platform)
+            rate = profile.get("requests_per_second", 5) * share
+            burst = int(profile.get("burst_size", 1) * share)
+            _RATE_LIMITERS[platform] = Rate_Limiter(rate, burst)
+        return _RATE_LIMITERS[platform]
+
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session(pool_size: int = 64) -> requests.Session:
+    """
+    获取当前进程共用的 requests 会话，所有下载器和批量任务复用同一个连接池
+
+    Args:
+        pool_size (int): 每个主机保持的最大连接数，只在第一次创建时生效
+
+    Returns:
+        requests.Session: 会话
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+            _SESSION.mount("http://", adapter)
+            _SESSION.mount("https://", adapter)
+        return _SESSION
+
+
+def get_configured_platforms(chain_type: str = "ethereum") -> list:
+    """
+    获取支持指定区块链并且已经配置了API密钥的平台
+
+    Args:
+        chain_type (str): 区块链类型
+
+    Returns:
+        list: 平台名称列表，顺序与 platform_info.json 一致
+    """
+    api_keys = fio.load_json(ENV.API_KEYS_PATH) or {}
+    return [platform for platform in get_platform_info()
+            if chain_type.lower() in [chain.lower() for chain in get_platform_chains(platform)] and api_keys.get(platform)]
+
+
+
 def get_random_user_agent() -> str:
     """获取随机User-Agent."""
 
@@ -135,32 +278,42 @@ def get_headers() -> dict:
     return headers
 
 
-def get_start_file_index(contract_address) -> int:
+def parse_token_id(token_id) -> int:
+    """
+    将tokenId统一转换成整数，兼容十进制字符串和 0x 开头的十六进制字符串（例如 Alchemy 的 pageKey）
+
+    Args:
+        token_id (str | int): tokenId
+
+    Returns:
+        int: 整数形式的tokenId
+    """
+    if isinstance(token_id, int):
+        return token_id
+    token_id = str(token_id).strip()
+    if token_id.lower().startswith("0x"):
+        return int(token_id, 16)
+    return int(token_id)
+
+
+def get_start_file_index(contract_address, chain_type = "ethereum") -> int:
     
     """
-    判断文件编号是从0开始还是从1开始
+    判断文件编号从几开始，不只检查 0 号token，而是批量检查最小的若干个编号
 
     Args:
         contract_address (str): 将要被检查的合约地址
+        chain_type (str): 区块链类型
 
     Returns:
-        int: 文件编号从0开始返回0，从1开始返回1
+        int: 最小的存在的tokenId，出错时返回 None
     """
+    # 避免循环引用
+    import utils.discovery_toolbox as dst
 
-    # 获取随机的alchemy api
-    api = get_random_api()
-    url = f"https://eth-mainnet.g.alchemy.com/nft/v2/{api}/getNFTMetadata?contractAddress={contract_address}&tokenId=0&refreshCache=false"
-    headers = {"accept": "application/json"}
     try:
-        print("requesting...")
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            response_body = json.loads(response.text)
-            # 如果返回的json文件中有error字段，说明文件编号从1开始
-            if "error" in response_body.keys():
-                return 1
-            else:
-                return 0
+        probe = dst.create_probe(contract_address, chain_type)
+        return dst.Token_Space_Discovery(probe).find_start_index()
     except Exception as e:
         print(f"Error: {e}")
         return None 
@@ -208,8 +361,7 @@ def get_target_collection_info(contract_address: str, chain_type = "ethereum") -
 
     # 如果是以太坊链，使用Alchemy API
     if chain_type == "ethereum":
-        api = get_api("Alchemy")
-        url = f"https://eth-mainnet.g.alchemy.com/nft/v3/{api}/getNFTMetadataBatch"
+        url = get_endpoint("Alchemy", chain_type, "batch")
 
         payload = {
             "tokens": [
@@ -244,7 +396,7 @@ def get_target_collection_info(contract_address: str, chain_type = "ethereum") -
 
     # 使用NFTGo API
     else:
-        url = f"https://data-api.nftgo.io/{chain_type}/v1/nft/infos"
+        url = get_endpoint("NFTGo", chain_type, "batch")
         payload = { "params": [
                 {
                     "contract_address": contract_address,
@@ -276,7 +428,19 @@ def get_target_collection_info(contract_address: str, chain_type = "ethereum") -
             total_supply = collection_info["total_supply"]
         else: 
             return None
-    if total_supply is None:
+    # 通过批量探测得到真实的tokenId布局，避免错误的供应量导致漏下载或者大量无效请求
+    try:
+        import utils.discovery_toolbox as dst
+        token_space = dst.discover_token_space(contract_address, chain_type, token_Type)
+    except Exception as e:
+        print(f"Token id discovery failed: {e}")
+        token_space = None
+
+    if token_space is not None:
+        start_index = token_space["start_index"]
+        total_supply = token_space["total_supply"]
+        token_space = dst.save_token_space(chain_type, contract_address, token_space)
+    elif total_supply is None:
         # 如果没有查到总供应量，则默认为10000
         total_supply = 10000
     # 将供应量转为整数
@@ -296,5 +460,6 @@ def get_target_collection_info(contract_address: str, chain_type = "ethereum") -
         "total_supply": total_supply,
         "token_Type": token_Type,
         "candidate_format": candidate_format,
-        "start_index": start_index
+        "start_index": start_index,
+        "token_space": token_space
     }
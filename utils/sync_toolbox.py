@@ -0,0 +1,238 @@
+"""
+基于链上事件的增量同步
+
+记录每个项目最后同步到的区块高度，之后只读取新区块中的 ERC-4906 MetadataUpdate / BatchMetadataUpdate
+事件以及铸造时的 Transfer 事件，只重新下载受影响的 token。
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.file_io as fio
+import utils.log_toolbox as ltb
+import utils.rpc_toolbox as rpc
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+# 事件签名的 keccak256 哈希
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"               # Transfer(address,address,uint256)
+METADATA_UPDATE_TOPIC = "0xf8e1a15aba9398e019f0b49df1a4fde98ee17ae345cb5f6b5e2c27f5033e8ce7"        # MetadataUpdate(uint256)
+BATCH_METADATA_UPDATE_TOPIC = "0x6bd5c950a8d8df17f772f5af37cb3655737899cbf903264b9795592da439661c"  # BatchMetadataUpdate(uint256,uint256)
+ZERO_TOPIC = "0x" + "0" * 64
+
+
+def get_sync_state_path(chain_type: str):
+    """获取保存同步状态的文件路径"""
+    return ENV.SYNC_STATE_PATH / f"{chain_type.lower()}_sync_state.json"
+
+
+def load_sync_state(chain_type: str) -> dict:
+    """
+    读取同步状态
+
+    Returns:
+        dict: key 为合约地址，value 为 {"last_synced_block": int}
+    """
+    state_path = get_sync_state_path(chain_type)
+    if not state_path.exists():
+        return {}
+    return fio.load_json(state_path) or {}
+
+
+def save_sync_state(chain_type: str, contract_address: str, last_synced_block: int) -> None:
+    """更新单个项目的同步状态"""
+    fio.append_dict_to_json_file(get_sync_state_path(chain_type),
+                                {contract_address: {"last_synced_block": last_synced_block}})
+
+
+def parse_logs(logs: list, start_index = 0, total_supply = None) -> tuple:
+    """
+    从事件日志中解析出需要重新下载的tokenId
+
+    Args:
+        logs (list): eth_getLogs 返回的日志列表
+        start_index (int): 项目的起始编号，用于限制 BatchMetadataUpdate 的范围
+        total_supply (int, optional): 项目的总供应量，用于限制 BatchMetadataUpdate 的范围
+
+    Returns:
+        tuple: (tokenId 集合, 是否需要整个项目重新同步)
+    """
+    token_ids = set()
+    full_refresh = False
+    for log in logs:
+        topics = log.get("topics", [])
+        if not topics:
+            continue
+        data = log.get("data", "0x")[2:]
+
+        if topics[0] == METADATA_UPDATE_TOPIC:
+            token_ids.add(int(data[0:64], 16))
+
+        elif topics[0] == BATCH_METADATA_UPDATE_TOPIC:
+            from_id, to_id = int(data[0:64], 16), int(data[64:128], 16)
+            # 很多合约在揭示时会发出 (0, type(uint256).max) 这样的全量更新事件
+            if total_supply is not None:
+                from_id = max(from_id, start_index)
+                to_id = min(to_id, start_index + total_supply - 1)
+            if total_supply is None or to_id - from_id + 1 >= total_supply:
+                full_refresh = True
+            if total_supply is not None:
+                token_ids.update(range(from_id, to_id + 1))
+
+        # ERC721 的 Transfer 有 4 个 topic，from 为零地址表示铸造
+        elif topics[0] == TRANSFER_TOPIC and len(topics) == 4 and topics[1] == ZERO_TOPIC:
+            token_ids.add(int(topics[3], 16))
+
+    return token_ids, full_refresh
+
+
+class Incremental_Syncer(object):
+    """
+    基于链上事件的增量同步器
+    """
+
+    def __init__(self,
+                chain_type: str,
+                rpc_url = None,
+                block_range = 2000,
+                ranges_per_batch = 10):
+        """
+        Args:
+            chain_type (str): 区块链类型
+            rpc_url (str, optional): JSON-RPC 节点地址，默认读取 api_keys.json 中的配置
+            block_range (int): 每次 eth_getLogs 查询的区块数量
+            ranges_per_batch (int): 每个 JSON-RPC batch 请求中包含的 eth_getLogs 查询数量，每个区块段有 metadata 更新和铸造两个查询
+        """
+        self.chain_type = chain_type.lower()
+        self.rpc_url = rpc_url or rpc.get_rpc_url(self.chain_type)
+        if self.rpc_url is None:
+            raise ValueError(f"No JSON-RPC endpoint configured for {chain_type}!")
+        self.block_range = block_range
+        self.ranges_per_batch = ranges_per_batch
+        self.sync_state = load_sync_state(self.chain_type)
+
+    def get_latest_block(self) -> int:
+        """获取最新的区块高度"""
+        result = rpc.send_rpc_batch(self.rpc_url, [("eth_blockNumber", [])])[0]
+        if result is None:
+            raise RuntimeError("eth_blockNumber failed")
+        return int(result, 16)
+
+    def get_logs(self, contract_address: str, from_block: int, to_block: int) -> list:
+        """
+        分段读取合约在指定区块范围内的相关事件，多个区块段打包在一个 batch 请求中
+
+        Args:
+            contract_address (str): 合约地址
+            from_block (int): 起始区块（包含）
+            to_block (int): 结束区块（包含）
+
+        Returns:
+            list: 日志列表
+        """
+        # 铸造单独查询，在节点上按 from 为零地址过滤，不返回二级市场的 Transfer
+        queries = ([[METADATA_UPDATE_TOPIC, BATCH_METADATA_UPDATE_TOPIC]], [TRANSFER_TOPIC, ZERO_TOPIC])
+        pending = [(topics, start, min(start + self.block_range - 1, to_block))
+                    for start in range(from_block, to_block + 1, self.block_range) for topics in queries]
+        logs = []
+        while pending:
+            ranges, pending = pending[:self.ranges_per_batch], pending[self.ranges_per_batch:]
+            calls = [("eth_getLogs", [{"address": contract_address,
+                                        "fromBlock": hex(start),
+                                        "toBlock": hex(end),
+                                        "topics": topics}]) for topics, start, end in ranges]
+            results = rpc.send_rpc_batch(self.rpc_url, calls)
+            for (topics, start, end), result in zip(ranges, results):
+                if result is not None:
+                    logs.extend(result)
+                elif start < end:
+                    # 节点拒绝了这个区块段（通常是结果太多），拆成两半重新查询
+                    middle = (start + end) // 2
+                    pending.extend([(topics, start, middle), (topics, middle + 1, end)])
+                else:
+                    raise RuntimeError(f"eth_getLogs failed for block {start}")
+        return logs
+
+    def sync_collection(self, collection_info: dict, save_path, latest_block = None, start_block = None) -> bool:
+        """
+        增量同步单个项目
+
+        Args:
+            collection_info (dict): target_collection_info.json 中的项目信息
+            save_path (str): 数据保存路径
+            latest_block (int, optional): 同步到的区块高度，默认使用最新区块
+            start_block (int, optional): 第一次同步时的起始区块
+
+        Returns:
+            bool: 同步是否成功，只有受影响的token全部下载成功后才会更新同步到的区块高度，失败时下次同步会重新读取这些事件
+        """
+        # 避免循环引用
+        import utils.downloading_toolbox as dtb
+
+        contract_address = collection_info["contract_address"]
+        NFT_name = collection_info["NFT_name"]
+        if latest_block is None:
+            try:
+                latest_block = self.get_latest_block()
+            except Exception as e:
+                ltb.get_logger().error(f"{NFT_name} Error reading the latest block: {e}")
+                return False
+
+        last_synced_block = self.sync_state.get(contract_address, {}).get("last_synced_block")
+        if last_synced_block is None:
+            if start_block is None:
+                # 没有同步记录时，默认已经完整下载过一次，只记录当前的区块高度
+                ltb.get_logger().info(f"{NFT_name} has no sync state, marking block {latest_block} as synced.")
+                save_sync_state(self.chain_type, contract_address, latest_block)
+                self.sync_state[contract_address] = {"last_synced_block": latest_block}
+                return True
+            last_synced_block = start_block - 1
+
+        if last_synced_block >= latest_block:
+            ltb.get_logger().info(f"{NFT_name} is already up to date.")
+            return True
+
+        try:
+            logs = self.get_logs(contract_address, last_synced_block + 1, latest_block)
+        except Exception as e:
+            ltb.get_logger().error(f"{NFT_name} Error reading logs: {e}")
+            return False
+
+        token_ids, full_refresh = parse_logs(logs,
+                                            start_index = collection_info.get("start_index", 0),
+                                            total_supply = collection_info.get("total_supply"))
+        ltb.get_logger().info(f"{NFT_name}: {len(logs)} events, {len(token_ids)} tokens to refresh"
+                            f"{' (full refresh)' if full_refresh else ''}.")
+
+        if token_ids or full_refresh:
+            NFT_downloader = dtb.NFT_Downloader_for_Whole_Collection_RPC(
+                chain_type = self.chain_type,
+                NFT_name = NFT_name,
+                contract_address = contract_address,
+                candidate_format = collection_info["candidate_format"],
+                save_path = save_path,
+                total_supply = collection_info.get("total_supply", 10000),
+                start_index = collection_info.get("start_index", 0),
+                rpc_url = self.rpc_url,
+                token_type = collection_info.get("token_Type", "ERC721"))
+            # 全量更新时直接重新下载整个项目
+            if not NFT_downloader.download_media_and_metadata(token_ids = None if full_refresh else sorted(token_ids)):
+                ltb.get_logger().error(f"{NFT_name} refresh failed, keeping the sync state at block {last_synced_block}.")
+                return False
+
+        save_sync_state(self.chain_type, contract_address, latest_block)
+        self.sync_state[contract_address] = {"last_synced_block": latest_block}
+        return True
+
+    def sync_collections(self, collection_info_list: list, save_path) -> dict:
+        """
+        依次增量同步多个项目，所有项目共用同一个最新区块高度
+
+        Returns:
+            dict: key 为合约地址，value 为同步是否成功
+        """
+        latest_block = self.get_latest_block()
+        return {collection_info["contract_address"]: self.sync_collection(collection_info, save_path, latest_block = latest_block)
+                for collection_info in collection_info_list}
@@ -0,0 +1,268 @@
+"""
+单个token的全流程追踪
+
+开启后（环境变量 NFT_DL_TRACE=1，或者调用 enable_tracing()，子进程会继承），每个token都会留下
+从分页抓取、链接解析、每个源站或网关的尝试、接收字节数到写盘的时间记录，格式与 Chrome trace 兼容：
+    1. 分页请求、metadata 下载、每次下载尝试、写盘等是普通的时间段事件（ph = "X"），args 中带有 token、主机和状态码
+    2. token 的生命周期是异步事件（ph = "b" / "e"），从出现在分页结果中开始，到媒体文件下载完成或放弃为止
+
+每个进程把事件追加写入 ENV.TRACE_LOGGING_PATH / {运行编号} / {进程号}.jsonl，运行编号与 metrics_toolbox 相同。
+运行结束后 merge_traces() 合并成一个 trace.json，可以直接用 chrome://tracing 或 Perfetto 打开，
+print_report() 列出最慢的token、最慢的主机和导致重试最多的网关。
+未开启时所有方法都直接返回，几乎没有开销。
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.metrics_toolbox as mtb
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+TRACE_ENV = "NFT_DL_TRACE"
+
+# 缓存的事件超过这个数量时写入文件
+FLUSH_SIZE = 2000
+
+
+def is_enabled() -> bool:
+    return os.environ.get(TRACE_ENV, "") not in ("", "0")
+
+
+def enable_tracing() -> None:
+    """开启追踪，之后创建的子进程也会开启"""
+    os.environ[TRACE_ENV] = "1"
+
+
+def now_us() -> int:
+    # 使用墙上时间，不同进程的事件可以放在同一条时间轴上
+    return time.time_ns() // 1000
+
+
+class Tracer(object):
+    """
+    进程内共用的追踪器
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.enabled = is_enabled()
+        self.lock = threading.Lock()
+        self.events = []
+        self.local = threading.local()
+        self.run_path = ENV.TRACE_LOGGING_PATH / mtb.get_run_id()
+        if self.enabled:
+            self.run_path.mkdir(parents = True, exist_ok = True)
+
+    @property
+    def current_token(self):
+        return getattr(self.local, "token", None)
+
+    def emit(self, event: dict) -> None:
+        event["pid"] = self.pid
+        event["tid"] = threading.get_ident() % 100000
+        with self.lock:
+            self.events.append(event)
+            full = len(self.events) >= FLUSH_SIZE
+        if full:
+            self.flush()
+
+    @contextmanager
+    def span(self, name: str, token = None, **args):
+        """
+        记录一个时间段，yield 的字典会写入事件的 args，可以在执行过程中填入状态码、字节数等
+
+        Args:
+            name (str): 事件名称，例如 page_fetch、media_attempt
+            token (int): tokenId，默认为当前线程正在处理的token
+            **args: 附加信息，例如 host、url
+        """
+        if not self.enabled:
+            yield args
+            return
+        token = token if token is not None else self.current_token
+        if token is not None:
+            args["token"] = token
+        begin = now_us()
+        try:
+            yield args
+        except Exception as e:
+            args["error"] = str(e)[:200]
+            raise
+        finally:
+            self.emit({"name": name, "cat": "nft", "ph": "X", "ts": begin, "dur": now_us() - begin, "args": args})
+
+    def add_span(self, name: str, begin_us: int, duration_us: int, **args) -> None:
+        """记录一个已经测量好的时间段，例如多次写盘的累计耗时"""
+        if not self.enabled:
+            return
+        if self.current_token is not None:
+            args.setdefault("token", self.current_token)
+        self.emit({"name": name, "cat": "nft", "ph": "X", "ts": begin_us, "dur": duration_us, "args": args})
+
+    def listed(self, token_ids, **args) -> None:
+        """token 出现在分页或批量结果中，开始它的生命周期"""
+        if not self.enabled:
+            return
+        ts = now_us()
+        for token_id in token_ids:
+            self.emit({"name": "token", "cat": "token", "ph": "b", "id": str(token_id), "ts": ts, "args": dict(args, token = token_id)})
+
+    @contextmanager
+    def token(self, token_id):
+        """
+        处理一个token的媒体资源，期间当前线程记录的事件都属于这个token，结束时关闭它的生命周期
+
+        yield 的字典中填入 success 表示是否下载成功
+        """
+        if not self.enabled:
+            yield {}
+            return
+        previous = self.current_token
+        self.local.token = token_id
+        result = {"success": False}
+        try:
+            yield result
+        finally:
+            self.local.token = previous
+            self.emit({"name": "token", "cat": "token", "ph": "e", "id": str(token_id), "ts": now_us(),
+                        "args": {"token": token_id, "success": result["success"]}})
+
+    def flush(self) -> None:
+        """把缓存的事件追加到本进程的事件文件"""
+        if not self.enabled:
+            return
+        with self.lock:
+            events, self.events = self.events, []
+        if not events:
+            return
+        try:
+            with open(self.run_path / f"{self.pid}.jsonl", 'a', encoding='UTF-8') as file:
+                file.write("".join(json.dumps(event, separators=(',', ':')) + "\n" for event in events))
+        except OSError as e:
+            print(f"Failed to write trace events: {e}")
+
+
+_TRACER = None
+_TRACER_LOCK = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """获取当前进程共用的追踪器，fork 出的子进程会重新创建"""
+    global _TRACER
+    with _TRACER_LOCK:
+        if _TRACER is None or _TRACER.pid != os.getpid():
+            _TRACER = Tracer()
+        return _TRACER
+
+
+def load_events(run_id = None) -> list:
+    """读取一次运行中所有进程的事件"""
+    get_tracer().flush()
+    run_path = ENV.TRACE_LOGGING_PATH / (run_id or mtb.get_run_id())
+    events = []
+    for file_path in sorted(run_path.glob("*.jsonl")):
+        with open(file_path, 'r', encoding='UTF-8') as file:
+            for line in file:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 进程被结束时最后一行可能不完整
+                    continue
+    return events
+
+
+def merge_traces(run_id = None):
+    """
+    把所有进程的事件合并成 Chrome trace 格式的 trace.json
+
+    Returns:
+        Path: trace.json 的路径
+    """
+    run_path = ENV.TRACE_LOGGING_PATH / (run_id or mtb.get_run_id())
+    events = load_events(run_id)
+    events.sort(key = lambda event: event["ts"])
+    file_path = run_path / "trace.json"
+    with open(file_path, 'w', encoding='UTF-8') as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file, separators=(',', ':'))
+    return file_path
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))] if values else 0.0
+
+
+def build_report(events: list, top = 10) -> dict:
+    """
+    根据事件统计最慢的token、最慢的主机和导致重试最多的网关
+
+    Args:
+        events (list): load_events 的返回值
+        top (int): 每一项列出的数量
+
+    Returns:
+        dict: {"tokens": [...], "hosts": [...], "gateways": [...]}
+    """
+    begin_time = {}
+    tokens = {}
+    attempts = {}
+    hosts = {}
+    for event in events:
+        args = event.get("args", {})
+        if event["ph"] == "b":
+            begin_time.setdefault(event["id"], event["ts"])
+        elif event["ph"] == "e" and event["id"] in begin_time:
+            tokens[event["id"]] = {"token": args.get("token"),
+                                    "seconds": (event["ts"] - begin_time[event["id"]]) / 1e6,
+                                    "success": args.get("success")}
+        elif event["ph"] == "X" and "host" in args:
+            host = hosts.setdefault(args["host"], {"host": args["host"], "durations": [], "failures": 0, "gateway": False})
+            host["durations"].append(event["dur"] / 1e6)
+            if event["name"] == "media_attempt":
+                if "token" in args:
+                    attempts[str(args["token"])] = attempts.get(str(args["token"]), 0) + 1
+                host["gateway"] = host["gateway"] or "/ipfs/" in args.get("url", "")
+            if args.get("status") not in (200, "200") or "error" in args:
+                host["failures"] += 1
+
+    token_list = sorted(tokens.values(), key = lambda item: -item["seconds"])[:top]
+    for item in token_list:
+        item["attempts"] = attempts.get(str(item["token"]), 0)
+
+    host_list = []
+    for host in hosts.values():
+        durations = host.pop("durations")
+        host.update(count = len(durations),
+                    mean = sum(durations) / len(durations),
+                    p95 = percentile(durations, 95))
+        host_list.append(host)
+
+    return {"tokens": token_list,
+            "hosts": sorted(host_list, key = lambda item: -item["p95"])[:top],
+            # 网关失败后会换下一个网关重试，失败次数就是它导致的重试次数
+            "gateways": sorted((host for host in host_list if host["gateway"] and host["failures"]),
+                                key = lambda item: -item["failures"])[:top]}
+
+
+def print_report(run_id = None, top = 10) -> dict:
+    """合并追踪文件并打印运行结束后的慢token、慢主机和网关重试报告"""
+    file_path = merge_traces(run_id)
+    report = build_report(load_events(run_id), top)
+    print(f"\nTrace written to {file_path}")
+    print("\nSlowest tokens:")
+    for item in report["tokens"]:
+        print(f"    {item['token']:>10}  {item['seconds']:8.2f}s  attempts={item['attempts']}  success={item['success']}")
+    print("\nSlowest hosts (by p95):")
+    for item in report["hosts"]:
+        print(f"    {item['host']:<40}  p95={item['p95']:6.2f}s  mean={item['mean']:6.2f}s  requests={item['count']}  failures={item['failures']}")
+    print("\nGateways causing the most retries:")
+    for item in report["gateways"]:
+        print(f"    {item['host']:<40}  retries={item['failures']}")
+    return report
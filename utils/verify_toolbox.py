@@ -0,0 +1,475 @@
+"""
+检查已经下载的项目
+
+只依赖标准库，命令行的 verify 子命令不需要导入下载器和网络相关的模块。
+
+完整性检查：
+    1. 根据文件头识别格式，保存成 .png 的 HTML 错误页、JSON 错误信息和空文件都会被找出来
+    2. 按格式检查文件结构，不依赖图像库：PNG 校验每个数据块的 CRC 并解压图像数据，JPEG 检查标记段和结束标记，
+       GIF、WEBP、MP4、GLB 检查结束标记或声明的长度，metadata 必须能解析成 json，下载中断留下的截断文件无法通过；
+       下载后的快速检查只在文件末尾附近查找结束标记，允许结束标记之后有少量追加的数据
+    3. 计算 sha256 记录在项目文件夹的 checksums.jsonl 中，大小和修改时间没有变化的文件下次直接跳过
+    4. 文件按批分给进程池检查，大文件和 tar 分片使用 mmap 读取，不复制到进程内存中
+"""
+
+import hashlib
+import json
+import mmap
+import multiprocessing as mp
+import os
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from source.CONST_ENV import CONST_ENV as ENV
+
+
+def get_expected_token_ids(collection_info: dict) -> list:
+    """
+    获取项目应该存在的全部tokenId，有探测出的tokenId布局时使用布局中的区间
+
+    Args:
+        collection_info (dict): 项目信息
+
+    Returns:
+        list: 升序排列的tokenId
+    """
+    if token_space := collection_info.get("token_space"):
+        if "ranges" not in token_space:
+            # 完整的布局保存在 discovery_toolbox.save_token_space 写入的文件中，这里不导入网络相关的模块
+            token_space_path = ENV.TOKEN_SPACE_PATH / f"{collection_info['chain_type'].lower()}_{collection_info['contract_address']}.json"
+            with open(token_space_path, 'r', encoding='UTF-8') as file:
+                token_space = json.load(file)
+        return [token_id for start, end in token_space["ranges"] for token_id in range(start, end + 1)]
+    start_index = collection_info["start_index"]
+    return list(range(start_index, start_index + collection_info["total_supply"]))
+
+
+# 媒体资源链接所在的 metadata 字段，与下载器解析媒体资源时一致
+MEDIA_FIELDS = ("image", "image_url", "animation_url")
+
+
+def has_media_field(metadata) -> bool:
+    """metadata 中是否有媒体资源链接，没有时这个token本来就没有媒体文件"""
+    return isinstance(metadata, dict) and any(isinstance(metadata.get(field), str) and metadata[field] for field in MEDIA_FIELDS)
+
+
+def iter_token_files(folder_path, prefix = ""):
+    """
+    列出文件夹中以tokenId命名的文件，包括 layout_toolbox 分层结构的子文件夹
+
+    Yields:
+        tuple: (相对路径, tokenId, os.DirEntry)
+    """
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks = False):
+                yield from iter_token_files(entry.path, f"{prefix}{entry.name}/")
+                continue
+            stem, suffix = os.path.splitext(entry.name)
+            # 下载中断留下的临时文件不算
+            if suffix == ".part" or not stem.isdigit():
+                continue
+            yield f"{prefix}{entry.name}", int(stem), entry
+
+
+def scan_collection(collection_path, token_ids) -> dict:
+    """
+    检查已经下载的项目中缺少哪些文件，每个文件夹只列出一次，不逐个检查文件是否存在，支持分层的目录结构，
+    写入 tar 分片的token按分片索引计算
+
+    Args:
+        collection_path (Path): 项目文件夹，包含 img 和 metadata 两个子文件夹，或者 shards 分片文件夹
+        token_ids (list): 应该存在的tokenId
+
+    Returns:
+        dict: {"missing_metadata": [...], "missing_media": [...], "no_media": [...], "empty_files": [...]}，都是tokenId列表。
+              metadata 中没有媒体资源链接的token记录在 no_media 中，不算缺少媒体文件
+    """
+    collection_path = Path(collection_path)
+    # tokenId -> 读取 metadata 的位置，文件为路径，分片为 (分片文件夹, 索引记录)
+    found = {"metadata": {}, "img": {}}
+    empty = set()
+    for folder in ("metadata", "img"):
+        folder_path = collection_path / folder
+        if folder_path.exists():
+            for _, token_id, entry in iter_token_files(folder_path):
+                found[folder][token_id] = entry.path
+                if entry.stat().st_size == 0:
+                    empty.add(token_id)
+
+    shard_path = collection_path / "shards"
+    if shard_path.exists():
+        import utils.webdataset_toolbox as wdt
+        for entry in wdt.load_index(shard_path).values():
+            folder = "metadata" if entry["member"].endswith(".json") else "img"
+            found[folder][entry["token_id"]] = (shard_path, entry)
+            if entry["size"] == 0:
+                empty.add(entry["token_id"])
+
+    # 只读取缺少媒体文件的token的 metadata
+    missing_media, no_media = [], []
+    for token_id in token_ids:
+        if token_id in found["img"]:
+            continue
+        location = found["metadata"].get(token_id)
+        # 无法解析的 metadata 由完整检查记录为损坏，媒体文件仍然算缺少
+        if location is not None and (metadata := load_metadata(location)) is not None and not has_media_field(metadata):
+            no_media.append(token_id)
+        else:
+            missing_media.append(token_id)
+    return {"missing_metadata": [token_id for token_id in token_ids if token_id not in found["metadata"]],
+            "missing_media": missing_media,
+            "no_media": no_media,
+            "empty_files": sorted(empty)}
+
+
+def load_metadata(location):
+    """
+    读取 scan_collection 找到的 metadata
+
+    Args:
+        location (str | tuple): 文件路径，或者 (分片文件夹, 索引记录)
+
+    Returns:
+        metadata，无法读取或解析时返回 None
+    """
+    try:
+        if isinstance(location, tuple):
+            import utils.webdataset_toolbox as wdt
+            return json.loads(wdt.read_member(*location))
+        with open(location, 'rb') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+# 超过这个大小的文件使用 mmap 读取
+MMAP_THRESHOLD = 1 << 20
+# 每个进程池任务检查的文件数量
+BATCH_SIZE = 256
+# 完整的 IEND 数据块：长度 0、类型和固定的 CRC
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+# 快速检查时在文件末尾的这个范围内查找结束标记，有的编码器和 CDN 会在结束标记之后追加数据
+TAIL_SEARCH_SIZE = 4096
+
+
+def sniff_format(head: bytes) -> str:
+    """
+    根据文件头识别文件格式
+
+    Args:
+        head (bytes): 文件的前 64 个字节
+
+    Returns:
+        str: png、jpeg、gif、webp、mp4、glb、svg、html、json，无法识别时返回 unknown
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head.startswith(b"glTF"):
+        return "glb"
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith((b"<!doctype html", b"<html", b"<head", b"<body")):
+        return "html"
+    if text.startswith((b"<svg", b"<?xml")):
+        return "svg"
+    if text.startswith((b"{", b"[")):
+        return "json"
+    return "unknown"
+
+
+def check_png(data) -> str:
+    """逐个校验数据块的 CRC，并解压全部图像数据，IEND 必须在文件末尾"""
+    position = 8
+    decompressor = zlib.decompressobj()
+    while position + 12 <= len(data):
+        length, = struct.unpack(">I", data[position:position + 4])
+        chunk_type = data[position + 4:position + 8]
+        end = position + 12 + length
+        if end > len(data):
+            return "truncated"
+        crc, = struct.unpack(">I", data[end - 4:end])
+        if zlib.crc32(data[position + 4:end - 4]) != crc:
+            return f"bad crc in {chunk_type.decode('latin-1')} chunk"
+        if chunk_type == b"IDAT":
+            try:
+                # 只检查数据流是否完整，解压出的像素数据直接丢弃
+                decompressor.decompress(data[position + 8:end - 4], 1 << 16)
+                while decompressor.unconsumed_tail:
+                    decompressor.decompress(decompressor.unconsumed_tail, 1 << 16)
+            except zlib.error as e:
+                return f"bad image data: {e}"
+        elif chunk_type == b"IEND":
+            if not decompressor.eof:
+                return "incomplete image data"
+            return None if end == len(data) else f"{len(data) - end} bytes after IEND"
+        position = end
+    return "truncated"
+
+
+def check_jpeg(data) -> str:
+    """检查标记段的长度，图像数据之后必须有结束标记"""
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return "bad marker"
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0xDA:
+            # 图像数据开始，之后是熵编码数据，只检查结尾
+            return None if data.rfind(b"\xff\xd9", max(0, len(data) - 1024)) >= 0 else "truncated"
+        if marker in (0x01, *range(0xD0, 0xD8)):
+            position += 2
+            continue
+        length, = struct.unpack(">H", data[position + 2:position + 4])
+        position += 2 + length
+    return "truncated"
+
+
+def check_mp4(data) -> str:
+    """顶层 box 的长度之和必须等于文件大小"""
+    position = 0
+    while position + 8 <= len(data):
+        size, = struct.unpack(">I", data[position:position + 4])
+        if size == 1:
+            if position + 16 > len(data):
+                return "truncated"
+            size, = struct.unpack(">Q", data[position + 8:position + 16])
+        elif size == 0:
+            return None
+        if size < 8:
+            return "bad box size"
+        position += size
+    return None if position == len(data) else "truncated"
+
+
+def check_content(data, suffix: str, deep = True) -> str:
+    """
+    检查文件内容
+
+    Args:
+        data (bytes | mmap): 文件内容
+        suffix (str): 文件扩展名，.json 按 metadata 检查，其他按媒体文件检查
+        deep (bool): 是否检查完整结构，为 False 时只检查文件头和结尾，用于下载后的快速检查
+
+    Returns:
+        str: 问题描述，没有问题时返回 None
+    """
+    if len(data) == 0:
+        return "empty file"
+    kind = sniff_format(bytes(data[:64]))
+    if suffix == ".json":
+        if kind == "html":
+            return "html page"
+        try:
+            json.loads(bytes(data) if isinstance(data, mmap.mmap) else data)
+        except (ValueError, UnicodeDecodeError) as e:
+            return f"invalid json: {e}"
+        return None
+
+    if kind in ("html", "json"):
+        return f"{kind} instead of media"
+    if kind == "png":
+        if not deep:
+            return None if data.rfind(PNG_IEND, max(0, len(data) - TAIL_SEARCH_SIZE)) >= 0 else "truncated"
+        return check_png(data)
+    if kind == "jpeg":
+        if not deep:
+            return None if data.rfind(b"\xff\xd9", max(0, len(data) - 1024)) >= 0 else "truncated"
+        return check_jpeg(data)
+    if kind == "gif":
+        return None if data[-1:] == b";" or data.rfind(b";", max(0, len(data) - 16)) >= 0 else "truncated"
+    if kind == "webp":
+        size, = struct.unpack("<I", data[4:8])
+        return None if size + 8 <= len(data) else "truncated"
+    if kind == "mp4":
+        return check_mp4(data)
+    if kind == "glb":
+        size, = struct.unpack("<I", data[8:12])
+        return None if size == len(data) else "truncated"
+    if kind == "svg":
+        return None if b"</svg>" in bytes(data[-256:]).lower() else "truncated"
+    # 无法识别的格式只要求非空
+    return None
+
+
+def check_file(file_path, deep = True, suffix = None) -> str:
+    """
+    检查单个文件，下载完成后的快速检查使用 deep = False
+
+    Args:
+        file_path (Path): 文件路径
+        deep (bool): 是否检查完整结构
+        suffix (str): 按这个扩展名检查，默认使用文件自己的扩展名，用于检查下载中的临时文件
+
+    Returns:
+        str: 问题描述，没有问题时返回 None
+    """
+    file_path = Path(file_path)
+    suffix = suffix if suffix is not None else file_path.suffix
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return "empty file"
+        if size < MMAP_THRESHOLD:
+            return check_content(file.read(), suffix, deep)
+        with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            return check_content(data, suffix, deep)
+
+
+def verify_batch(batch: tuple) -> list:
+    """
+    进程池任务：检查一批文件，或者一个 tar 分片中的一批成员
+
+    Args:
+        batch (tuple): ("files", 文件夹, [(文件名, 大小, 修改时间), ...]) 或 ("shard", 分片路径, [索引记录, ...])
+
+    Returns:
+        list: [(文件名或成员名, {"size", "mtime", "sha256", "error"}), ...]
+    """
+    kind, path, items = batch
+    results = []
+    if kind == "shard":
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as shard:
+            for entry in items:
+                end = entry["offset"] + entry["size"]
+                if end > len(shard):
+                    results.append((entry["member"], {"size": entry["size"], "sha256": None, "error": "truncated shard"}))
+                    continue
+                data = shard[entry["offset"]:end]
+                results.append((entry["member"], {"size": entry["size"],
+                                                    "sha256": hashlib.sha256(data).hexdigest(),
+                                                    "error": check_content(data, os.path.splitext(entry["member"])[1])}))
+        return results
+
+    for name, size, mtime in items:
+        entry = {"size": size, "mtime": mtime, "sha256": None, "error": None}
+        try:
+            with open(os.path.join(path, name), 'rb') as file:
+                if size == 0:
+                    entry["error"] = "empty file"
+                elif size < MMAP_THRESHOLD:
+                    data = file.read()
+                    entry["sha256"] = hashlib.sha256(data).hexdigest()
+                    entry["error"] = check_content(data, os.path.splitext(name)[1])
+                else:
+                    with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                        entry["sha256"] = hashlib.sha256(data).hexdigest()
+                        entry["error"] = check_content(data, os.path.splitext(name)[1])
+        except OSError as e:
+            entry["error"] = str(e)
+        results.append((name, entry))
+    return results
+
+
+def load_checksums(collection_path) -> dict:
+    """读取上一次检查的结果，key 为 img/文件名、metadata/文件名 或 shards/成员名"""
+    checksums = {}
+    checksum_path = Path(collection_path) / "checksums.jsonl"
+    if checksum_path.exists():
+        with open(checksum_path, 'r', encoding='UTF-8') as file:
+            for line in file:
+                try:
+                    checksums.update(json.loads(line))
+                except json.JSONDecodeError:
+                    # 进程中断时最后一行可能不完整
+                    continue
+    return checksums
+
+
+def verify_collection(collection_path, token_ids = None, process_num = None, full = False) -> dict:
+    """
+    用进程池检查项目中的所有文件，结果追加到 checksums.jsonl
+
+    Args:
+        collection_path (Path): 项目文件夹
+        token_ids (list): 应该存在的tokenId，为 None 时不检查缺少的文件
+        process_num (int): 进程数，默认为CPU核数
+        full (bool): 为 True 时重新检查所有文件，否则跳过大小和修改时间没有变化的文件
+
+    Returns:
+        dict: scan_collection 的结果，加上 "corrupt_metadata"、"corrupt_media"（tokenId列表）和 "errors"（{文件: 问题}）
+    """
+    collection_path = Path(collection_path)
+    result = scan_collection(collection_path, token_ids or [])
+    if token_ids is None:
+        result["missing_metadata"], result["missing_media"] = [], []
+    checksums = {} if full else load_checksums(collection_path)
+
+    batches = []
+    for folder in ("metadata", "img"):
+        folder_path = collection_path / folder
+        if not folder_path.exists():
+            continue
+        items = []
+        for name, _, entry in iter_token_files(folder_path):
+            stat = entry.stat()
+            old = checksums.get(f"{folder}/{name}")
+            if old and old["size"] == stat.st_size and old.get("mtime") == stat.st_mtime and old["error"] is None:
+                continue
+            items.append((name, stat.st_size, stat.st_mtime))
+        batches += [("files", str(folder_path), items[i:i + BATCH_SIZE]) for i in range(0, len(items), BATCH_SIZE)]
+
+    shard_path = collection_path / "shards"
+    if shard_path.exists():
+        import utils.webdataset_toolbox as wdt
+        shards = {}
+        for member, entry in wdt.load_index(shard_path).items():
+            old = checksums.get(f"shards/{member}")
+            if old and old.get("shard") == entry["shard"] and old["error"] is None:
+                continue
+            shards.setdefault(entry["shard"], []).append(entry)
+        for shard, entries in shards.items():
+            batches += [("shard", str(shard_path / shard), entries[i:i + BATCH_SIZE]) for i in range(0, len(entries), BATCH_SIZE)]
+
+    checked = {}
+    if batches:
+        with mp.Pool(process_num or os.cpu_count()) as pool:
+            for batch, results in zip(batches, pool.imap(verify_batch, batches)):
+                kind, path, _ = batch
+                for name, entry in results:
+                    if kind == "shard":
+                        entry["shard"] = os.path.basename(path)
+                        checked[f"shards/{name}"] = entry
+                    else:
+                        checked[f"{os.path.basename(path)}/{name}"] = entry
+        with open(collection_path / "checksums.jsonl", 'a', encoding='UTF-8') as file:
+            file.write(json.dumps(checked) + "\n")
+
+    # 有问题的文件每次都会重新检查，因此只需要统计本次检查的结果
+    corrupt = {"metadata": set(), "img": set()}
+    errors = {}
+    for key, entry in checked.items():
+        if entry["error"] is None:
+            continue
+        folder, name = key.split("/", 1)
+        stem, suffix = os.path.splitext(os.path.basename(name))
+        if folder == "shards":
+            folder = "metadata" if suffix == ".json" else "img"
+        corrupt[folder].add(int(stem))
+        errors[key] = entry["error"]
+    result["corrupt_metadata"] = sorted(corrupt["metadata"])
+    result["corrupt_media"] = sorted(corrupt["img"])
+    result["errors"] = errors
+    return result
+
+
+def get_bad_token_ids(result: dict) -> list:
+    """检查结果中需要重新下载的tokenId，没有媒体资源的token（no_media）不需要重新下载"""
+    bad = set()
+    for key in ("missing_metadata", "missing_media", "empty_files", "corrupt_metadata", "corrupt_media"):
+        bad.update(result.get(key, []))
+    return sorted(bad)
@@ -0,0 +1,226 @@
+"""
+WebDataset 格式的 tar 分片输出
+
+代替 img 和 metadata 文件夹中逐个保存的小文件，每个token的media和metadata下载完成后直接追加到滚动的 tar 分片中，
+训练时可以顺序读取整个分片，不再需要列出和随机读取数百万个小文件：
+    {save_path}/{chain_type}/{NFT_name}/shards/
+        {NFT_name}-{运行编号}-{进程号}-{编号}.tar            分片，成员名为 {tokenId}.json 和 {tokenId}{媒体格式}
+        {NFT_name}-{运行编号}-{进程号}-{编号}.index.jsonl    分片索引，每行一个成员：tokenId、成员名、数据偏移量和大小
+
+每个进程写自己的分片，超过 shard_size 字节后换一个新的分片。mp.Pool 的子进程会被直接结束，
+因此每页结束后调用 flush()：写出索引，并在当前位置写入 tar 的结束标记，之后追加成员时再覆盖掉，
+这样即使进程没有正常退出，分片也是完整可读的 tar 文件。
+"""
+
+import atexit
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.file_io as fio
+import utils.metrics_toolbox as mtb
+
+
+# 默认的分片大小（字节）
+DEFAULT_SHARD_SIZE = 1 << 30
+
+
+class Tar_Shard_Writer(object):
+    """
+    单个进程的分片写入器，同一个进程的所有下载线程共用，成员按写入顺序排列
+    """
+
+    def __init__(self, shard_path: Path, prefix: str, shard_size: int):
+        """
+        Args:
+            shard_path (Path): 分片文件夹
+            prefix (str): 分片文件名前缀
+            shard_size (int): 单个分片的大小上限（字节），单个成员超过上限时独占一个分片
+        """
+        self.shard_path = Path(shard_path)
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.name = None
+        self.file = None
+        self.tar = None
+        self.member_count = 0
+        # 已经写入分片但还没有写入索引的成员
+        self.pending_index = []
+        # 本页写入的 metadata，RPC 下载器需要从中解析媒体资源链接，flush 后清空
+        self.pending_json = {}
+
+    def open_shard(self) -> None:
+        self.name = f"{self.prefix}-{mtb.get_run_id()}-{os.getpid()}-{self.sequence:06d}"
+        self.sequence += 1
+        self.file = open(self.shard_path / f"{self.name}.tar", 'wb')
+        self.tar = tarfile.open(fileobj = self.file, mode = 'w', format = tarfile.USTAR_FORMAT)
+        self.member_count = 0
+
+    def write_index(self) -> None:
+        if not self.pending_index:
+            return
+        with open(self.shard_path / f"{self.name}.index.jsonl", 'a', encoding='UTF-8') as file:
+            for entry in self.pending_index:
+                file.write(json.dumps(entry) + "\n")
+        self.pending_index = []
+
+    def close_shard(self) -> None:
+        if self.tar is None:
+            return
+        self.write_index()
+        self.tar.close()
+        self.file.close()
+        self.tar = None
+        self.file = None
+
+    def add(self, token_id: int, suffix: str, fileobj, size: int) -> None:
+        """
+        追加一个成员，当前分片写满时先换一个新的分片
+
+        Args:
+            token_id (int): tokenId
+            suffix (str): 成员扩展名，如 ".json"、".png"
+            fileobj: 可读的文件对象
+            size (int): 成员大小（字节）
+        """
+        info = tarfile.TarInfo(f"{token_id}{suffix}")
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        with self.lock:
+            if self.tar is not None and self.member_count and self.tar.offset + size > self.shard_size:
+                self.close_shard()
+            if self.tar is None:
+                self.open_shard()
+            self.tar.addfile(info, fileobj)
+            self.member_count += 1
+            # 数据紧跟在头部之后，按块补齐到 BLOCKSIZE 的整数倍
+            offset = self.tar.offset - (size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+            self.pending_index.append({"token_id": token_id, "member": info.name, "offset": offset, "size": size})
+
+    def flush(self) -> None:
+        """写出索引和 tar 结束标记，结束标记之后的成员会覆盖它"""
+        with self.lock:
+            self.pending_json = {}
+            if self.tar is None:
+                return
+            position = self.file.tell()
+            self.file.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+            self.file.flush()
+            self.file.seek(position)
+            self.write_index()
+
+    def close(self) -> None:
+        with self.lock:
+            self.pending_json = {}
+            self.close_shard()
+
+
+_WRITERS = {}
+_WRITERS_PID = None
+_WRITERS_LOCK = threading.Lock()
+
+
+class Tar_Sink(object):
+    """
+    下载器使用的分片输出，对象本身只保存配置，可以随下载器传给子进程，每个进程第一次写入时创建自己的写入器
+    """
+
+    def __init__(self, shard_path, prefix: str, shard_size = DEFAULT_SHARD_SIZE):
+        """
+        Args:
+            shard_path (Path): 分片文件夹
+            prefix (str): 分片文件名前缀，一般为项目名称
+            shard_size (int): 单个分片的大小上限（字节）
+        """
+        self.shard_path = Path(shard_path)
+        self.prefix = prefix
+        self.shard_size = shard_size
+        fio.check_dir(self.shard_path)
+
+    def get_writer(self, create = True):
+        """获取当前进程的写入器，fork 出的子进程不使用父进程打开的分片"""
+        global _WRITERS, _WRITERS_PID
+        with _WRITERS_LOCK:
+            if _WRITERS_PID != os.getpid():
+                _WRITERS = {}
+                _WRITERS_PID = os.getpid()
+            key = str(self.shard_path)
+            if key not in _WRITERS and create:
+                _WRITERS[key] = Tar_Shard_Writer(self.shard_path, self.prefix, self.shard_size)
+            return _WRITERS.get(key)
+
+    def add_json(self, token_id: int, metadata) -> None:
+        """写入一个token的metadata"""
+        data = json.dumps(metadata, ensure_ascii=False, separators=(',', ':')).encode('UTF-8')
+        writer = self.get_writer()
+        writer.add(token_id, ".json", io.BytesIO(data), len(data))
+        writer.pending_json[token_id] = metadata
+
+    def add_file(self, token_id: int, suffix: str, file_path) -> None:
+        """把已经下载完成的文件移动到分片中"""
+        file_path = Path(file_path)
+        with open(file_path, 'rb') as file:
+            self.get_writer().add(token_id, suffix, file, os.fstat(file.fileno()).st_size)
+        file_path.unlink()
+
+    def load_json(self, token_id: int):
+        """读取本页写入的metadata，没有时返回 None"""
+        writer = self.get_writer(create = False)
+        return writer.pending_json.get(token_id) if writer is not None else None
+
+    def flush(self) -> None:
+        if writer := self.get_writer(create = False):
+            writer.flush()
+
+    def close(self) -> None:
+        if writer := self.get_writer(create = False):
+            writer.close()
+
+
+@atexit.register
+def _close_writers() -> None:
+    if _WRITERS_PID == os.getpid():
+        for writer in list(_WRITERS.values()):
+            writer.close()
+
+
+def load_index(shard_path) -> dict:
+    """
+    合并分片文件夹中所有分片的索引，同一个成员出现多次时使用最新的分片
+
+    Args:
+        shard_path (Path): 分片文件夹
+
+    Returns:
+        dict: {成员名: {"shard": 分片文件名, "token_id": ..., "offset": ..., "size": ...}}
+    """
+    index = {}
+    shard_path = Path(shard_path)
+    if not shard_path.exists():
+        return index
+    # 文件名中的运行编号以时间开头，按文件名排序即按写入时间排序
+    for index_path in sorted(shard_path.glob("*.index.jsonl")):
+        shard = index_path.name[:-len(".index.jsonl")] + ".tar"
+        with open(index_path, 'r', encoding='UTF-8') as file:
+            for line in file:
+                entry = json.loads(line)
+                entry["shard"] = shard
+                index[entry["member"]] = entry
+    return index
+
+
+def read_member(shard_path, entry: dict) -> bytes:
+    """按索引中的偏移量直接读取一个成员，不需要从头遍历分片"""
+    with open(Path(shard_path) / entry["shard"], 'rb') as file:
+        file.seek(entry["offset"])
+        return file.read(entry["size"])